@@ -43,10 +43,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # First after security so session/auth queries count toward each view
+    'polls.metrics.RequestMetricsMiddleware',
+    # Before the session so anonymous hits skip it; outside CSRF and messages
+    # so it sees the cookies they set
+    'polls.pagecache.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'polls.voted.VotedPollsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +61,8 @@ ROOT_URLCONF = 'polling_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for polls.metrics
+        'BACKEND': 'polls.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,14 +81,120 @@ WSGI_APPLICATION = 'polling_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+# SQLite by default; set DB_ENGINE=postgresql (plus DB_NAME, DB_USER,
+# DB_PASSWORD, DB_HOST, DB_PORT) for production.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'polling_system'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            # Persistent connections, checked before reuse after a request
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL_MAX_SIZE'):
+        # psycopg 3 connection pool (pip install "psycopg[pool]"); replaces
+        # persistent connections, so CONN_MAX_AGE must be 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ['DB_POOL_MAX_SIZE']),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        }
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Seconds a writer waits for the lock before "database is locked"
+                'timeout': int(os.environ.get('DB_SQLITE_TIMEOUT', '20')),
+                # Take the write lock when a transaction starts, so it waits on
+                # the busy timeout instead of failing when a read lock can't be
+                # upgraded mid-transaction
+                'transaction_mode': 'IMMEDIATE',
+                # Run on every new connection. WAL lets readers proceed while a
+                # vote is written; NORMAL syncs at checkpoints rather than on
+                # every commit, which is still durable against application crashes
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={int(os.environ.get('DB_SQLITE_MMAP_SIZE', str(128 * 1024 * 1024)))};"
+                ),
+            },
+        }
+    }
+    if os.environ.get('DB_SQLITE_TUNING', '1') == '0':
+        # Stock SQLite settings, for comparison with stress_votes
+        DATABASES['default']['OPTIONS'] = {}
+
+# Optional read replica (polls.replicas). DB_REPLICA_NAME / DB_REPLICA_HOST
+# override the primary's settings; with SQLite, DB_REPLICA_NAME is a second
+# database file. Views opt in with @read_from_replica; writes always go to
+# the primary.
+if os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    for key in ('NAME', 'HOST', 'PORT', 'USER', 'PASSWORD'):
+        if os.environ.get(f'DB_REPLICA_{key}'):
+            DATABASES['replica'][key] = os.environ[f'DB_REPLICA_{key}']
+
+DATABASE_ROUTERS = ['polls.replicas.ReplicaRouter']
+POLLS_REPLICA_DATABASE = 'replica'
+# Seconds a browser reads from the primary after a vote or other write
+POLLS_REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Local memory per process by default. Set CACHE_BACKEND/CACHE_LOCATION (e.g.
+# django.core.cache.backends.redis.RedisCache) to share entries between workers.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'polling-system'),
     }
 }
 
 
+# Sessions
+# https://docs.djangoproject.com/en/6.0/topics/http/sessions/
+# SESSION_MODE 'cached_db' (default) reads sessions through the cache above
+# and writes them through to the database; 'db' reads the session table on
+# every request; 'signed_cookies' keeps the session in a signed cookie and
+# needs no store, but logging out can't revoke copies of the cookie.
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[os.environ.get('SESSION_MODE', 'cached_db')]
+
+# Authentication
+# request.user is read through a cache of user objects (polls.users), which
+# saving a user invalidates. New logins record CachedModelBackend in their
+# session; ModelBackend stays listed so sessions from before it keep
+# working, uncached, until they log in again.
+AUTHENTICATION_BACKENDS = [
+    'polls.users.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# Seconds a cached user may live; 0 reads auth_user on every request.
+POLLS_USER_CACHE_TTL = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -122,3 +235,138 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+
+# Vote counters
+# With N > 0 shards, votes increment one of N rows per option (and per rollup
+# bucket) instead of the option row itself; run `manage.py fold_vote_shards` periodically so
+# Poll.total_votes on listing pages catches up.
+POLLS_VOTE_COUNTER_SHARDS = int(os.environ.get('POLLS_VOTE_COUNTER_SHARDS', '0'))
+POLLS_COUNTER_CACHE_TTL = 2
+
+# Vote ingestion
+# 'sync' writes each vote in its own transaction. 'queued' only records the
+# vote in a queue table; run `manage.py flush_votes --loop` to apply them.
+# Votes get 503 while about POLLS_VOTE_QUEUE_MAX are waiting; the depth is
+# recounted at most every POLLS_VOTE_QUEUE_DEPTH_TTL seconds.
+POLLS_VOTE_INGESTION = os.environ.get('POLLS_VOTE_INGESTION', 'sync')
+POLLS_VOTE_QUEUE_MAX = 10000
+POLLS_VOTE_QUEUE_DEPTH_TTL = 5
+POLLS_VOTE_FLUSH_BATCH = 500
+
+# Results cache
+# Seconds a poll_results entry may live; votes invalidate it immediately.
+POLLS_RESULTS_CACHE_TTL = 300
+
+# Poll metadata cache (polls.metadata)
+# Questions, descriptions, flags and option texts, read through a per-process
+# LRU of at most POLLS_METADATA_CACHE_SIZE polls in front of the cache backend
+# above. Invalidation goes through per-poll versions in that backend, so with
+# several workers it must be a shared backend. Set POLLS_METADATA_SHARED =
+# False to keep the entries themselves out of the shared tier.
+POLLS_METADATA_CACHE_SIZE = 1000
+# Seconds a per-process copy lives, bounding how long it outlives a version
+# bump this process can't see (e.g. with the per-process default backend)
+POLLS_METADATA_LOCAL_TTL = 5
+POLLS_METADATA_SHARED = True
+POLLS_METADATA_CACHE_TTL = 3600
+
+# Voted-polls index
+# Seconds a user's cached {poll: option} index may live. Votes retire it;
+# the TTL bounds how long listing badges miss votes deleted, or retired only
+# in another process's cache. Poll and results pages check the Vote rows.
+POLLS_VOTED_INDEX_TTL = 3600
+
+# Duplicate-vote pre-check (polls.bloom)
+# Per-process Bloom filters of voter ids for the most recently voted-on
+# POLLS_VOTER_FILTER_POLLS polls, about 1.4 bytes per slot (twice the voters
+# at build time) for a 1% false positive rate. A false positive costs one
+# extra read, never a wrong answer.
+POLLS_VOTER_FILTER_POLLS = 1000
+POLLS_VOTER_FILTER_ERROR_RATE = 0.01
+
+# Anonymous page cache (polls.pagecache)
+# poll_list and poll_results pages rendered for visitors without a session are
+# kept for POLLS_PAGE_CACHE_TTL seconds; poll and option changes retire them
+# sooner, and votes retire the poll's results page. A front proxy may reuse
+# them for POLLS_PAGE_CACHE_PROXY_MAX_AGE seconds, which nothing here can
+# invalidate. Turned on with POLLS_PAGE_CACHE_ENABLED=1.
+POLLS_PAGE_CACHE_ENABLED = os.environ.get('POLLS_PAGE_CACHE_ENABLED', '0') == '1'
+POLLS_PAGE_CACHE_TTL = 30
+POLLS_PAGE_CACHE_PROXY_MAX_AGE = 10
+
+# Throttling (polls.throttling)
+# Token buckets per endpoint, keyed by client address, poll and user. 'N/m'
+# allows bursts of N, refilled evenly over a minute (also s, h, d); POSTs
+# over a limit get 429 before the view runs. Buckets are per process unless
+# POLLS_THROTTLE_STORE is 'polls.throttling.CacheStore' with a shared cache
+# backend. Behind trusted proxies, set POLLS_THROTTLE_IP_HEADER (e.g.
+# 'HTTP_X_FORWARDED_FOR') so clients aren't all limited as the proxy, and
+# POLLS_THROTTLE_TRUSTED_PROXIES to how many of them append to that header;
+# the client's address is taken that many entries from the right.
+# Turned on with POLLS_THROTTLE_ENABLED=1.
+POLLS_THROTTLE_ENABLED = os.environ.get('POLLS_THROTTLE_ENABLED', '0') == '1'
+POLLS_THROTTLE_STORE = os.environ.get('POLLS_THROTTLE_STORE', 'polls.throttling.LocalStore')
+POLLS_THROTTLE_RATES = {
+    'vote': {'ip': '120/m', 'poll': '100/s', 'user': '10/m'},
+    'register': {'ip': '5/h'},
+    'create_poll': {'ip': '30/h', 'user': '10/h'},
+}
+POLLS_THROTTLE_IP_HEADER = None
+POLLS_THROTTLE_TRUSTED_PROXIES = 1
+
+# Admin changelists (polls.admin)
+# Unfiltered Poll and Vote changelists show an estimated total (planner
+# statistics on PostgreSQL, the highest id elsewhere) instead of running
+# COUNT(*) once a table reaches this many rows.
+POLLS_ADMIN_ESTIMATE_THRESHOLD = 100000
+
+# Vote rollups (polls.rollups)
+# Minute buckets older than this are removed by `backfill_vote_rollups --prune`;
+# hour and day buckets are kept.
+POLLS_ROLLUP_MINUTE_RETENTION_DAYS = 7
+
+# Async views (polls.async_views)
+# Serve poll_list, poll_detail, vote and poll_results from native async views.
+# Turn on only when running asgi.py under an ASGI server, e.g.
+# `uvicorn polling_system.asgi:application --workers 4`.
+POLLS_ASYNC_VIEWS = os.environ.get('POLLS_ASYNC_VIEWS', '0') == '1'
+
+# Results streaming (Server-Sent Events, served through asgi.py)
+# Results pages subscribe only with POLLS_STREAM_RESULTS on; turn it on only
+# under an ASGI server. Updates for a poll are coalesced into at most one
+# frame per interval. Under WSGI the stream URL sends the current results
+# once and asks the browser to reconnect after POLLS_STREAM_RETRY seconds.
+POLLS_STREAM_RESULTS = os.environ.get('POLLS_STREAM_RESULTS', '0') == '1'
+POLLS_STREAM_INTERVAL = 1.0
+POLLS_STREAM_KEEPALIVE = 15
+POLLS_STREAM_RETRY = 5
+
+# Listings (poll_list, my_polls, vote_history) use keyset pagination
+POLLS_PAGE_SIZE = 20
+
+# Request metrics (polls.metrics), served at /metrics/ to staff users and the
+# addresses below. Budgets are the maximum SQL queries per request by URL
+# name with every cache cold: session and user lookups, a voted-polls index
+# and, for vote, the poll's voter filter (savepoints count too). Overruns are
+# logged, or raised when POLLS_QUERY_BUDGET_STRICT is on (tests).
+POLLS_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+POLLS_QUERY_BUDGET_STRICT = False
+POLLS_QUERY_BUDGETS = {
+    'poll_list': 4,
+    'poll_list_more': 4,
+    'poll_search': 6,
+    'poll_search_more': 5,
+    'poll_detail': 4,
+    'vote': 12,
+    'poll_results': 5,
+    'poll_results_json': 3,
+    'poll_timeline': 5,
+    'poll_timeline_json': 5,
+    'my_polls': 5,
+    'my_polls_more': 3,
+    'export_poll': 3,
+    'vote_history': 3,
+    'vote_history_more': 3,
+    'user_profile': 4,
+}
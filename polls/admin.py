@@ -1,8 +1,74 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.db.models import Count
+from django.utils.functional import cached_property
 
+from . import counters, metadata, pagecache, results_cache
 from .models import Option, Poll, Vote
 
 
+def estimate_rows(model):
+    """Cheap row count estimate for ``model``'s table, or None if unavailable."""
+    connection = connections[router.db_for_read(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Planner statistics; -1 until the table is first analyzed
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        else:
+            # Highest id, read from the primary key index; deleted rows make it an upper bound
+            cursor.execute(f'SELECT MAX({connection.ops.quote_name(model._meta.pk.column)}) FROM {table}')
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that counts unfiltered changelists from an estimate once a table
+    holds POLLS_ADMIN_ESTIMATE_THRESHOLD rows, instead of a COUNT(*) over it.
+    Filtered and searched lists are still counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimate_rows(self.object_list.model)
+            if estimate is not None and estimate >= getattr(settings, 'POLLS_ADMIN_ESTIMATE_THRESHOLD', 100000):
+                return estimate
+        return super().count
+
+
+class PollAutocompleteFilter(admin.SimpleListFilter):
+    """
+    Filter by poll through the admin's autocomplete search, rather than a link
+    for every poll. Only the selected poll is loaded.
+    """
+    title = 'poll'
+    parameter_name = 'poll'
+    template = 'admin/polls/poll_autocomplete_filter.html'
+    # The autocomplete field the search goes through (VoteAdmin.autocomplete_fields)
+    app_label, model_name, field_name = 'polls', 'vote', 'poll'
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if not (value and value.isdigit()):
+            return []
+        return list(Poll.objects.filter(pk=value).values_list('pk', 'question'))
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(poll_id=value)
+        return queryset
+
+
 class OptionInline(admin.TabularInline):
     model = Option
     extra = 3
@@ -11,13 +77,65 @@ class OptionInline(admin.TabularInline):
 
 @admin.register(Poll)
 class PollAdmin(admin.ModelAdmin):
-    list_display = ('question', 'created_by', 'created_at', 'is_active', 'total_votes')
+    list_display = ('question', 'created_by', 'created_at', 'is_active', 'option_count', 'total_votes')
     list_filter = ('is_active',)
+    list_select_related = ('created_by',)
+    search_fields = ('question',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['activate_polls', 'deactivate_polls', 'recount_votes']
     inlines = [OptionInline]
 
+    def get_queryset(self, request):
+        # total_votes is stored; the option count comes from one grouped join
+        return super().get_queryset(request).annotate(option_count=Count('options'))
+
+    @admin.display(description='Options', ordering='option_count')
+    def option_count(self, poll):
+        return poll.option_count
+
+    def _set_active(self, request, queryset, is_active):
+        # One UPDATE; update() sends no signals, so caches are retired here
+        poll_ids = list(queryset.values_list('pk', flat=True))
+        updated = queryset.update(is_active=is_active)
+        for poll_id in poll_ids:
+            metadata.invalidate(poll_id)
+            results_cache.bump(poll_id)
+            pagecache.invalidate(poll_id)
+        self.message_user(request, f'{"Activated" if is_active else "Deactivated"} {updated} poll(s).', messages.SUCCESS)
+
+    @admin.action(description='Activate selected polls')
+    def activate_polls(self, request, queryset):
+        self._set_active(request, queryset, True)
+
+    @admin.action(description='Deactivate selected polls')
+    def deactivate_polls(self, request, queryset):
+        self._set_active(request, queryset, False)
+
+    @admin.action(description='Recount votes of selected polls')
+    def recount_votes(self, request, queryset):
+        option_drift, poll_drift = counters.reconcile(list(queryset.values_list('pk', flat=True)))
+        self.message_user(
+            request, f'Repaired drift on {option_drift} option(s) and {poll_drift} poll(s).', messages.SUCCESS,
+        )
+
 
 @admin.register(Vote)
 class VoteAdmin(admin.ModelAdmin):
     list_display = ('user', 'poll', 'option', 'voted_at')
-    list_filter = ('poll',)
-    raw_id_fields = ('user', 'poll', 'option')
+    list_filter = (PollAutocompleteFilter,)
+    list_select_related = ('user', 'poll', 'option')
+    raw_id_fields = ('user', 'option')
+    autocomplete_fields = ('poll',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    class Media:
+        css = {'all': ('admin/css/vendor/select2/select2.css', 'admin/css/autocomplete.css')}
+        js = (
+            'admin/js/vendor/jquery/jquery.js',
+            'admin/js/vendor/select2/select2.full.js',
+            'admin/js/jquery.init.js',
+            'admin/js/autocomplete.js',
+            'polls/js/admin_poll_filter.js',
+        )
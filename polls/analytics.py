@@ -0,0 +1,166 @@
+"""
+Creator dashboard analytics computed in batch.
+
+``creator_summary(user)`` reads every option count of every poll the user
+owns in one query, lays them out as columns (poll ids, categories, counts)
+and computes totals, category breakdowns, leader margins and participation
+over the whole set at once. A second query reads daily vote rollups for the
+trend. NumPy is used when installed; the pure-Python path gives the same
+numbers.
+"""
+from datetime import timedelta
+from statistics import median
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Poll, VoteRollup
+from .rollups import truncate
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+TREND_DAYS = 14
+CLOSEST_RACES = 5
+
+
+class Columns:
+    """
+    One creator's polls in columnar form. Poll-level lists are indexed by poll
+    position; ``counts`` holds every option's vote count, with each poll's
+    options contiguous from ``starts[i]`` for ``lengths[i]`` entries.
+    ``totals`` is the stored Poll.total_votes, as shown on listing pages.
+    """
+
+    def __init__(self, rows):
+        self.poll_ids, self.questions, self.categories, self.active, self.totals = [], [], [], [], []
+        self.starts, self.lengths, self.counts = [], [], []
+        for poll_id, question, category, is_active, total, count in rows:
+            if not self.poll_ids or self.poll_ids[-1] != poll_id:
+                self.poll_ids.append(poll_id)
+                self.questions.append(question)
+                self.categories.append(category)
+                self.active.append(is_active)
+                self.totals.append(total)
+                self.starts.append(len(self.counts))
+                self.lengths.append(0)
+            if count is not None:  # polls without options still get a row
+                self.counts.append(count)
+                self.lengths[-1] += 1
+
+    @classmethod
+    def load(cls, user):
+        rows = (
+            Poll.objects.filter(created_by=user)
+            .order_by('pk', 'options__pk')
+            .values_list('pk', 'question', 'category', 'is_active', 'total_votes', 'options__vote_count')
+        )
+        return cls(rows)
+
+
+def _leaders(columns):
+    """Per-poll ``(option vote sum, top option, runner-up option)`` counts."""
+    if np is not None and columns.counts:
+        counts = np.asarray(columns.counts, dtype=np.int64)
+        lengths = np.asarray(columns.lengths, dtype=np.int64)
+        segment = np.repeat(np.arange(len(lengths)), lengths)
+        # Sort by poll, then count, so each poll's two largest counts end its run
+        ordered = counts[np.lexsort((counts, segment))]
+        ends = np.asarray(columns.starts, dtype=np.int64) + lengths - 1
+        has = lengths > 0
+        totals = np.bincount(segment, weights=counts, minlength=len(lengths)).astype(np.int64)
+        top = np.where(has, ordered[np.clip(ends, 0, None)], 0)
+        runner_up = np.where(lengths > 1, ordered[np.clip(ends - 1, 0, None)], 0)
+        return totals.tolist(), top.tolist(), runner_up.tolist()
+
+    totals, top, runner_up = [], [], []
+    for start, length in zip(columns.starts, columns.lengths):
+        counts = sorted(columns.counts[start:start + length], reverse=True) + [0, 0]
+        totals.append(sum(counts))
+        top.append(counts[0])
+        runner_up.append(counts[1])
+    return totals, top, runner_up
+
+
+def _slope(values):
+    """Least-squares change per step of a series."""
+    n = len(values)
+    if n < 2:
+        return 0.0
+    if np is not None:
+        return float(np.polyfit(np.arange(n), np.asarray(values, dtype=float), 1)[0])
+    mean_x, mean_y = (n - 1) / 2, sum(values) / n
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+    denominator = sum((x - mean_x) ** 2 for x in range(n))
+    return numerator / denominator
+
+
+def trend(user, days=TREND_DAYS, now=None):
+    """Daily vote totals across the user's polls for the last ``days`` days, from rollups."""
+    today = truncate(now or timezone.now(), 'day')
+    first = today - timedelta(days=days - 1)
+    per_day = dict(
+        VoteRollup.objects.filter(poll__created_by=user, granularity='day', bucket__gte=first)
+        .values('bucket')
+        .annotate(n=Sum('count'))
+        .values_list('bucket', 'n')
+    )
+    series = [(first + timedelta(days=i), per_day.get(first + timedelta(days=i), 0)) for i in range(days)]
+    values = [n for _, n in series]
+    half = days // 2
+    recent, previous = sum(values[-half:]), sum(values[-2 * half:-half])
+    peak = max(values) or 1
+    return {
+        'days': [{'date': day, 'votes': n, 'height': round(n / peak * 100)} for day, n in series],
+        'recent': recent,
+        'previous': previous,
+        'change_pct': round((recent - previous) / previous * 100, 1) if previous else None,
+        'slope_per_day': round(_slope(values), 2),
+    }
+
+
+def creator_summary(user, now=None):
+    """Dashboard figures for every poll ``user`` created, in two queries."""
+    columns = Columns.load(user)
+    sums, top, runner_up = _leaders(columns)
+    totals = columns.totals
+    labels = dict(Poll.CATEGORY_CHOICES)
+    total_votes = sum(totals)
+
+    categories = {}
+    for category, votes in zip(columns.categories, totals):
+        entry = categories.setdefault(category, {'code': category, 'label': labels.get(category, category), 'polls': 0, 'votes': 0})
+        entry['polls'] += 1
+        entry['votes'] += votes
+    for entry in categories.values():
+        entry['share'] = round(entry['votes'] / total_votes * 100, 1) if total_votes else 0
+
+    # Leader margin: percentage points between the leading and runner-up
+    # options, as shares of the option counts so they match poll_results
+    races = [
+        {
+            'poll_id': poll_id,
+            'question': question,
+            'votes': votes,
+            'margin': round((first - second) / votes * 100, 1),
+        }
+        for poll_id, question, votes, first, second in zip(columns.poll_ids, columns.questions, sums, top, runner_up)
+        if votes
+    ]
+    polls_with_votes = sum(1 for votes in totals if votes)
+    return {
+        'total_polls': len(columns.poll_ids),
+        'active_polls': sum(columns.active),
+        'total_options': len(columns.counts),
+        'total_votes': total_votes,
+        'polls_with_votes': polls_with_votes,
+        'participation_rate': round(polls_with_votes / len(columns.poll_ids) * 100, 1) if columns.poll_ids else 0,
+        'mean_votes_per_poll': round(total_votes / len(columns.poll_ids), 1) if columns.poll_ids else 0,
+        'median_votes_per_poll': median(totals) if totals else 0,
+        'mean_leader_margin': round(sum(r['margin'] for r in races) / len(races), 1) if races else None,
+        'closest_races': sorted((r for r in races if r['votes'] > 1), key=lambda r: (r['margin'], -r['votes']))[:CLOSEST_RACES],
+        'categories': sorted(categories.values(), key=lambda entry: -entry['votes']),
+        'trend': trend(user, now=now),
+    }
@@ -0,0 +1,185 @@
+"""
+Native async versions of poll_list, poll_detail, vote and poll_results.
+
+polls.urls routes to these instead of polls.views when POLLS_ASYNC_VIEWS is
+on, for deployments served through asgi.py; under WSGI every async view
+would get an event loop of its own, so leave it off there. Reads go through
+the async ORM and async cache calls, so a request waiting on the database or
+cache holds no thread.
+
+Django's async ORM has no transactions, so the vote write itself (Vote row,
+counters, rollup) still runs as one transaction.atomic() block in a single
+sync_to_async() call. The unique constraint on (user, poll) therefore
+rejects a second vote exactly as it does in the sync view.
+
+Templates render synchronously and must not query, so each view first
+resolves what they would otherwise load lazily: the user (and with it the
+session) and the voted-polls index.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError
+from django.http import Http404, HttpResponseForbidden
+from django.shortcuts import redirect, render
+
+from . import bloom, counters, ingest, metadata, results_cache, voted
+from .models import Option, PendingVote, Poll, Vote
+from .pagination import apaginate
+from .replicas import pins_primary, read_from_replica
+from .throttling import throttle
+from .views import CATEGORIES, _next_page_urls, _record_vote, _results_context, _vote_for
+
+
+async def _resolve(request):
+    request.user = await request.auser()
+    return request.user
+
+
+async def _user_vote(user, poll):
+    # As views._user_vote
+    user_vote = await Vote.objects.filter(user=user, poll=poll).select_related('option').afirst()
+    if user_vote is None and ingest.enabled():
+        user_vote = await PendingVote.objects.filter(user=user, poll=poll).select_related('option').afirst()
+    if user_vote is not None:
+        await voted.aforget([user.pk])
+    return user_vote
+
+
+async def _own_vote(user, poll, options):
+    # As views._own_vote
+    if not user.is_authenticated:
+        return None
+    option_id = await Vote.objects.filter(user=user, poll=poll).values_list('option_id', flat=True).afirst()
+    if option_id is None and ingest.enabled():
+        option_id = await PendingVote.objects.filter(user=user, poll=poll).values_list('option_id', flat=True).afirst()
+    return _vote_for(poll, options, option_id)
+
+
+@read_from_replica
+async def poll_list(request, fragment=False):
+    # The badges read the voted index, which can't load lazily here
+    request.voted_polls = await voted.aload(await _resolve(request))
+    category = request.GET.get('category')
+    polls_qs = Poll.objects.filter(is_active=True)
+    if category and category != 'all':
+        polls_qs = polls_qs.filter(category=category)
+    page = await apaginate(polls_qs.select_related('created_by'), request.GET.get('cursor'))
+    context = {'polls': page, **_next_page_urls(request, page, 'poll_list', 'poll_list_more')}
+    if fragment:
+        return render(request, 'polls/poll_list_items.html', context)
+    return render(request, 'polls/poll_list.html', {
+        **context,
+        'categories': [(code, label, None) for code, label in CATEGORIES],
+        'selected_category': category or 'all',
+    })
+
+
+async def poll_detail(request, id):
+    await _resolve(request)
+    poll = await metadata.aget_poll_or_404(id)
+    if not poll.is_active:
+        return HttpResponseForbidden("This poll is not active.")
+
+    user_vote = await _own_vote(request.user, poll, poll.options.all())
+    return render(request, 'polls/poll_detail.html', {
+        'poll': poll,
+        'already_voted': user_vote is not None,
+        'user_vote': user_vote,
+    })
+
+
+@throttle('vote')
+@login_required
+@pins_primary
+async def vote(request, id):
+    if request.method != 'POST':
+        return redirect('poll_detail', id=id)
+
+    user = await _resolve(request)
+    poll = await metadata.aget_poll_or_404(id)
+    if not poll.is_active:
+        raise Http404("No Poll matches the given query.")
+
+    option_id = request.POST.get('option')
+    if not option_id:
+        return render(request, 'polls/poll_detail.html', {
+            'poll': poll,
+            'already_voted': False,
+            'user_vote': None,
+            'error': 'Please select an option before submitting.',
+        })
+
+    option = next((o for o in poll.options.all() if str(o.pk) == option_id), None)
+    if option is None:
+        raise Http404("No Option matches the given query.")
+
+    if ingest.enabled():
+        outcome = await sync_to_async(ingest.enqueue)(user, poll, option)
+        if outcome == ingest.BUSY:
+            response = render(request, 'polls/poll_detail.html', {
+                'poll': poll,
+                'already_voted': False,
+                'user_vote': None,
+                'error': 'Voting is busy right now. Please try again in a few seconds.',
+            }, status=503)
+            response['Retry-After'] = '5'
+            return response
+        if outcome == ingest.DUPLICATE:
+            return render(request, 'polls/poll_detail.html', {
+                'poll': poll,
+                'already_voted': True,
+                'user_vote': await _user_vote(user, poll),
+            })
+        await voted.aforget([user.pk])
+        messages.info(request, 'Your vote has been received and will appear in the results shortly.')
+        return redirect('poll_results', id=id)
+
+    if await bloom.amight_have_voted(poll.pk, user.pk):
+        user_vote = await _user_vote(user, poll)
+        if user_vote is not None:
+            return render(request, 'polls/poll_detail.html', {
+                'poll': poll,
+                'already_voted': True,
+                'user_vote': user_vote,
+            })
+        bloom.count_false_positive()
+
+    try:
+        await sync_to_async(_record_vote)(user, poll, option)
+    except IntegrityError:
+        bloom.add(poll.pk, user.pk)
+        return render(request, 'polls/poll_detail.html', {
+            'poll': poll,
+            'already_voted': True,
+            'user_vote': await _user_vote(user, poll),
+        })
+
+    return redirect('poll_results', id=id)
+
+
+async def _build_results(id):
+    # As views._build_results
+    poll = await metadata.aget_poll_or_404(id)
+    options = list(poll.options.all())
+    counts = {pk: n async for pk, n in Option.objects.filter(poll_id=poll.pk).values_list('pk', 'vote_count')}
+    for option in options:
+        option.vote_count = counts.get(option.pk, 0)
+    options = await counters.aload_counts(poll, options, fresh=True)
+    return _results_context(poll, options)
+
+
+@read_from_replica
+async def poll_results(request, id):
+    await _resolve(request)
+    results, hit = await results_cache.aget_results(id, lambda: _build_results(id))
+    options = [item['option'] for item in results['options_data']]
+    user_vote = await _own_vote(request.user, results['poll'], options)
+    response = render(request, 'polls/poll_results.html', {
+        **results,
+        'user_vote': user_vote,
+        'stream_results': getattr(settings, 'POLLS_STREAM_RESULTS', False),
+    })
+    response['X-Results-Cache'] = 'hit' if hit else 'miss'
+    return response
@@ -0,0 +1,263 @@
+"""
+Benchmark seeding, scenarios and an HTTP load driver.
+
+Used by the seed_benchmark_data and run_benchmarks management commands.
+Benchmark rows are recognisable by the ``bench-`` username prefix so they can
+be reseeded or removed without touching real data. Scenarios run against a
+real server (gunicorn or uvicorn started by run_benchmarks, or any --url) with
+concurrent clients and report throughput and latency percentiles as plain
+dicts that serialize to JSON.
+"""
+import random
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import pagecache, search
+from .models import Option, Poll, Vote
+
+USER_PREFIX = 'bench-'
+BATCH_SIZE = 2000
+
+
+def clear():
+    """Delete all benchmark users and their polls and votes."""
+    Poll.objects.filter(created_by__username__startswith=USER_PREFIX).delete()
+    User.objects.filter(username__startswith=USER_PREFIX).delete()
+
+
+def seed(users=200, polls=1000, options=4, votes=20000, seed=0):
+    """
+    Create benchmark users, polls, options and votes in bulk.
+
+    Half of the users are "voters" that never get seeded votes, so the vote
+    scenario always has fresh (user, poll) pairs. Counters are computed in
+    memory and written with the rows. Returns a summary dict.
+    """
+    rng = random.Random(seed)
+    clear()
+    # Seeded votes as (user index, poll index, option index); only the first half of users vote
+    seeded_voters = max(1, users // 2)
+    votes = min(votes, seeded_voters * polls)
+    pairs = set()
+    while len(pairs) < votes:
+        pairs.add((rng.randrange(seeded_voters), rng.randrange(polls)))
+    ballots = [(u, p, rng.randrange(options)) for u, p in sorted(pairs)]
+    option_counts = Counter((p, n) for _, p, n in ballots)
+    poll_totals = Counter(p for _, p, _ in ballots)
+
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [User(username=f'{USER_PREFIX}{i}', password='!') for i in range(users)],
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = list(
+            User.objects.filter(username__startswith=USER_PREFIX).order_by('pk').values_list('pk', flat=True)
+        )
+        categories = [code for code, _ in Poll.CATEGORY_CHOICES]
+        Poll.objects.bulk_create(
+            [
+                Poll(
+                    question=f'Benchmark poll {i}?',
+                    description='Seeded for benchmarks.',
+                    category=categories[i % len(categories)],
+                    created_by_id=user_ids[i % len(user_ids)],
+                    total_votes=poll_totals[i],
+                )
+                for i in range(polls)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        poll_ids = list(
+            Poll.objects.filter(created_by_id__in=user_ids).order_by('pk').values_list('pk', flat=True)
+        )
+        search.index(poll_ids)
+        pagecache.invalidate_listings()
+        Option.objects.bulk_create(
+            [
+                Option(poll_id=poll_id, text=f'Option {n}', vote_count=option_counts[(p, n)])
+                for p, poll_id in enumerate(poll_ids)
+                for n in range(options)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        option_ids = {}
+        for option_id, poll_id in Option.objects.filter(poll__created_by_id__in=user_ids).order_by('pk').values_list('pk', 'poll_id'):
+            option_ids.setdefault(poll_id, []).append(option_id)
+        Vote.objects.bulk_create(
+            [
+                Vote(user_id=user_ids[u], poll_id=poll_ids[p], option_id=option_ids[poll_ids[p]][n])
+                for u, p, n in ballots
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    return {'users': len(user_ids), 'polls': len(poll_ids), 'options': options, 'votes': votes}
+
+
+def login_sessions(count, voters=False):
+    """
+    Create authenticated sessions for benchmark users. Returns ``[(user_id, session_key)]``.
+
+    With ``voters=True`` sessions are taken from the second half of the users,
+    who have no seeded votes.
+    """
+    engine = import_module(settings.SESSION_ENGINE)
+    users = User.objects.filter(username__startswith=USER_PREFIX).order_by('pk')
+    offset = users.count() // 2 if voters else 0
+    sessions = []
+    for user in users[offset:offset + count]:
+        session = engine.SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        # save() rather than create(): with signed cookies the key is the cookie itself
+        session.save()
+        sessions.append((user.pk, session.session_key))
+    return sessions
+
+
+class Client:
+    """Minimal HTTP client holding one user's session and CSRF cookies."""
+
+    def __init__(self, base_url, session_key):
+        self.base_url = base_url.rstrip('/')
+        # A bare 32-character secret is accepted as both cookie and header token
+        self.csrf = secrets.token_hex(16)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={session_key}; {settings.CSRF_COOKIE_NAME}={self.csrf}'
+
+    def request(self, path, data=None):
+        headers = {'Cookie': self.cookie}
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['X-CSRFToken'] = self.csrf
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers)
+        try:
+            with _no_redirects.open(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_no_redirects = urllib.request.build_opener(_NoRedirect)
+
+
+class Scenario:
+    """A named request generator; ``next_request(client_index)`` returns ``(path, data)``."""
+
+    def __init__(self, name, next_request):
+        self.name = name
+        self.next_request = next_request
+
+
+def build_scenarios():
+    """
+    Return the benchmark scenarios. The ``vote`` scenario must be driven by
+    voter clients (see ``login_sessions``); each client walks the polls in
+    order so every request is a first vote.
+    """
+    poll_ids = list(
+        Poll.objects.filter(created_by__username__startswith=USER_PREFIX).values_list('pk', flat=True)
+    )
+    options_by_poll = {}
+    for option_id, poll_id in Option.objects.filter(poll_id__in=poll_ids).values_list('pk', 'poll_id'):
+        options_by_poll.setdefault(poll_id, []).append(option_id)
+    rng = random.Random(1)
+    vote_cursor = {}
+    lock = threading.Lock()
+
+    def vote(client_index):
+        with lock:
+            n = vote_cursor.get(client_index, 0)
+            vote_cursor[client_index] = n + 1
+        poll_id = poll_ids[n % len(poll_ids)]
+        return f'/poll/{poll_id}/vote/', {'option': options_by_poll[poll_id][0]}
+
+    return [
+        Scenario('poll_list', lambda i: ('/polls/', None)),
+        Scenario('poll_detail', lambda i: (f'/poll/{rng.choice(poll_ids)}/', None)),
+        Scenario('poll_results', lambda i: (f'/poll/{rng.choice(poll_ids)}/results/', None)),
+        Scenario('my_polls', lambda i: ('/my-polls/', None)),
+        Scenario('vote_history', lambda i: ('/history/', None)),
+        Scenario('vote', vote),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(scenario, clients, duration):
+    """Drive ``scenario`` with one thread per client for ``duration`` seconds."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index, client):
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            path, data = scenario.next_request(index)
+            started = time.perf_counter()
+            try:
+                status = client.request(path, data)
+            except OSError:
+                status = 0
+            local.append(time.perf_counter() - started)
+            if status == 0 or status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i, c)) for i, c in enumerate(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def compare(baseline, current):
+    """Return ``{scenario: {metric: percent change}}`` for scenarios present in both runs."""
+    changes = {}
+    for name, metrics in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            metric: round((value - before[metric]) / before[metric] * 100, 1)
+            for metric, value in metrics.items()
+            if metric in ('throughput_rps', 'p50_ms', 'p99_ms') and before.get(metric)
+        }
+    return changes
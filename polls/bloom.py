@@ -0,0 +1,201 @@
+"""
+Per-poll Bloom filters over voter ids, for a cheap duplicate-vote pre-check.
+
+``might_have_voted(poll_id, user_id)`` returning False means the user has
+definitely not voted in this process's view of the poll, so vote() goes
+straight to the insert. True means they probably have, or that the filter
+isn't built yet, and vote() makes the exact check before taking the write
+lock; about POLLS_VOTER_FILTER_ERROR_RATE of first votes pay that extra read.
+
+Filters are per process. A poll's filter is built once, by the first check
+that finds none: it streams the poll's Vote rows into a filter sized from
+Poll.total_votes. Checks that arrive while it is being built don't wait or
+build their own; they answer True, so those votes get the exact check.
+
+Filters are updated as this process records votes, so votes recorded by
+other processes since the build are missing. Then a duplicate looks new, and
+the unique constraint still rejects it; vote() adds the user on that path
+too. A filter that fills up grows another, twice as large layer instead of
+being rebuilt, so a poll's votes are read at most once per process.
+"""
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Poll, Vote
+
+MIN_CAPACITY = 1024
+
+_filters = OrderedDict()
+_building = set()
+_lock = threading.Lock()
+_stats = {'negatives': 0, 'positives': 0, 'false_positives': 0, 'unbuilt': 0, 'builds': 0}
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter sized for ``capacity`` items at ``error_rate`` false positives."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class ScalableBloomFilter:
+    """
+    Bloom filters chained as they fill. Each new layer holds twice the items
+    of the last at half its false positive rate, so the combined rate stays
+    under ``error_rate`` without the items being read again.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.layers = [BloomFilter(capacity, error_rate / 2)]
+
+    @property
+    def count(self):
+        return sum(layer.count for layer in self.layers)
+
+    def add(self, item):
+        layer = self.layers[-1]
+        if layer.count >= layer.capacity:
+            layer = BloomFilter(2 * layer.capacity, layer.error_rate / 2)
+            self.layers.append(layer)
+        layer.add(item)
+
+    def __contains__(self, item):
+        return any(item in layer for layer in self.layers)
+
+
+def _error_rate():
+    return getattr(settings, 'POLLS_VOTER_FILTER_ERROR_RATE', 0.01)
+
+
+def _voters(poll_id):
+    return Vote.objects.filter(poll_id=poll_id).values_list('user_id', flat=True)
+
+
+def _empty(total_votes):
+    # Headroom for new votes before the filter grows a layer. total_votes lags
+    # votes still queued or on counter shards; those land in the next layer.
+    return ScalableBloomFilter(max(MIN_CAPACITY, 2 * (total_votes or 0)), _error_rate())
+
+
+def _build(poll_id):
+    voter_filter = _empty(Poll.objects.filter(pk=poll_id).values_list('total_votes', flat=True).first())
+    for user_id in _voters(poll_id).iterator(chunk_size=10000):
+        voter_filter.add(user_id)
+    return voter_filter
+
+
+async def _abuild(poll_id):
+    voter_filter = _empty(await Poll.objects.filter(pk=poll_id).values_list('total_votes', flat=True).afirst())
+    async for user_id in _voters(poll_id).aiterator(chunk_size=10000):
+        voter_filter.add(user_id)
+    return voter_filter
+
+
+def _claim(poll_id):
+    """
+    Return ``(filter, build)``: the poll's filter if there is one, else
+    whether the caller should build it, i.e. no one else is building it.
+    """
+    with _lock:
+        voter_filter = _filters.get(poll_id)
+        if voter_filter is not None:
+            _filters.move_to_end(poll_id)
+            return voter_filter, False
+        if poll_id in _building:
+            return None, False
+        _building.add(poll_id)
+        return None, True
+
+
+def _keep(poll_id, voter_filter):
+    limit = getattr(settings, 'POLLS_VOTER_FILTER_POLLS', 1000)
+    with _lock:
+        _building.discard(poll_id)
+        if voter_filter is None:
+            return
+        _stats['builds'] += 1
+        _filters[poll_id] = voter_filter
+        while len(_filters) > limit:
+            _filters.popitem(last=False)
+
+
+def _count(voter_filter, user_id):
+    if voter_filter is None:
+        # Being built elsewhere; the exact check answers meanwhile
+        outcome, found = 'unbuilt', True
+    else:
+        found = user_id in voter_filter
+        outcome = 'positives' if found else 'negatives'
+    with _lock:
+        _stats[outcome] += 1
+    return found
+
+
+def might_have_voted(poll_id, user_id):
+    """False if ``user_id`` has definitely not voted in the poll (as far as this process knows)."""
+    voter_filter, build = _claim(poll_id)
+    if build:
+        try:
+            voter_filter = _build(poll_id)
+        finally:
+            _keep(poll_id, voter_filter)
+    return _count(voter_filter, user_id)
+
+
+async def amight_have_voted(poll_id, user_id):
+    voter_filter, build = _claim(poll_id)
+    if build:
+        try:
+            voter_filter = await _abuild(poll_id)
+        finally:
+            _keep(poll_id, voter_filter)
+    return _count(voter_filter, user_id)
+
+
+def add(poll_id, user_id):
+    """Record a vote in the poll's filter, if this process has built one."""
+    with _lock:
+        voter_filter = _filters.get(poll_id)
+        if voter_filter is not None:
+            voter_filter.add(user_id)
+
+
+def count_false_positive():
+    # Includes exact checks made while the poll's filter was being built
+    with _lock:
+        _stats['false_positives'] += 1
+
+
+def stats():
+    """Per-process pre-check outcomes."""
+    with _lock:
+        return dict(_stats, filters=len(_filters))
+
+
+def clear():
+    with _lock:
+        _filters.clear()
+        _building.clear()
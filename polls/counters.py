@@ -0,0 +1,167 @@
+"""
+Vote counter writes and reads.
+
+By default a vote bumps ``Option.vote_count`` and ``Poll.total_votes`` directly.
+With ``POLLS_VOTE_COUNTER_SHARDS = N`` (N > 0) a vote instead increments one of
+N ``OptionCounterShard`` rows chosen at random, so voters on the same option
+rarely contend for the same row lock. Shard deltas are added to the folded
+count on read (cached for ``POLLS_COUNTER_CACHE_TTL`` seconds) and merged back
+into the option and poll columns by ``manage.py fold_vote_shards``.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from . import results_cache
+from .models import Option, OptionCounterShard, Poll, Vote
+
+
+def shard_count():
+    return getattr(settings, 'POLLS_VOTE_COUNTER_SHARDS', 0)
+
+
+def _pending_key(poll_id):
+    return f'polls:pending-votes:{poll_id}'
+
+
+def increment(option, shards=None):
+    """Count one vote for ``option``. Call inside the vote transaction."""
+    shards = shard_count() if shards is None else shards
+    if shards <= 0:
+        Option.objects.filter(pk=option.pk).update(vote_count=F('vote_count') + 1)
+        Poll.objects.filter(pk=option.poll_id).update(total_votes=F('total_votes') + 1)
+        return
+
+    shard = random.randrange(shards)
+    bump = OptionCounterShard.objects.filter(option_id=option.pk, shard=shard)
+    if bump.update(count=F('count') + 1):
+        return
+    # First vote to land on this shard; a concurrent voter may create it first
+    try:
+        with transaction.atomic():
+            OptionCounterShard.objects.create(option_id=option.pk, shard=shard, count=1)
+    except IntegrityError:
+        bump.update(count=F('count') + 1)
+
+
+def _shard_totals(poll_id):
+    return (
+        OptionCounterShard.objects.filter(option__poll_id=poll_id)
+        .values('option')
+        .annotate(total=Sum('count'))
+    )
+
+
+def unfolded_votes(poll_id, fresh=False):
+    """Map option id -> unfolded shard votes for a poll (briefly cached unless ``fresh``)."""
+    key = _pending_key(poll_id)
+    pending = None if fresh else cache.get(key)
+    if pending is None:
+        pending = {row['option']: row['total'] for row in _shard_totals(poll_id) if row['total']}
+        cache.set(key, pending, getattr(settings, 'POLLS_COUNTER_CACHE_TTL', 2))
+    return pending
+
+
+async def aunfolded_votes(poll_id, fresh=False):
+    key = _pending_key(poll_id)
+    pending = None if fresh else await cache.aget(key)
+    if pending is None:
+        pending = {row['option']: row['total'] async for row in _shard_totals(poll_id) if row['total']}
+        await cache.aset(key, pending, getattr(settings, 'POLLS_COUNTER_CACHE_TTL', 2))
+    return pending
+
+
+def _attach(options, pending):
+    for option in options:
+        option.unfolded_votes = pending.get(option.pk, 0)
+    return options
+
+
+def load_counts(poll, options, fresh=False):
+    """Attach unfolded shard deltas to ``options`` so ``Option.current_count`` is current."""
+    if shard_count() <= 0:
+        return options
+    return _attach(options, unfolded_votes(poll.pk, fresh))
+
+
+async def aload_counts(poll, options, fresh=False):
+    if shard_count() <= 0:
+        return options
+    return _attach(options, await aunfolded_votes(poll.pk, fresh))
+
+
+def fold_shards(poll_ids=None):
+    """
+    Move shard counts into Option.vote_count and Poll.total_votes.
+
+    Each shard is decremented by exactly the amount read, so votes that land
+    while folding stay in the shard for the next run. Returns votes folded.
+    """
+    folded = 0
+    with transaction.atomic():
+        shards = OptionCounterShard.objects.select_for_update().exclude(count=0)
+        if poll_ids:
+            shards = shards.filter(option__poll_id__in=poll_ids)
+        per_option = {}
+        per_poll = {}
+        for shard_id, option_id, poll_id, count in list(shards.values_list(
+            'pk', 'option_id', 'option__poll_id', 'count'
+        )):
+            OptionCounterShard.objects.filter(pk=shard_id).update(count=F('count') - count)
+            per_option[option_id] = per_option.get(option_id, 0) + count
+            per_poll[poll_id] = per_poll.get(poll_id, 0) + count
+            folded += count
+        for option_id, count in per_option.items():
+            Option.objects.filter(pk=option_id).update(vote_count=F('vote_count') + count)
+        for poll_id, count in per_poll.items():
+            Poll.objects.filter(pk=poll_id).update(total_votes=F('total_votes') + count)
+    for poll_id in per_poll:
+        cache.delete(_pending_key(poll_id))
+    return folded
+
+
+def reconcile(poll_ids=None, dry_run=False):
+    """
+    Recompute Option.vote_count and Poll.total_votes from Vote rows, as two
+    set-based UPDATEs. Returns ``(options, polls)`` found drifted.
+    """
+    polls = Poll.objects.all()
+    opts = Option.objects.all()
+    if poll_ids is not None:
+        polls = polls.filter(pk__in=poll_ids)
+        opts = opts.filter(poll_id__in=poll_ids)
+
+    option_counts = (
+        Vote.objects.filter(option=OuterRef('pk'))
+        .values('option')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    poll_counts = (
+        Vote.objects.filter(poll=OuterRef('pk'))
+        .values('poll')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+
+    with transaction.atomic():
+        drifted_options = list(
+            opts.exclude(vote_count=Coalesce(Subquery(option_counts), 0)).values_list('poll_id', flat=True)
+        )
+        drifted_polls = list(
+            polls.exclude(total_votes=Coalesce(Subquery(poll_counts), 0)).values_list('pk', flat=True)
+        )
+
+        if not dry_run:
+            opts.update(vote_count=Coalesce(Subquery(option_counts), 0))
+            polls.update(total_votes=Coalesce(Subquery(poll_counts), 0))
+            # Vote rows are authoritative, so unfolded shard deltas are discarded
+            OptionCounterShard.objects.filter(option__in=opts).update(count=0)
+            for poll_id in set(drifted_options) | set(drifted_polls):
+                transaction.on_commit(lambda poll_id=poll_id: results_cache.bump(poll_id))
+    return len(drifted_options), len(drifted_polls)
+
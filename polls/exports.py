@@ -0,0 +1,92 @@
+"""
+Streaming exports of a poll's raw votes and option results.
+
+Rows are read with ``.iterator(chunk_size=...)`` and serialized lazily, so the
+export view and the export_poll command run in constant memory however many
+votes a poll has. Output is CSV or JSON lines, optionally gzip-compressed as it
+streams.
+"""
+import csv
+import json
+import zlib
+
+from . import counters
+from .models import Option, Vote
+
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+DATASETS = ('votes', 'results')
+CHUNK_SIZE = 2000
+# Lines are joined into blocks of about this many characters before being
+# yielded, so a response isn't written one short row at a time
+BLOCK_SIZE = 64 * 1024
+
+COLUMNS = {
+    'votes': ['vote_id', 'voted_at', 'user', 'option_id', 'option'],
+    'results': ['option_id', 'option', 'votes', 'percentage'],
+}
+
+
+def vote_rows(poll, chunk_size=CHUNK_SIZE):
+    votes = (
+        Vote.objects.filter(poll=poll)
+        .order_by('pk')
+        .values_list('pk', 'voted_at', 'user__username', 'option_id', 'option__text')
+    )
+    for pk, voted_at, username, option_id, text in votes.iterator(chunk_size=chunk_size):
+        yield [pk, voted_at.isoformat(), username, option_id, text]
+
+
+def result_rows(poll):
+    options = counters.load_counts(poll, list(Option.objects.filter(poll=poll).order_by('pk')), fresh=True)
+    total = sum(option.current_count for option in options)
+    for option in options:
+        yield [option.pk, option.text, option.current_count, option.percentage(total)]
+
+
+class _Echo:
+    # csv.writer target that hands back each formatted line
+    def write(self, value):
+        return value
+
+
+def _lines(rows, columns, fmt):
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row))) + '\n'
+
+
+def _blocks(lines):
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield ''.join(block).encode()
+            block, size = [], 0
+    if block:
+        yield ''.join(block).encode()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(poll, dataset='votes', fmt='csv', compress=False, chunk_size=CHUNK_SIZE):
+    """Yield the export of ``poll`` as encoded byte chunks."""
+    rows = vote_rows(poll, chunk_size) if dataset == 'votes' else result_rows(poll)
+    chunks = _blocks(_lines(rows, COLUMNS[dataset], fmt))
+    return _gzip(chunks) if compress else chunks
+
+
+def filename(poll, dataset='votes', fmt='csv', compress=False):
+    return f'poll-{poll.pk}-{dataset}.{fmt}' + ('.gz' if compress else '')
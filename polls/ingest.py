@@ -0,0 +1,111 @@
+"""
+Write-behind vote ingestion.
+
+With ``POLLS_VOTE_INGESTION = 'queued'`` the vote view only inserts a
+``PendingVote`` row; no Vote row or counter is touched per request.
+``manage.py flush_votes`` then moves pending votes into ``Vote`` in batches
+with one ``bulk_create`` and one counter UPDATE per option and poll. The queue
+is a database table, so votes accepted before a crash are flushed when the
+worker starts again.
+
+Backpressure reads an approximate queue depth from the cache instead of
+counting the table on every vote. The depth is counted once, kept for
+POLLS_VOTE_QUEUE_DEPTH_TTL seconds and incremented as votes are queued; each
+flush drops it so the next vote counts again. With a per-process cache a
+worker's depth only sees its own votes until it expires.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import Http404
+
+from . import results_cache, rollups
+from .models import Option, PendingVote, Poll, Vote
+
+QUEUED = 'queued'
+DUPLICATE = 'duplicate'
+BUSY = 'busy'
+
+DEPTH_KEY = 'polls:ingest:depth'
+
+
+def enabled():
+    return getattr(settings, 'POLLS_VOTE_INGESTION', 'sync') == 'queued'
+
+
+def _depth():
+    depth = cache.get(DEPTH_KEY)
+    if depth is None:
+        depth = PendingVote.objects.count()
+        cache.add(DEPTH_KEY, depth, getattr(settings, 'POLLS_VOTE_QUEUE_DEPTH_TTL', 5))
+    return depth
+
+
+def _queued():
+    try:
+        cache.incr(DEPTH_KEY)
+    except ValueError:
+        # Expired; the next vote counts the table again
+        pass
+
+
+def enqueue(user, poll, option):
+    """
+    Accept a vote into the queue. Returns QUEUED, DUPLICATE or BUSY; raises
+    Http404 if the poll is no longer active.
+    """
+    if _depth() >= getattr(settings, 'POLLS_VOTE_QUEUE_MAX', 10000):
+        return BUSY
+    if Vote.objects.filter(user=user, poll=poll).exists():
+        return DUPLICATE
+    try:
+        with transaction.atomic():
+            # The caller's is_active comes from the metadata cache
+            if not Poll.objects.filter(pk=poll.pk, is_active=True).exists():
+                raise Http404("No Poll matches the given query.")
+            PendingVote.objects.create(user=user, poll=poll, option=option)
+    except IntegrityError:
+        return DUPLICATE
+    _queued()
+    return QUEUED
+
+
+def flush(batch_size=None):
+    """Move one batch of pending votes into Vote. Returns the number of votes recorded."""
+    batch_size = batch_size or getattr(settings, 'POLLS_VOTE_FLUSH_BATCH', 500)
+    with transaction.atomic():
+        batch = list(PendingVote.objects.select_for_update().order_by('pk')[:batch_size])
+        if not batch:
+            return 0
+        # Skip entries whose user also voted through the synchronous path
+        existing = set(
+            Vote.objects.filter(
+                user_id__in={p.user_id for p in batch},
+                poll_id__in={p.poll_id for p in batch},
+            ).values_list('user_id', 'poll_id')
+        )
+        fresh = [p for p in batch if (p.user_id, p.poll_id) not in existing]
+        Vote.objects.bulk_create([
+            Vote(user_id=p.user_id, poll_id=p.poll_id, option_id=p.option_id, voted_at=p.voted_at)
+            for p in fresh
+        ])
+        rollups.add((p.poll_id, p.option_id, p.voted_at) for p in fresh)
+        for option_id, n in Counter(p.option_id for p in fresh).items():
+            Option.objects.filter(pk=option_id).update(vote_count=F('vote_count') + n)
+        for poll_id, n in Counter(p.poll_id for p in fresh).items():
+            Poll.objects.filter(pk=poll_id).update(total_votes=F('total_votes') + n)
+            transaction.on_commit(lambda poll_id=poll_id: results_cache.bump(poll_id))
+        PendingVote.objects.filter(pk__in=[p.pk for p in batch]).delete()
+        transaction.on_commit(lambda: cache.delete(DEPTH_KEY))
+    return len(fresh)
+
+
+def drain(batch_size=None):
+    """Flush until the queue is empty. Returns the number of votes recorded."""
+    total = 0
+    while PendingVote.objects.exists():
+        total += flush(batch_size)
+    return total
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from polls import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild minute/hour/day vote rollups from Vote rows (all polls, or the given ids). '
+        'With --prune, only delete minute buckets past POLLS_ROLLUP_MINUTE_RETENTION_DAYS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll_ids', nargs='*', type=int, help='Only rebuild these polls (default: all).')
+        parser.add_argument('--prune', action='store_true', help='Delete expired minute buckets instead of rebuilding.')
+
+    def handle(self, *args, poll_ids, prune, **options):
+        if prune:
+            deleted = rollups.prune()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired minute bucket(s).'))
+            return
+        written = rollups.rebuild(poll_ids)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup row(s).'))
@@ -0,0 +1,63 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from polls.models import Poll
+from polls.pagination import encode_cursor, paginate
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed many active polls inside a rolled-back transaction and compare page latency '
+        'of keyset pagination against OFFSET pagination at increasing depths.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=100_000)
+        parser.add_argument('--depths', default='1,100,1000,4000', help='Comma-separated page numbers to time.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--category', default='technology')
+
+    def handle(self, *args, polls, depths, repeat, category, **options):
+        with transaction.atomic():
+            self._seed(polls, category)
+            queryset = Poll.objects.filter(is_active=True, category=category).select_related('created_by')
+            page_size = len(paginate(queryset))
+            self.stdout.write(f'{polls} polls seeded, {page_size} per page')
+            self.stdout.write(f'{"page":>6} {"keyset ms":>10} {"offset ms":>10}')
+            for depth in [int(d) for d in depths.split(',')]:
+                offset = (depth - 1) * page_size
+                ordered = queryset.order_by('-created_at', '-pk')
+                if depth > 1:
+                    last = ordered[offset - 1]
+                    cursor = encode_cursor(last.created_at, last.pk)
+                else:
+                    cursor = None
+                keyset = self._time(lambda: paginate(queryset, cursor), repeat)
+                by_offset = self._time(lambda: list(ordered[offset:offset + page_size]), repeat)
+                self.stdout.write(f'{depth:>6} {keyset:>10.2f} {by_offset:>10.2f}')
+            transaction.set_rollback(True)
+
+    def _seed(self, count, category):
+        now = timezone.now()
+        batch = []
+        for i in range(count):
+            batch.append(Poll(
+                question=f'Benchmark poll {i}',
+                description='Seeded by bench_pagination',
+                category=category,
+                created_at=now - timedelta(seconds=i),
+            ))
+            if len(batch) == 5000:
+                Poll.objects.bulk_create(batch)
+                batch = []
+        Poll.objects.bulk_create(batch)
+
+    def _time(self, fn, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) * 1000 / repeat
@@ -0,0 +1,80 @@
+import itertools
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls import search
+from polls.models import Poll
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pra', 'sto', 'gli', 'den', 'mor', 'tak']
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed many polls with generated text inside a rolled-back transaction and time ranked '
+        'full-text searches (rare, common, prefix and multi-term queries, with and without a '
+        'category, plus category facets) against an icontains scan.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--scan-repeat', type=int, default=2, help='Repeats for the slow icontains baseline.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, polls, repeat, scan_repeat, seed, **options):
+        rng = random.Random(seed)
+        vocabulary = [''.join(parts) for parts in itertools.product(SYLLABLES, repeat=3)]
+        rng.shuffle(vocabulary)
+        # Zipf-like word frequencies, so some terms match a large share of polls and most match few
+        weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+        with transaction.atomic():
+            started = time.perf_counter()
+            self._seed(polls, rng, vocabulary, weights)
+            seeded = time.perf_counter()
+            search.rebuild()
+            self.stdout.write(
+                f'{polls} polls seeded in {seeded - started:.1f}s, indexed in {time.perf_counter() - seeded:.1f}s'
+            )
+            common, middling, rare = vocabulary[0], vocabulary[100], vocabulary[-1]
+            queries = [
+                ('rare term', rare, None),
+                ('middling term', middling, None),
+                ('common term', common, None),
+                ('2-char prefix', common[:2], None),
+                ('two terms', f'{common} {middling}', None),
+                ('common + cat', common, 'sports'),
+            ]
+            self.stdout.write(f'{"query":<15} {"matches":>9} {"search ms":>10} {"facets ms":>10} {"icontains ms":>13}')
+            for label, text, category in queries:
+                counts = search.facets(text)
+                matches = counts.get(category, 0) if category else sum(counts.values())
+                ranked = self._time(lambda: search.ranked_ids(text, category), repeat)
+                facets = self._time(lambda: search.facets(text), repeat)
+                # What poll_list would run without the index: a scan for the newest matches
+                scan_queryset = search.unindexed_queryset(search.terms(text), category).order_by('-created_at', '-pk')
+                scan = self._time(lambda: list(scan_queryset.values_list('pk', flat=True)[:20]), scan_repeat)
+                self.stdout.write(f'{label:<15} {matches:>9} {ranked:>10.2f} {facets:>10.2f} {scan:>13.2f}')
+            transaction.set_rollback(True)
+
+    def _seed(self, count, rng, vocabulary, weights):
+        categories = [code for code, _ in Poll.CATEGORY_CHOICES]
+        batch = []
+        for i in range(count):
+            batch.append(Poll(
+                question=' '.join(rng.choices(vocabulary, cum_weights=weights, k=6)) + '?',
+                description=' '.join(rng.choices(vocabulary, cum_weights=weights, k=20)),
+                category=categories[i % len(categories)],
+            ))
+            if len(batch) == 5000:
+                Poll.objects.bulk_create(batch)
+                batch = []
+        Poll.objects.bulk_create(batch)
+
+    def _time(self, fn, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) * 1000 / repeat
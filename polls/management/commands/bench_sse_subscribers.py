@@ -0,0 +1,89 @@
+import asyncio
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from polling_system.asgi import application
+from polls import results_cache, streams
+from polls.models import Option, Poll
+
+
+class Command(BaseCommand):
+    help = (
+        'Open many idle Server-Sent Events subscribers against the ASGI application '
+        'in-process, then fire a burst of votes and report memory per connection '
+        'and frames delivered per client.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=2000)
+        parser.add_argument('--burst', type=int, default=1000, help='Result changes fired during the burst.')
+        parser.add_argument('--interval', type=float, default=0.2, help='Hub coalescing interval in seconds.')
+
+    def handle(self, *args, clients, burst, interval, **options):
+        poll = Poll.objects.create(question='Stream benchmark', description='Temporary poll')
+        Option.objects.create(poll=poll, text='A')
+        Option.objects.create(poll=poll, text='B')
+        try:
+            with override_settings(POLLS_STREAM_INTERVAL=interval):
+                asyncio.run(self._run(poll.pk, clients, burst, interval))
+        finally:
+            poll.delete()
+
+    async def _run(self, poll_id, clients, burst, interval):
+        frames = [0] * clients
+        disconnect = asyncio.Event()
+        opened = asyncio.Semaphore(0)
+
+        async def client(n):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': f'/poll/{poll_id}/results/stream/',
+                'raw_path': b'', 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', n), 'server': ('localhost', 80),
+            }
+            sent_request = False
+
+            async def receive():
+                nonlocal sent_request
+                if not sent_request:
+                    sent_request = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    opened.release()
+                elif message['type'] == 'http.response.body' and message.get('body', b'').startswith(b'id:'):
+                    frames[n] += 1
+
+            await application(scope, receive, send)
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(client(n)) for n in range(clients)]
+        for _ in range(clients):
+            await opened.acquire()
+        connected = time.perf_counter() - started
+        await asyncio.sleep(interval * 2)
+        per_client = (tracemalloc.get_traced_memory()[0] - baseline) / clients
+
+        before = sum(frames)
+        for _ in range(burst):
+            results_cache.bump(poll_id)
+            await asyncio.sleep(0)
+        await asyncio.sleep(interval * 3)
+        burst_frames = (sum(frames) - before) / clients
+
+        disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        tracemalloc.stop()
+
+        self.stdout.write(f'{clients} subscribers connected in {connected:.2f}s')
+        self.stdout.write(f'~{per_client / 1024:.1f} KiB traced memory per idle connection')
+        self.stdout.write(f'{burst} changes delivered as {burst_frames:.1f} frame(s) per client')
+        self.stdout.write(f'{streams.hub_count()} hub(s) left after disconnect')
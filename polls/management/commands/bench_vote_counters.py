@@ -0,0 +1,64 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from polls import counters, rollups
+from polls.models import Option, Poll
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent throughput of the per-vote counter and rollup writes with and without sharding. '
+        'SQLite serializes all writers, so run against PostgreSQL to see the effect of sharding.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--votes', type=int, default=2000, help='Total votes per run.')
+        parser.add_argument('--options', type=int, default=2, help='Number of hot options voted on.')
+        parser.add_argument('--shards', default='0,16', help='Comma-separated shard counts to compare.')
+
+    def handle(self, *args, threads, votes, options, shards, **kwargs):
+        per_thread = max(1, votes // threads)
+        for shard_count in [int(n) for n in shards.split(',')]:
+            poll = Poll.objects.create(question='Counter benchmark', description='Temporary poll')
+            hot = [Option.objects.create(poll=poll, text=f'Hot {i}') for i in range(options)]
+            retries = [0]
+
+            def worker(offset):
+                try:
+                    for i in range(per_thread):
+                        option = hot[(offset + i) % len(hot)]
+                        while True:
+                            try:
+                                # The writes views.vote makes besides the Vote row
+                                with transaction.atomic():
+                                    counters.increment(option, shards=shard_count)
+                                    rollups.add([(poll.pk, option.pk, timezone.now())], shards=shard_count)
+                                break
+                            except OperationalError:
+                                retries[0] += 1
+                finally:
+                    connection.close()
+
+            workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+            started = time.perf_counter()
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+            elapsed = time.perf_counter() - started
+
+            counters.fold_shards([poll.pk])
+            poll.refresh_from_db()
+            recorded = poll.total_votes
+            poll.delete()
+
+            label = 'unsharded' if shard_count <= 0 else f'{shard_count} shards'
+            self.stdout.write(
+                f'{label:>12}: {recorded} votes in {elapsed:.2f}s '
+                f'({recorded / elapsed:.0f} votes/s, {retries[0]} lock retries)'
+            )
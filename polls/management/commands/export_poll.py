@@ -0,0 +1,37 @@
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import exports
+from polls.models import Poll
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a poll's raw votes (or option results) as CSV or JSON lines in constant memory. "
+        'Output ending in .gz is gzip-compressed; without --output the export goes to stdout.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll_id', type=int)
+        parser.add_argument('--data', choices=exports.DATASETS, default='votes')
+        parser.add_argument('--format', choices=list(exports.CONTENT_TYPES), default='csv')
+        parser.add_argument('--output', help='File to write (default: stdout).')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE, help='Rows fetched per query.')
+
+    def handle(self, *args, poll_id, data, format, output, chunk_size, **options):
+        try:
+            poll = Poll.objects.get(pk=poll_id)
+        except Poll.DoesNotExist:
+            raise CommandError(f'Poll {poll_id} does not exist.')
+        compress = bool(output) and output.endswith('.gz')
+        chunks = exports.stream(poll, data, format, compress, chunk_size)
+        if not output:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+            return
+        written = 0
+        with open(output, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes to {output}'))
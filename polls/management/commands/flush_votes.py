@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls import ingest
+
+
+class Command(BaseCommand):
+    help = 'Move queued votes into Vote in batches. Run one flusher per database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help='Keep running and flush as votes arrive.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        # Anything left from a previous run (e.g. after a crash) goes first
+        recovered = ingest.drain(batch_size)
+        self.stdout.write(f'Flushed {recovered} queued vote(s).')
+        while loop:
+            flushed = ingest.flush(batch_size)
+            if flushed:
+                self.stdout.write(f'Flushed {flushed} vote(s).')
+            else:
+                time.sleep(interval)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from polls import counters
+
+
+class Command(BaseCommand):
+    help = 'Merge sharded vote counters into Option.vote_count and Poll.total_votes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll_ids', nargs='*', type=int, help='Only fold these polls (default: all).')
+
+    def handle(self, *args, poll_ids, **options):
+        folded = counters.fold_shards(poll_ids or None)
+        self.stdout.write(self.style.SUCCESS(f'Folded {folded} vote(s).'))
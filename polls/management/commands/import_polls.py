@@ -0,0 +1,222 @@
+import csv
+import gzip
+import json
+import sys
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from polls import pagecache, rollups, search, voted
+from polls.models import Option, Poll, Vote
+
+CATEGORIES = {code for code, _ in Poll.CATEGORY_CHOICES}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+
+
+def open_input(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_records(path, fmt=None):
+    """Yield ``(line number, record)`` from a CSV or JSON-lines file without loading it whole."""
+    if fmt is None:
+        name = path[:-3] if path.endswith('.gz') else path
+        fmt = 'csv' if name.endswith('.csv') else 'jsonl'
+    with open_input(path) as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    raise CommandError(f'{path}:{number}: invalid JSON ({e})')
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk import polls with their options, and optionally historical votes, from CSV or '
+        'JSON-lines files (optionally gzipped; "-" reads stdin). Poll records have id, question, '
+        'description, category, created_by, is_active, created_at and options (a list, or '
+        '"|"-separated in CSV). Vote records have poll (a poll id from the same import), option '
+        '(option text), user and voted_at. Missing users are created without a usable password. '
+        'Everything is loaded in one transaction; counters are computed once at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('polls', help='Poll file.')
+        parser.add_argument('--votes', help='Vote file.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from file extension).')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert.')
+
+    def handle(self, *args, polls, votes, format, batch_size, **options):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError(f'import_polls needs primary keys back from bulk inserts, which {connection.vendor} does not return.')
+        self.verbosity = options['verbosity']
+        self.batch_size = batch_size
+        self.user_ids = {}
+        started = time.monotonic()
+
+        with transaction.atomic():
+            poll_ids, option_ids = self._import_polls(polls, format)
+            # bulk_create sends no signals, so new polls are indexed and listed here
+            search.index(poll_ids.values())
+            pagecache.invalidate_listings()
+            imported_votes = duplicates = 0
+            option_counts, poll_counts = Counter(), Counter()
+            if votes:
+                imported_votes, duplicates = self._import_votes(
+                    votes, format, poll_ids, option_ids, option_counts, poll_counts,
+                )
+            # Imported polls start at zero, so counters are set rather than incremented
+            self._set_counts(Option, 'vote_count', option_counts)
+            self._set_counts(Poll, 'total_votes', poll_counts)
+            if imported_votes:
+                # One grouped pass per granularity beats bucketing row by row here
+                rollups.rebuild(list(poll_ids.values()))
+                # Existing users may have a cached voted-polls index without these votes
+                transaction.on_commit(lambda: voted.forget(self.user_ids.values()))
+
+        elapsed = time.monotonic() - started
+        rows = len(poll_ids) + len(option_ids) + imported_votes
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {len(poll_ids)} poll(s), {len(option_ids)} option(s) and {imported_votes} vote(s) '
+            f'in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s).'
+        ))
+        if duplicates:
+            self.stdout.write(self.style.WARNING(f'Skipped {duplicates} duplicate vote(s) (one vote per user per poll).'))
+
+    def _import_polls(self, path, fmt):
+        poll_ids = {}      # external id -> Poll pk
+        option_ids = {}    # (Poll pk, option text) -> Option pk
+        for batch in batched(read_records(path, fmt), self.batch_size):
+            self._resolve_users({r['created_by'] for _, r in batch if r.get('created_by')})
+            polls, texts = [], []
+            for line, record in batch:
+                key = str(record.get('id') or '')
+                if not key or key in poll_ids:
+                    raise CommandError(f'{path}:{line}: missing or duplicate poll id {key!r}')
+                options = record.get('options') or []
+                if isinstance(options, str):
+                    options = options.split('|')
+                options = [t.strip() for t in options if t.strip()]
+                if len(options) < 2 or len(set(options)) != len(options):
+                    raise CommandError(f'{path}:{line}: a poll needs at least 2 distinct options')
+                category = record.get('category') or 'technology'
+                if category not in CATEGORIES or not record.get('question'):
+                    raise CommandError(f'{path}:{line}: missing question or unknown category {category!r}')
+                polls.append(Poll(
+                    question=record['question'],
+                    description=record.get('description') or '',
+                    category=category,
+                    is_active=str(record.get('is_active', True)).strip().lower() not in FALSE_VALUES,
+                    created_at=self._parse_datetime(record.get('created_at'), path, line),
+                    created_by_id=self.user_ids.get(record.get('created_by')),
+                ))
+                poll_ids[key] = None
+                texts.append((key, options))
+            Poll.objects.bulk_create(polls, batch_size=self.batch_size)
+            new_options = []
+            for poll, (key, options) in zip(polls, texts):
+                poll_ids[key] = poll.pk
+                new_options.extend(Option(poll_id=poll.pk, text=text) for text in options)
+            Option.objects.bulk_create(new_options, batch_size=self.batch_size)
+            for option in new_options:
+                option_ids[option.poll_id, option.text] = option.pk
+            self._progress('polls', len(poll_ids))
+        return poll_ids, option_ids
+
+    def _import_votes(self, path, fmt, poll_ids, option_ids, option_counts, poll_counts):
+        # One packed int per (poll, user) pair keeps the in-memory check compact
+        seen = set()
+        imported = duplicates = 0
+        # Vote rows skip model instantiation and per-field SQL compilation,
+        # which dominate bulk_create at this volume
+        sql = 'INSERT INTO {} ({}) VALUES (%s, %s, %s, %s)'.format(
+            connection.ops.quote_name(Vote._meta.db_table),
+            ', '.join(connection.ops.quote_name(Vote._meta.get_field(f).column)
+                      for f in ('user', 'poll', 'option', 'voted_at')),
+        )
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            for batch in batched(read_records(path, fmt), self.batch_size):
+                self._resolve_users({r.get('user') for _, r in batch if r.get('user')})
+                rows = []
+                for line, record in batch:
+                    poll_id = poll_ids.get(str(record.get('poll') or ''))
+                    option_id = option_ids.get((poll_id, (record.get('option') or '').strip()))
+                    user_id = self.user_ids.get(record.get('user'))
+                    if poll_id is None or option_id is None or user_id is None:
+                        raise CommandError(f'{path}:{line}: unknown poll, option or missing user')
+                    key = poll_id << 32 | user_id
+                    if key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                    voted_at = adapt(self._parse_datetime(record.get('voted_at'), path, line))
+                    rows.append((user_id, poll_id, option_id, voted_at))
+                    option_counts[option_id] += 1
+                    poll_counts[poll_id] += 1
+                cursor.executemany(sql, rows)
+                imported += len(rows)
+                self._progress('votes', imported)
+        return imported, duplicates
+
+    def _set_counts(self, model, field, counts):
+        qn = connection.ops.quote_name
+        sql = f'UPDATE {qn(model._meta.db_table)} SET {qn(field)} = %s WHERE {qn(model._meta.pk.column)} = %s'
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(n, pk) for pk, n in counts.items()])
+
+    def _resolve_users(self, usernames):
+        """Fill ``self.user_ids`` for ``usernames``, creating users that don't exist yet."""
+        missing = [name for name in usernames if name not in self.user_ids]
+        if not missing:
+            return
+        self.user_ids.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+        new = [name for name in missing if name not in self.user_ids]
+        if new:
+            created = User.objects.bulk_create(
+                [User(username=name, password=make_password(None)) for name in new],
+                batch_size=self.batch_size,
+            )
+            self.user_ids.update((user.username, user.pk) for user in created)
+
+    def _parse_datetime(self, value, path, line):
+        if not value:
+            return timezone.now()
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'{path}:{line}: invalid datetime {value!r}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def _progress(self, label, count):
+        if self.verbosity >= 2:
+            self.stdout.write(f'  {count} {label}')
@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from polls.metrics import registry
+from polls.models import Poll
+
+# Session engine and user cache TTL per mode; 'before' is Django's default
+# database sessions with every request reading auth_user
+MODES = {
+    'before': ('django.contrib.sessions.backends.db', 0),
+    'cached_db': ('django.contrib.sessions.backends.cached_db', 60),
+    'signed_cookies': ('django.contrib.sessions.backends.signed_cookies', 60),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Request the read views as a logged-in user under each session mode and report '
+        'SQL queries per request once the session, user and poll caches are warm. '
+        'Logins are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to log in as (default: the first active user).')
+        parser.add_argument('--poll', type=int, help='Poll id for the poll views (default: the newest active poll).')
+        parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes to compare.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, user, poll, modes, repeat, **options):
+        users = get_user_model().objects.filter(is_active=True)
+        user = users.filter(username=user).first() if user else users.order_by('pk').first()
+        poll = Poll.objects.filter(pk=poll).first() if poll else Poll.objects.filter(is_active=True).order_by('-pk').first()
+        if user is None or poll is None:
+            raise CommandError('measure_view_queries needs an active user and an active poll.')
+        modes = modes.split(',')
+        for mode in modes:
+            if mode not in MODES:
+                raise CommandError(f'unknown mode {mode!r}; choose from {", ".join(MODES)}')
+
+        urls = {
+            'poll_list': reverse('poll_list'),
+            'poll_detail': reverse('poll_detail', args=[poll.pk]),
+            'poll_results': reverse('poll_results', args=[poll.pk]),
+            'poll_results_json': reverse('poll_results_json', args=[poll.pk]),
+            'my_polls': reverse('my_polls'),
+            'vote_history': reverse('vote_history'),
+            'user_profile': reverse('user_profile'),
+        }
+        queries = {mode: self._measure(mode, user, urls, repeat) for mode in modes}
+
+        self.stdout.write(f'Queries per request as {user.username}, poll {poll.pk}')
+        self.stdout.write(f'{"view":<18}' + ''.join(f'{mode:>16}' for mode in modes))
+        for name in urls:
+            self.stdout.write(f'{name:<18}' + ''.join(f'{queries[mode][name]:>16}' for mode in modes))
+
+    def _measure(self, mode, user, urls, repeat):
+        engine, ttl = MODES[mode]
+        with override_settings(SESSION_ENGINE=engine, POLLS_USER_CACHE_TTL=ttl, ALLOWED_HOSTS=['testserver']):
+            with transaction.atomic():
+                client = Client()
+                client.force_login(user)
+                # First pass fills the caches; only the repeats are counted
+                for url in urls.values():
+                    client.get(url)
+                registry.reset()
+                for _ in range(repeat):
+                    for url in urls.values():
+                        client.get(url)
+                transaction.set_rollback(True)
+        result = {}
+        for name in urls:
+            snapshot = registry.snapshot(name)
+            if snapshot is None:
+                result[name] = '-'
+            else:
+                count, total = snapshot['db_queries']
+                result[name] = f'{total / count:.1f}'
+        return result
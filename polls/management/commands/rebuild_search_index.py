@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the full-text search index of poll questions and descriptions, e.g. after '
+        'bulk_create() or queryset update() calls that bypassed the indexing signals.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll_ids', nargs='*', type=int, help='Only reindex these polls (default: all).')
+
+    def handle(self, *args, poll_ids, **options):
+        with transaction.atomic():
+            if poll_ids:
+                search.index(poll_ids)
+                count = len(poll_ids)
+            else:
+                count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} poll(s).'))
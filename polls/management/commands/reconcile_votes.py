@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from polls import counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute Option.vote_count and Poll.total_votes from Vote rows to repair counter drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll_ids', nargs='*', type=int, help='Only reconcile these polls (default: all).')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing.')
+
+    def handle(self, *args, poll_ids, dry_run, **options):
+        option_drift, poll_drift = counters.reconcile(poll_ids or None, dry_run=dry_run)
+        verb = 'Found' if dry_run else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} drift on {option_drift} option(s) and {poll_drift} poll(s).'
+        ))
@@ -0,0 +1,130 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from polls import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the HTTP benchmark scenarios against a local server (or --url) and report '
+        'throughput and p50/p99 latency. --server gunicorn runs the sync views under WSGI; '
+        '--server uvicorn runs asgi.py with POLLS_ASYNC_VIEWS on. Results can be written as '
+        'JSON and compared with a previous run, e.g. "--server uvicorn --clients 64 --compare '
+        'gunicorn.json". Seed data first with seed_benchmark_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Benchmark an already running server instead of starting one.')
+        parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default='gunicorn',
+                            help='Server to start: sync views under WSGI, or async views under ASGI.')
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes.')
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent clients per scenario.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per scenario.')
+        parser.add_argument('--scenarios', help='Comma-separated scenario names (default: all).')
+        parser.add_argument('--output', help='Write results as JSON to this path.')
+        parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run to diff against.')
+
+    def handle(self, *args, url, server, workers, clients, duration, scenarios, output, compare, **options):
+        available = {scenario.name: scenario for scenario in benchmarks.build_scenarios()}
+        if not available or not benchmarks.Poll.objects.filter(
+            created_by__username__startswith=benchmarks.USER_PREFIX
+        ).exists():
+            raise CommandError('No benchmark data; run seed_benchmark_data first.')
+        names = scenarios.split(',') if scenarios else list(available)
+        unknown = set(names) - set(available)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        readers = benchmarks.login_sessions(clients)
+        voters = benchmarks.login_sessions(clients, voters=True)
+        if len(readers) < clients or len(voters) < clients:
+            raise CommandError(f'Need at least {clients * 2} benchmark users for {clients} clients.')
+
+        process = None
+        if not url:
+            process, url = self._start_server(server, workers)
+        try:
+            results = {}
+            for name in names:
+                sessions = voters if name == 'vote' else readers
+                http_clients = [benchmarks.Client(url, key) for _, key in sessions]
+                results[name] = benchmarks.run_scenario(available[name], http_clients, duration)
+                self.stdout.write(self._format(name, results[name]))
+        finally:
+            if process:
+                process.terminate()
+                process.wait(timeout=10)
+
+        report = {
+            'commit': self._git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'config': {
+                'server': server if process else url,
+                'workers': workers if process else None,
+                'clients': clients,
+                'duration': duration,
+            },
+            'scenarios': results,
+        }
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Results written to {output}')
+        if compare:
+            with open(compare) as f:
+                baseline = json.load(f)
+            self.stdout.write(f'Change against {baseline.get("commit") or compare} (%):')
+            for name, changes in benchmarks.compare(baseline, report).items():
+                self.stdout.write(f'  {name:<14} ' + '  '.join(f'{k} {v:+.1f}' for k, v in changes.items()))
+
+    def _format(self, name, result):
+        return (
+            f'{name:<14} {result["requests"]:>7} req  {result["throughput_rps"]:>9.1f} req/s  '
+            f'p50 {result["p50_ms"]:>8.2f} ms  p99 {result["p99_ms"]:>8.2f} ms  errors {result["errors"]}'
+        )
+
+    def _start_server(self, server, workers):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        url = f'http://127.0.0.1:{port}'
+        # The vote scenario floods from one address by design
+        env = dict(os.environ, POLLS_THROTTLE_ENABLED='0')
+        if server == 'gunicorn':
+            command = ['gunicorn', 'polling_system.wsgi', '--bind', f'127.0.0.1:{port}',
+                       '--workers', str(workers), '--log-level', 'warning']
+        else:
+            command = ['uvicorn', 'polling_system.asgi:application', '--port', str(port),
+                       '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+            env['POLLS_ASYNC_VIEWS'] = '1'
+        process = subprocess.Popen([sys.executable, '-m', *command], env=env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'{server} exited during startup; is it installed?')
+            try:
+                urllib.request.urlopen(url + '/polls/', timeout=1).close()
+                return process, url
+            except urllib.error.HTTPError:
+                return process, url
+            except OSError:
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f'{server} did not start within 30 seconds')
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from polls import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed benchmark users, polls, options and votes (usernames prefixed with "bench-"). '
+        'Existing benchmark rows are replaced; other data is left alone.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--polls', type=int, default=1000)
+        parser.add_argument('--options', type=int, default=4)
+        parser.add_argument('--votes', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible data sets.')
+        parser.add_argument('--clear', action='store_true', help='Only delete existing benchmark data.')
+
+    def handle(self, *args, users, polls, options, votes, seed, clear, **kwargs):
+        if clear:
+            benchmarks.clear()
+            self.stdout.write(self.style.SUCCESS('Benchmark data removed'))
+            return
+        summary = benchmarks.seed(users=users, polls=polls, options=options, votes=votes, seed=seed)
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded {users} users, {polls} polls with {options} options each and {votes} votes'.format(**summary)
+        ))
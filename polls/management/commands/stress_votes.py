@@ -0,0 +1,79 @@
+import multiprocessing
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import UpdateError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+from django.test import Client
+
+from polls.models import Option, Poll, Vote
+
+USER_PREFIX = 'stress-'
+
+
+def _cast_votes(poll_id, option_ids, user_ids):
+    """Worker process: vote once as each user through the vote view. Returns error messages."""
+    errors = []
+    client = Client()
+    for i, user_id in enumerate(user_ids):
+        try:
+            client.force_login(User.objects.get(pk=user_id))
+            response = client.post(f'/poll/{poll_id}/vote/', {'option': option_ids[i % len(option_ids)]})
+            if response.status_code != 302:
+                errors.append(f'HTTP {response.status_code}')
+        except (DatabaseError, UpdateError) as error:
+            # The session backend reports a failed save (e.g. a locked
+            # database) as UpdateError
+            errors.append(f'{type(error).__name__}: {error}')
+    return errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Cast votes from many processes at once through the vote view and report lock errors. '
+        'Creates a poll and users prefixed with "stress-", removed again afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=400)
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent writer processes.')
+        parser.add_argument('--keep', action='store_true', help='Keep the poll and users for inspection.')
+
+    def handle(self, *args, voters, workers, keep, **kwargs):
+        User.objects.filter(username__startswith=USER_PREFIX).delete()
+        users = User.objects.bulk_create(User(username=f'{USER_PREFIX}{i}') for i in range(voters))
+        poll = Poll.objects.create(question='Stress test poll', created_by=users[0])
+        options = Option.objects.bulk_create(Option(poll=poll, text=f'Option {i}') for i in range(4))
+        option_ids = [str(option.pk) for option in options]
+        user_ids = [user.pk for user in users]
+        connection.close()
+
+        # Fresh interpreters, each with its own connection; set up before the
+        # task (and so this module) is unpickled
+        with multiprocessing.get_context('spawn').Pool(workers, initializer=django.setup) as pool:
+            pool.map(abs, range(workers))  # wait for start-up before timing
+            started = time.perf_counter()
+            results = pool.starmap(
+                _cast_votes, [(poll.pk, option_ids, user_ids[i::workers]) for i in range(workers)],
+            )
+            elapsed = time.perf_counter() - started
+
+        errors = [error for result in results for error in result]
+        recorded = Vote.objects.filter(poll=poll).count()
+        counted = Option.objects.filter(poll=poll).aggregate(n=Sum('vote_count'))['n']
+        self.stdout.write(
+            f'{connection.vendor}: {recorded}/{voters} votes from {workers} workers '
+            f'in {elapsed:.2f}s ({recorded / elapsed:.0f} votes/s), {len(errors)} errors'
+        )
+        for message in sorted(set(errors)):
+            self.stdout.write(f'  {errors.count(message)} x {message}')
+
+        if not keep:
+            poll.delete()
+            User.objects.filter(username__startswith=USER_PREFIX).delete()
+        if errors or recorded != voters or counted != voters:
+            raise CommandError(f'{len(errors)} errors, {recorded} votes recorded, {counted} counted')
+        self.stdout.write(self.style.SUCCESS('No lock errors'))
@@ -0,0 +1,224 @@
+"""
+Read-through cache of poll metadata: question, description, category,
+active flag, creator id and option texts.
+
+Two tiers: a bounded per-process LRU, whose entries live at most
+POLLS_METADATA_LOCAL_TTL seconds, in front of the Django cache. Each poll
+has a version number in the Django cache; invalidate() bumps it, and entries
+in either tier are only used while their version is current, so a bump in one
+process retires the local copies in every other process that shares the cache
+backend. Entries are never written under a version that was read after the
+change, so a reader that loaded old rows can't revive them (the same scheme
+as results_cache).
+
+Signals (polls.signals) invalidate a poll whenever it or one of its options is
+saved or deleted through the ORM, including admin saves, deactivate_poll and
+delete_poll. Queryset ``update()`` and ``bulk_create()`` bypass signals; call
+invalidate() after using them on existing polls.
+
+The active flag read here only screens requests; vote writes re-check it in
+the database.
+
+Vote counters are not part of the metadata: instances returned here carry
+default counter values and must not be used to read counts.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import Http404
+
+from . import replicas
+from .models import Option, Poll
+
+FIELDS = ('id', 'question', 'description', 'category', 'is_active', 'created_at', 'created_by_id')
+
+_local = OrderedDict()
+_lock = threading.Lock()
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+
+def _version_key(poll_id):
+    return f'polls:meta-version:{poll_id}'
+
+
+def _data_key(poll_id, version):
+    return f'polls:meta:{poll_id}:{version}'
+
+
+def _version(poll_id):
+    key = _version_key(poll_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted version key never revives old entries
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def _aversion(poll_id):
+    key = _version_key(poll_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _rows(poll_id):
+    return (
+        Poll.objects.filter(pk=poll_id)
+        .order_by('options__pk')
+        .values_list(*FIELDS, 'options__pk', 'options__text')
+    )
+
+
+def _snapshot(rows):
+    if not rows:
+        return None
+    fields = dict(zip(FIELDS, rows[0]))
+    options = [(pk, text) for *_, pk, text in rows if pk is not None]
+    return fields, options
+
+
+def _load(poll_id):
+    # Always the primary: an entry filled from a lagging replica would outlive the lag
+    with replicas.primary():
+        return _snapshot(list(_rows(poll_id)))
+
+
+async def _aload(poll_id):
+    with replicas.primary():
+        return _snapshot([row async for row in _rows(poll_id)])
+
+
+def _build(snapshot):
+    # Fresh instances per call, so callers may annotate them freely
+    fields, options = snapshot
+    poll = Poll(**fields)
+    poll._state.adding = False
+    poll._state.db = DEFAULT_DB_ALIAS
+    loaded = []
+    for pk, text in options:
+        option = Option(id=pk, poll=poll, text=text)
+        option._state.adding = False
+        option._state.db = DEFAULT_DB_ALIAS
+        loaded.append(option)
+    # Same shape prefetch_related leaves behind, so poll.options.all() runs no query
+    queryset = poll.options.all()
+    queryset._result_cache = loaded
+    queryset._prefetch_done = True
+    poll._prefetched_objects_cache = {'options': queryset}
+    return poll
+
+
+def _remember(poll_id, version, snapshot):
+    limit = getattr(settings, 'POLLS_METADATA_CACHE_SIZE', 1000)
+    expires = time.monotonic() + getattr(settings, 'POLLS_METADATA_LOCAL_TTL', 5)
+    with _lock:
+        _local[poll_id] = (version, snapshot, expires)
+        _local.move_to_end(poll_id)
+        while len(_local) > limit:
+            _local.popitem(last=False)
+
+
+def _local_snapshot(poll_id, version):
+    with _lock:
+        entry = _local.get(poll_id)
+        # The TTL bounds how long a copy outlives a version bump this process
+        # can't see, e.g. with a per-process cache backend
+        if entry is not None and entry[0] == version and entry[2] > time.monotonic():
+            _local.move_to_end(poll_id)
+            _stats['local_hits'] += 1
+            return entry[1]
+    return None
+
+
+def get_poll(poll_id):
+    """Return the poll with its options prefetched, or None if it doesn't exist."""
+    version = _version(poll_id)
+    snapshot = _local_snapshot(poll_id, version)
+    if snapshot is not None:
+        return _build(snapshot)
+
+    shared = getattr(settings, 'POLLS_METADATA_SHARED', True)
+    snapshot = cache.get(_data_key(poll_id, version)) if shared else None
+    if snapshot is not None:
+        _stats['shared_hits'] += 1
+    else:
+        _stats['misses'] += 1
+        snapshot = _load(poll_id)
+        if snapshot is None:
+            # Misses aren't cached: bulk-created polls send no signal
+            return None
+        if shared:
+            cache.set(_data_key(poll_id, version), snapshot, getattr(settings, 'POLLS_METADATA_CACHE_TTL', 3600))
+    _remember(poll_id, version, snapshot)
+    return _build(snapshot)
+
+
+async def aget_poll(poll_id):
+    """Async get_poll(), for views served under ASGI."""
+    version = await _aversion(poll_id)
+    snapshot = _local_snapshot(poll_id, version)
+    if snapshot is not None:
+        return _build(snapshot)
+
+    shared = getattr(settings, 'POLLS_METADATA_SHARED', True)
+    snapshot = await cache.aget(_data_key(poll_id, version)) if shared else None
+    if snapshot is not None:
+        _stats['shared_hits'] += 1
+    else:
+        _stats['misses'] += 1
+        snapshot = await _aload(poll_id)
+        if snapshot is None:
+            return None
+        if shared:
+            await cache.aset(_data_key(poll_id, version), snapshot, getattr(settings, 'POLLS_METADATA_CACHE_TTL', 3600))
+    _remember(poll_id, version, snapshot)
+    return _build(snapshot)
+
+
+def get_poll_or_404(poll_id):
+    poll = get_poll(poll_id)
+    if poll is None:
+        raise Http404("No Poll matches the given query.")
+    return poll
+
+
+async def aget_poll_or_404(poll_id):
+    poll = await aget_poll(poll_id)
+    if poll is None:
+        raise Http404("No Poll matches the given query.")
+    return poll
+
+
+def _bump(poll_id):
+    try:
+        cache.incr(_version_key(poll_id))
+    except ValueError:
+        cache.set(_version_key(poll_id), time.time_ns(), None)
+    with _lock:
+        _local.pop(poll_id, None)
+
+
+def invalidate(poll_id):
+    """Retire cached metadata for a poll, now and again when the transaction commits."""
+    # The second bump stops a reader that loaded the pre-commit rows between
+    # the first bump and the commit from serving them
+    _bump(poll_id)
+    transaction.on_commit(lambda: _bump(poll_id))
+
+
+def stats():
+    """Per-process lookup counts by tier."""
+    with _lock:
+        return dict(_stats, local_entries=len(_local))
+
+
+def clear_local():
+    with _lock:
+        _local.clear()
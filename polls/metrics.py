@@ -0,0 +1,238 @@
+"""
+Per-view request metrics kept in process memory.
+
+RequestMetricsMiddleware records, for every request, the number of SQL
+queries, time spent in the database, time spent rendering templates and total
+latency, keyed by URL name. render_prometheus() exposes them in the Prometheus
+text format. Template time comes from InstrumentedDjangoTemplates, which the
+TEMPLATES setting uses in place of the stock DjangoTemplates backend.
+
+Queries are counted by record_query, installed on every database connection
+as it opens (polls.signals). It adds to the sample of the request in the
+current context, which asgiref carries into sync_to_async threads, so queries
+of async views count on whichever thread they run.
+
+Requests shed by polls.throttling are counted per scope and bucket key.
+
+POLLS_QUERY_BUDGETS maps URL names to a maximum query count. Requests over
+budget are logged; with POLLS_QUERY_BUDGET_STRICT they raise instead, so tests
+fail.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+from . import bloom, results_cache
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar('polls_request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Registry:
+    METRICS = {
+        'request_duration_seconds': ('Total request latency.', LATENCY_BUCKETS),
+        'db_duration_seconds': ('Time spent executing SQL.', LATENCY_BUCKETS),
+        'template_duration_seconds': ('Time spent rendering templates.', LATENCY_BUCKETS),
+        'db_queries': ('SQL queries per request.', QUERY_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self.budget_violations = {}
+        self.throttled = {}
+
+    def observe(self, view, sample):
+        with self._lock:
+            histograms = self._views.setdefault(
+                view, {name: Histogram(buckets) for name, (_, buckets) in self.METRICS.items()}
+            )
+            for name, value in sample.items():
+                histograms[name].observe(value)
+
+    def count_violation(self, view):
+        with self._lock:
+            self.budget_violations[view] = self.budget_violations.get(view, 0) + 1
+
+    def count_throttled(self, scope, key):
+        with self._lock:
+            self.throttled[scope, key] = self.throttled.get((scope, key), 0) + 1
+
+    def snapshot(self, view):
+        """Return ``{metric: (count, sum)}`` for a view, or None if unseen."""
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                return None
+            return {name: (h.count, h.total) for name, h in histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self.budget_violations.clear()
+            self.throttled.clear()
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in self.METRICS.items():
+                lines.append(f'# HELP polls_{name} {help_text}')
+                lines.append(f'# TYPE polls_{name} histogram')
+                for view, histograms in sorted(self._views.items()):
+                    h = histograms[name]
+                    for bound, count in zip(h.buckets, h.counts):
+                        lines.append(f'polls_{name}_bucket{{view="{view}",le="{bound}"}} {count}')
+                    lines.append(f'polls_{name}_bucket{{view="{view}",le="+Inf"}} {h.count}')
+                    lines.append(f'polls_{name}_sum{{view="{view}"}} {h.total:.6f}')
+                    lines.append(f'polls_{name}_count{{view="{view}"}} {h.count}')
+            lines.append('# HELP polls_query_budget_exceeded_total Requests over their query budget.')
+            lines.append('# TYPE polls_query_budget_exceeded_total counter')
+            for view, count in sorted(self.budget_violations.items()):
+                lines.append(f'polls_query_budget_exceeded_total{{view="{view}"}} {count}')
+            lines.append('# HELP polls_throttled_requests_total Requests rejected by a throttle, by the bucket that was empty.')
+            lines.append('# TYPE polls_throttled_requests_total counter')
+            for (scope, key), count in sorted(self.throttled.items()):
+                lines.append(f'polls_throttled_requests_total{{scope="{scope}",key="{key}"}} {count}')
+        cache_stats = results_cache.stats()
+        lines.append('# HELP polls_results_cache_requests_total Results cache lookups.')
+        lines.append('# TYPE polls_results_cache_requests_total counter')
+        lines.append(f'polls_results_cache_requests_total{{result="hit"}} {cache_stats["hits"]}')
+        lines.append(f'polls_results_cache_requests_total{{result="miss"}} {cache_stats["misses"]}')
+        precheck = bloom.stats()
+        lines.append('# HELP polls_vote_precheck_total Duplicate-vote filter checks by outcome.')
+        lines.append('# TYPE polls_vote_precheck_total counter')
+        for result, stat in (
+            ('negative', 'negatives'), ('positive', 'positives'), ('false_positive', 'false_positives'),
+            ('unbuilt', 'unbuilt'),
+        ):
+            lines.append(f'polls_vote_precheck_total{{result="{result}"}} {precheck[stat]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample['db_queries'] += 1
+        sample['db_duration_seconds'] += time.perf_counter() - started
+
+
+def instrument(connection):
+    """Count the connection's queries toward the request being measured, if any."""
+    if record_query not in connection.execute_wrappers:
+        # First, so execute_wrapper() blocks popping their own wrapper leave it in place
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def add_template_time(seconds):
+    sample = _current.get()
+    if sample is not None:
+        sample['template_duration_seconds'] += seconds
+
+
+class TimedTemplate:
+    """Wraps a backend template to add its render time to the current request."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            add_template_time(time.perf_counter() - started)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            # Stays async under ASGI, so async views aren't pushed onto a thread
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.measure(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with self.measure(request):
+            return await self.get_response(request)
+
+    @contextmanager
+    def measure(self, request):
+        sample = {'db_queries': 0, 'db_duration_seconds': 0.0, 'template_duration_seconds': 0.0}
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            _current.reset(token)
+        sample['request_duration_seconds'] = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unresolved'
+        registry.observe(view, sample)
+        self.check_budget(view, sample['db_queries'])
+
+    def check_budget(self, view, queries):
+        budget = getattr(settings, 'POLLS_QUERY_BUDGETS', {}).get(view)
+        if budget is None or queries <= budget:
+            return
+        registry.count_violation(view)
+        message = f'{view} ran {queries} queries (budget {budget})'
+        if getattr(settings, 'POLLS_QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-17 14:56
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_total_votes(apps, schema_editor):
+    Poll = apps.get_model('polls', 'Poll')
+    Option = apps.get_model('polls', 'Option')
+    totals = (
+        Option.objects.filter(poll=OuterRef('pk'))
+        .values('poll')
+        .annotate(total=Sum('vote_count'))
+        .values('total')
+    )
+    Poll.objects.update(total_votes=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_poll_category_poll_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='total_votes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='poll',
+            name='description',
+            field=models.TextField(),
+        ),
+        migrations.RunPython(backfill_total_votes, migrations.RunPython.noop),
+    ]
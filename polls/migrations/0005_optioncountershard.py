@@ -0,0 +1,26 @@
+# Generated by Django 6.0.2 on 2026-10-17 14:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0004_poll_total_votes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OptionCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='polls.option')),
+            ],
+            options={
+                'unique_together': {('option', 'shard')},
+            },
+        ),
+    ]
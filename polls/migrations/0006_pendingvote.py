@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_optioncountershard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='voted_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.CreateModel(
+            name='PendingVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('voted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_votes', to='polls.option')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_votes', to='polls.poll')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_votes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'poll')},
+            },
+        ),
+    ]
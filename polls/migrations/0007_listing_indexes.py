@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:40
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_pendingvote'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='poll',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'created_at'], name='poll_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at'], name='poll_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['user', 'voted_at'], name='vote_user_voted_at_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-17 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_listing_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['created_by', 'created_at'], name='poll_creator_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['poll', 'voted_at'], name='vote_poll_voted_at_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-17 16:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=6)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='polls.option')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='polls.poll')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['poll', 'granularity', 'bucket'], name='rollup_poll_bucket_idx')],
+                'unique_together': {('option', 'granularity', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# Search index tables for polls.search, which also maintains their contents
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        # Prefix indexes make 2 and 3 character prefix queries a lookup rather than a term scan
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE polls_poll_fts USING fts5("
+            "question, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        # Default ranking: a question match weighs ten times a description match
+        schema_editor.execute("INSERT INTO polls_poll_fts (polls_poll_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+        schema_editor.execute(
+            "INSERT INTO polls_poll_fts (rowid, question, description) SELECT id, question, description FROM polls_poll"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE polls_poll_search ("
+            "poll_id bigint PRIMARY KEY REFERENCES polls_poll (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute("CREATE INDEX polls_poll_search_document_idx ON polls_poll_search USING gin (document)")
+        schema_editor.execute(
+            "INSERT INTO polls_poll_search (poll_id, document) SELECT id, "
+            "setweight(to_tsvector('simple', question), 'A') || setweight(to_tsvector('simple', description), 'B') "
+            "FROM polls_poll"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS polls_poll_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS polls_poll_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_voterollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.2 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_poll_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voterollup',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='voterollup',
+            unique_together={('option', 'granularity', 'bucket', 'shard')},
+        ),
+    ]
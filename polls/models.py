@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 
@@ -22,7 +23,8 @@ class Poll(models.Model):
         default="technology",
         help_text="Select a category for this poll."
     )
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, so imported polls keep their original time
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     is_active = models.BooleanField(default=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -32,18 +34,31 @@ class Poll(models.Model):
         related_name='polls',
     )
 
-    def __str__(self):
-        # Return poll question for admin and shell display
-        return self.question
+    class Meta:
+        indexes = [
+            # poll_list: active polls, newest first, with and without a category.
+            # Partial rather than leading with is_active, because SQLite can't
+            # seek on the bare boolean column Django emits for is_active=True.
+            models.Index(
+                fields=['category', 'created_at'],
+                condition=models.Q(is_active=True),
+                name='poll_active_category_idx',
+            ),
+            models.Index(fields=['created_at'], condition=models.Q(is_active=True), name='poll_active_created_idx'),
+            # my_polls: a creator's polls, newest first
+            models.Index(fields=['created_by', 'created_at'], name='poll_creator_created_idx'),
+        ]
 
-    def total_votes(self):
-        # Aggregate total votes for all options
-        return self.options.aggregate(total=models.Sum('vote_count'))['total'] or 0
+    # Denormalized sum of option vote counts, maintained by views.vote in the
+    # same transaction as the option counter. Repair drift with reconcile_votes.
+    total_votes = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
+        # Return poll question for admin and shell display
         return self.question
 
-    def total_votes(self):
+    def count_votes(self):
+        # Aggregate total votes for all options (authoritative, one query)
         return self.options.aggregate(total=models.Sum('vote_count'))['total'] or 0
 
 
@@ -55,21 +70,92 @@ class Option(models.Model):
 
     def __str__(self):
         return self.text
+
+    @property
+    def current_count(self):
+        # Folded count plus unfolded shard deltas loaded by polls.counters
+        return self.vote_count + getattr(self, 'unfolded_votes', 0)
+
     #calculate percentage of votes for this option
     def percentage(self, total_votes): 
         if total_votes == 0:
             return 0
-        return round((self.vote_count / total_votes) * 100, 1)
+        return round((self.current_count / total_votes) * 100, 1)
+
+
+class OptionCounterShard(models.Model):
+    # One of N counter rows per option used when POLLS_VOTE_COUNTER_SHARDS > 0,
+    # so concurrent voters on a hot option don't queue on a single row lock.
+    option = models.ForeignKey(Option, on_delete=models.CASCADE, related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('option', 'shard')
+
+    def __str__(self):
+        return f"{self.option_id}[{self.shard}] = {self.count}"
 
 
 class Vote(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='votes')
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='votes')
     option = models.ForeignKey(Option, on_delete=models.CASCADE, related_name='votes')
-    voted_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, so flushed and imported votes keep their original time
+    voted_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         unique_together = ('user', 'poll')
+        indexes = [
+            # vote_history: a user's votes, newest first
+            models.Index(fields=['user', 'voted_at'], name='vote_user_voted_at_idx'),
+            # poll_results_json Last-Modified: latest vote on a poll
+            models.Index(fields=['poll', 'voted_at'], name='vote_poll_voted_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} -> {self.poll.question}"
+
+
+class PendingVote(models.Model):
+    # Vote accepted in queued ingestion mode, waiting for flush_votes to move
+    # it into Vote. The unique constraint rejects double votes up front.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='pending_votes')
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='pending_votes')
+    option = models.ForeignKey(Option, on_delete=models.CASCADE, related_name='pending_votes')
+    voted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('user', 'poll')
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.poll_id} (pending)"
+
+
+class VoteRollup(models.Model):
+    # Votes per option per time bucket, maintained on vote by polls.rollups
+    # so charts over time never scan Vote. Rebuild with backfill_vote_rollups.
+    # Sharded like OptionCounterShard when POLLS_VOTE_COUNTER_SHARDS > 0;
+    # readers sum the shards of a bucket.
+    GRANULARITY_CHOICES = [
+        ("minute", "Minute"),
+        ("hour", "Hour"),
+        ("day", "Day"),
+    ]
+
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='rollups')
+    option = models.ForeignKey(Option, on_delete=models.CASCADE, related_name='rollups')
+    granularity = models.CharField(max_length=6, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    shard = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('option', 'granularity', 'bucket', 'shard')
+        indexes = [
+            # Timeline reads: one poll at one granularity over a time range
+            models.Index(fields=['poll', 'granularity', 'bucket'], name='rollup_poll_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.option_id} {self.granularity} {self.bucket:%Y-%m-%d %H:%M}[{self.shard}] = {self.count}"
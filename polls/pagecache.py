@@ -0,0 +1,263 @@
+"""
+Full-page cache of poll_list and poll_results for anonymous visitors.
+
+AnonymousPageCacheMiddleware answers GET requests for the views in
+CACHED_VIEWS from the cache backend, before the session is loaded or the
+view runs. Only requests without a session or messages cookie are looked
+up, so logged-in users, and visitors with messages waiting, always get a
+freshly rendered page. A rendered page is stored only if it is a 200 that
+sets no cookies, used no CSRF token and has no Cache-Control of its own.
+
+Keys are the path plus the query string reduced to the parameters the view
+reads, in a fixed order; requests with any other parameter aren't cached.
+Each entry holds the body and its gzip-compressed form, served to clients
+that accept gzip. Cached pages carry a weak ETag (If-None-Match is answered
+with 304 from the cache), ``Vary: Accept-Encoding, Cookie`` and
+``Cache-Control: public, max-age=0, s-maxage=N``: a front proxy may reuse
+them for POLLS_PAGE_CACHE_PROXY_MAX_AGE seconds, browsers revalidate.
+Other responses of these views are marked private.
+
+Invalidation goes through versions, as in results_cache. Saving or deleting
+a poll or option (creating, deactivating, deleting) retires every listing
+page and that poll's results page; a vote retires the poll's results page,
+whose key also includes the results_cache version, so queue flushes and
+counter folds retire it too. Listing pages are not retired by votes: their
+vote totals may lag by up to POLLS_PAGE_CACHE_TTL seconds, as they already
+do behind sharded counters.
+"""
+import hashlib
+import re
+import time
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.utils.text import compress_string
+
+from . import results_cache
+
+# URL name -> query parameters its view reads
+CACHED_VIEWS = {
+    'poll_list': ('category', 'cursor'),
+    'poll_list_more': ('category', 'cursor'),
+    'poll_results': (),
+}
+LIST_VIEWS = ('poll_list', 'poll_list_more')
+
+# Recomputed for each variant served, or diagnostics that only describe the
+# render that filled the entry
+_VARIANT_HEADERS = {'content-length', 'content-encoding', 'etag', 'x-results-cache', 'x-page-cache'}
+
+_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def enabled():
+    return getattr(settings, 'POLLS_PAGE_CACHE_ENABLED', False)
+
+
+def _ttl():
+    return getattr(settings, 'POLLS_PAGE_CACHE_TTL', 30)
+
+
+def _version_key(scope):
+    return f'polls:page-version:{scope}'
+
+
+def _bump(scope):
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        # Seeded from the clock so an evicted version never revives old entries
+        cache.set(_version_key(scope), time.time_ns(), None)
+
+
+def _version(scope):
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def _aversion(scope):
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _versions(match):
+    if match.url_name in LIST_VIEWS:
+        return [_version('list')]
+    poll_id = match.kwargs['id']
+    return [_version(f'poll:{poll_id}'), results_cache.get_version(poll_id)]
+
+
+async def _aversions(match):
+    if match.url_name in LIST_VIEWS:
+        return [await _aversion('list')]
+    poll_id = match.kwargs['id']
+    return [await _aversion(f'poll:{poll_id}'), await results_cache.aget_version(poll_id)]
+
+
+def _retire(*scopes):
+    # Now, and again on commit so a page rendered from the pre-commit rows
+    # in between isn't served under the current version
+    def bump():
+        for scope in scopes:
+            _bump(scope)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def invalidate(poll_id):
+    """Retire every listing page and the results page of a poll."""
+    _retire('list', f'poll:{poll_id}')
+
+
+def invalidate_results(poll_id):
+    """Retire the results page of a poll, e.g. after a vote."""
+    _retire(f'poll:{poll_id}')
+
+
+def invalidate_listings():
+    """Retire every listing page, e.g. after polls were written in bulk."""
+    _retire('list')
+
+
+def _match(request):
+    """The URL match of a request the cache may answer, or None."""
+    if request.method != 'GET' or not enabled():
+        return None
+    cookies = request.COOKIES
+    if settings.SESSION_COOKIE_NAME in cookies or CookieStorage.cookie_name in cookies:
+        return None
+    try:
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+    except Resolver404:
+        return None
+    params = CACHED_VIEWS.get(match.url_name)
+    if params is None or not set(request.GET).issubset(params):
+        return None
+    return match
+
+
+def _key(request, match, versions):
+    params = [(name, value) for name in CACHED_VIEWS[match.url_name] for value in request.GET.getlist(name)]
+    url = f'{request.path}?{urlencode(params)}'
+    return f'polls:page:{hashlib.md5(url.encode()).hexdigest()}:{".".join(map(str, versions))}'
+
+
+def _storable(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        and not response.has_header('Cache-Control')
+    )
+
+
+def _entry(response):
+    body = response.content
+    compressed = compress_string(body)
+    return {
+        'headers': [(name, value) for name, value in response.items() if name.lower() not in _VARIANT_HEADERS],
+        'body': body,
+        'gzip': compressed if len(compressed) < len(body) else None,
+        'etag': f'W/"{hashlib.md5(body).hexdigest()}"',
+    }
+
+
+def _shared(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(
+        response, public=True, max_age=0, s_maxage=getattr(settings, 'POLLS_PAGE_CACHE_PROXY_MAX_AGE', 10),
+    )
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+    return response
+
+
+def _respond(request, entry, outcome):
+    if entry['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+        return _shared(HttpResponseNotModified(), entry['etag'])
+    gzipped = entry['gzip'] is not None and _accepts_gzip.search(request.headers.get('Accept-Encoding', ''))
+    response = HttpResponse(entry['gzip'] if gzipped else entry['body'])
+    for name, value in entry['headers']:
+        response[name] = value
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    response['Content-Length'] = str(len(response.content))
+    response['X-Page-Cache'] = outcome
+    return _shared(response, entry['etag'])
+
+
+def _private(request, response):
+    # Pages of these views rendered for one visitor must not reach a shared cache
+    match = getattr(request, 'resolver_match', None)
+    if not enabled() or match is None or match.url_name not in CACHED_VIEWS:
+        return response
+    if not response.has_header('Cache-Control'):
+        patch_cache_control(response, private=True)
+        patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Serve and store anonymous pages of CACHED_VIEWS. Sits outside the
+    session, CSRF and messages middleware, so it sees the cookies they set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        match = _match(request)
+        if match is None:
+            return _private(request, self.get_response(request))
+        key = _key(request, match, _versions(match))
+        entry = cache.get(key)
+        if entry is not None:
+            # So request metrics are recorded under the view's name
+            request.resolver_match = match
+            return _respond(request, entry, 'hit')
+        response = self.get_response(request)
+        if not _storable(request, response):
+            return _private(request, response)
+        entry = _entry(response)
+        cache.set(key, entry, _ttl())
+        return _respond(request, entry, 'miss')
+
+    async def __acall__(self, request):
+        match = _match(request)
+        if match is None:
+            return _private(request, await self.get_response(request))
+        key = _key(request, match, await _aversions(match))
+        entry = await cache.aget(key)
+        if entry is not None:
+            request.resolver_match = match
+            return _respond(request, entry, 'hit')
+        response = await self.get_response(request)
+        if not _storable(request, response):
+            return _private(request, response)
+        entry = _entry(response)
+        await cache.aset(key, entry, _ttl())
+        return _respond(request, entry, 'miss')
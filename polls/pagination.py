@@ -0,0 +1,80 @@
+"""
+Keyset (cursor) pagination for the listing views.
+
+Rows are ordered newest first on ``(field, id)`` and each page continues with
+``WHERE (field, id) < (last field, last id)``. With an index on the field a
+page deep in the list costs the same as the first one, unlike OFFSET. Cursors
+are opaque URL-safe strings holding the last row's field value and id.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+class Page:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(value, pk)`` or None if the cursor is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(value), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _page_queryset(queryset, cursor, field, per_page):
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        value, pk = position
+        # The redundant ``<=`` bound lets the database use the index as a range scan
+        queryset = queryset.filter(
+            Q(**{f'{field}__lte': value}),
+            Q(**{f'{field}__lt': value}) | Q(pk__lt=pk),
+        )
+    return queryset[:per_page + 1]
+
+
+def _page(rows, field, per_page):
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+    return Page(rows, next_cursor)
+
+
+def paginate(queryset, cursor=None, field='created_at', per_page=None):
+    """Return the page of ``queryset`` that follows ``cursor`` (first page if None)."""
+    per_page = per_page or getattr(settings, 'POLLS_PAGE_SIZE', 20)
+    rows = list(_page_queryset(queryset, cursor, field, per_page))
+    return _page(rows, field, per_page)
+
+
+async def apaginate(queryset, cursor=None, field='created_at', per_page=None):
+    """Async paginate()."""
+    per_page = per_page or getattr(settings, 'POLLS_PAGE_SIZE', 20)
+    rows = [row async for row in _page_queryset(queryset, cursor, field, per_page)]
+    return _page(rows, field, per_page)
@@ -0,0 +1,118 @@
+"""
+Read-replica routing.
+
+Writes always go to the primary (``default``). Reads of polls models go to
+the primary too, except inside views decorated with ``@read_from_replica``,
+which read from the POLLS_REPLICA_DATABASE alias when it is configured.
+Auth and session reads are never routed, so a login is never judged against
+a lagging copy.
+
+Replicas lag. Views decorated with ``@pins_primary`` set a short-lived
+cookie after a successful POST, and a browser carrying it reads from the
+primary for POLLS_REPLICA_PIN_SECONDS, so a user sees their own vote or
+poll straight away. Cache fills (metadata, results, the voted index) read
+the primary via ``primary()``: their entries outlive replica lag, so one
+filled from a stale replica would keep serving stale data.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'polls_primary'
+
+_read_alias = contextvars.ContextVar('polls_read_alias', default=None)
+
+
+def replica_alias():
+    """The configured replica alias, or None when there is no replica."""
+    alias = getattr(settings, 'POLLS_REPLICA_DATABASE', 'replica')
+    return alias if alias in connections.settings else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'polls':
+            return None
+        # Explicit, so instances loaded from the replica don't keep reading it
+        # through their related managers once the view is done
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside this block, even in a replica view."""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def is_pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+
+def read_from_replica(view):
+    """Route the view's polls reads to the replica, unless the browser is pinned."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            alias = replica_alias()
+            if alias is None or is_pinned(request):
+                return await view(request, *args, **kwargs)
+            # The async ORM runs queries in a thread that inherits this context
+            token = _read_alias.set(alias)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = replica_alias()
+        if alias is None or is_pinned(request):
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(alias)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+def _pin(request, response):
+    if request.method == 'POST' and response.status_code < 400 and replica_alias() is not None:
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=getattr(settings, 'POLLS_REPLICA_PIN_SECONDS', 10),
+            httponly=True, samesite='Lax',
+        )
+    return response
+
+
+def pins_primary(view):
+    """Pin the browser to the primary for a while after a successful POST."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            return _pin(request, await view(request, *args, **kwargs))
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return _pin(request, view(request, *args, **kwargs))
+    return wrapper
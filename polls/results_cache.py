@@ -0,0 +1,117 @@
+"""
+Versioned cache of the shared part of the poll_results page.
+
+Entries are keyed by poll id plus a per-poll version number. Anything that
+changes the numbers (a vote, a queue flush, deactivating or deleting the poll)
+calls bump(). Old entries become unreachable and are never overwritten, so a
+reader that loaded data before the change can't put stale numbers back under
+the current key. The requesting user's own vote is not cached. Fills read
+the primary database, never a lagging replica.
+
+Versions are only meaningful to the cache they live in; with a per-process
+cache each worker numbers a poll's versions differently. Validators sent to
+clients are therefore hashes of the body, never versions.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import replicas
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _version_key(poll_id):
+    return f'polls:results-version:{poll_id}'
+
+
+def get_version(poll_id):
+    key = _version_key(poll_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted version key never revives old entries
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(poll_id):
+    key = _version_key(poll_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump(poll_id):
+    """Invalidate cached results for a poll."""
+    try:
+        cache.incr(_version_key(poll_id))
+    except ValueError:
+        cache.set(_version_key(poll_id), time.time_ns(), None)
+
+
+def get_results(poll_id, build):
+    """Return ``(results, hit)``, calling ``build()`` to fill the cache on a miss."""
+    key = f'polls:results:{poll_id}:{get_version(poll_id)}'
+    results = cache.get(key)
+    hit = results is not None
+    if not hit:
+        with replicas.primary():
+            results = build()
+        cache.set(key, results, getattr(settings, 'POLLS_RESULTS_CACHE_TTL', 300))
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+    return results, hit
+
+
+async def aget_results(poll_id, build):
+    """Async get_results(); ``build`` is a coroutine function."""
+    key = f'polls:results:{poll_id}:{await aget_version(poll_id)}'
+    results = await cache.aget(key)
+    hit = results is not None
+    if not hit:
+        with replicas.primary():
+            results = await build()
+        await cache.aset(key, results, getattr(settings, 'POLLS_RESULTS_CACHE_TTL', 300))
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+    return results, hit
+
+
+def get_document(poll_id, render):
+    """
+    Return ``(body, etag)`` for a serialized form of the results, calling
+    ``render()`` for the body bytes once per version. The strong ETag is a
+    hash of the body, so every worker gives the same body the same ETag.
+    """
+    key = f'polls:results-document:{poll_id}:{get_version(poll_id)}'
+    cached = cache.get(key)
+    if cached is None:
+        body = render()
+        cached = (body, f'"{hashlib.md5(body).hexdigest()}"')
+        cache.set(key, cached, getattr(settings, 'POLLS_RESULTS_CACHE_TTL', 300))
+    return cached
+
+
+def get_last_modified(poll_id, load):
+    """Time of the latest vote, loaded once per version (may be None)."""
+    key = f'polls:results-modified:{poll_id}:{get_version(poll_id)}'
+    cached = cache.get(key)
+    if cached is None:
+        # Wrapped in a tuple so a poll without votes is cached too
+        with replicas.primary():
+            cached = (load(),)
+        cache.set(key, cached, getattr(settings, 'POLLS_RESULTS_CACHE_TTL', 300))
+    return cached[0]
+
+
+def stats():
+    """Hit/miss counts for this process."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,162 @@
+"""
+Per-option vote counts in minute, hour and day buckets.
+
+Every recorded vote adds one to its option's bucket at each granularity, in
+the same transaction as the vote, so ``VoteRollup`` always matches ``Vote``.
+With ``POLLS_VOTE_COUNTER_SHARDS = N`` (N > 0) each bucket is split over N
+rows and a vote picks one at random, as the vote counters do, so voters on a
+hot option in the same minute rarely wait on the same row lock. Readers sum
+the shards of a bucket.
+Timelines read only rollup rows: a month of hourly data is ~720 rows per
+option however many votes the poll has. Buckets are truncated in UTC.
+``rebuild()`` (the backfill_vote_rollups command) recomputes them from Vote
+rows, and ``prune()`` drops old minute buckets.
+"""
+import random
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from . import counters
+from .models import Vote, VoteRollup
+
+GRANULARITIES = ('minute', 'hour', 'day')
+# Default window per granularity when a timeline doesn't ask for one
+WINDOWS = {'minute': timedelta(hours=6), 'hour': timedelta(days=7), 'day': timedelta(days=365)}
+
+
+def truncate(moment, granularity):
+    moment = moment.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if granularity in ('hour', 'day'):
+        moment = moment.replace(minute=0)
+    if granularity == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def add(votes, shards=None):
+    """
+    Count ``votes`` (``(poll_id, option_id, voted_at)`` tuples) into their
+    buckets. Call inside the transaction that records them.
+    """
+    shards = counters.shard_count() if shards is None else shards
+    shard = random.randrange(shards) if shards > 0 else 0
+    counts = Counter(
+        (poll_id, option_id, granularity, truncate(voted_at, granularity), shard)
+        for poll_id, option_id, voted_at in votes
+        for granularity in GRANULARITIES
+    )
+    if not counts:
+        return
+    if connection.vendor in ('sqlite', 'postgresql'):
+        _upsert(counts)
+        return
+    for (poll_id, option_id, granularity, bucket, shard), n in counts.items():
+        rows = VoteRollup.objects.filter(option_id=option_id, granularity=granularity, bucket=bucket, shard=shard)
+        if rows.update(count=F('count') + n):
+            continue
+        try:
+            with transaction.atomic():
+                VoteRollup.objects.create(
+                    poll_id=poll_id, option_id=option_id, granularity=granularity, bucket=bucket, shard=shard, count=n,
+                )
+        except IntegrityError:
+            rows.update(count=F('count') + n)
+
+
+def _upsert(counts, rows_per_statement=150):
+    # One statement per chunk of buckets instead of an update-then-create per
+    # bucket; chunks keep the parameter count under old SQLite limits
+    qn = connection.ops.quote_name
+    table = qn(VoteRollup._meta.db_table)
+    poll, option, granularity, bucket, shard, count = (
+        qn(VoteRollup._meta.get_field(name).column)
+        for name in ('poll', 'option', 'granularity', 'bucket', 'shard', 'count')
+    )
+    items = list(counts.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), rows_per_statement):
+            chunk = items[start:start + rows_per_statement]
+            params = []
+            for (poll_id, option_id, name, moment, number), n in chunk:
+                params += [poll_id, option_id, name, connection.ops.adapt_datetimefield_value(moment), number, n]
+            cursor.execute(
+                f'INSERT INTO {table} ({poll}, {option}, {granularity}, {bucket}, {shard}, {count}) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(chunk))} '
+                f'ON CONFLICT ({option}, {granularity}, {bucket}, {shard}) '
+                f'DO UPDATE SET {count} = {table}.{count} + excluded.{count}',
+                params,
+            )
+
+
+def rebuild(poll_ids=None, batch_size=5000):
+    """Recompute rollups from Vote rows. Returns the number of rollup rows written."""
+    written = 0
+    with transaction.atomic():
+        rollups = VoteRollup.objects.all()
+        votes = Vote.objects.all()
+        if poll_ids:
+            rollups = rollups.filter(poll_id__in=poll_ids)
+            votes = votes.filter(poll_id__in=poll_ids)
+        rollups.delete()
+        for granularity in GRANULARITIES:
+            buckets = (
+                votes.annotate(bucket=Trunc('voted_at', granularity, tzinfo=dt_timezone.utc))
+                .values('poll_id', 'option_id', 'bucket')
+                .annotate(n=Count('pk'))
+                .order_by()
+            )
+            batch = []
+            for row in buckets.iterator(chunk_size=batch_size):
+                batch.append(VoteRollup(
+                    poll_id=row['poll_id'], option_id=row['option_id'],
+                    granularity=granularity, bucket=row['bucket'], count=row['n'],
+                ))
+                if len(batch) >= batch_size:
+                    VoteRollup.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            VoteRollup.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def prune(now=None):
+    """Delete minute buckets older than POLLS_ROLLUP_MINUTE_RETENTION_DAYS. Returns rows deleted."""
+    days = getattr(settings, 'POLLS_ROLLUP_MINUTE_RETENTION_DAYS', 7)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    deleted, _ = VoteRollup.objects.filter(granularity='minute', bucket__lt=cutoff).delete()
+    return deleted
+
+
+def timeline(poll, granularity='hour', since=None, until=None):
+    """
+    Read ``poll``'s rollups between ``since`` and ``until`` (default: the
+    granularity's window up to now). Buckets come back in time order, empty
+    ones omitted, each as ``{'start': datetime, 'counts': {option_id: n},
+    'total': n}``.
+    """
+    until = until or timezone.now()
+    since = since or until - WINDOWS[granularity]
+    rows = (
+        VoteRollup.objects.filter(
+            poll=poll, granularity=granularity,
+            bucket__gte=truncate(since, granularity), bucket__lte=until,
+        )
+        .values('bucket', 'option_id')
+        .annotate(n=Sum('count'))
+        .order_by('bucket')
+        .values_list('bucket', 'option_id', 'n')
+    )
+    buckets = []
+    for bucket, option_id, n in rows:
+        if not buckets or buckets[-1]['start'] != bucket:
+            buckets.append({'start': bucket, 'counts': {}, 'total': 0})
+        buckets[-1]['counts'][option_id] = n
+        buckets[-1]['total'] += n
+    return {'since': since, 'until': until, 'granularity': granularity, 'buckets': buckets}
@@ -0,0 +1,170 @@
+"""
+Full-text search over the questions and descriptions of active polls.
+
+On SQLite the text is kept in an FTS5 table, polls_poll_fts, whose rowid is
+the poll id; on PostgreSQL in polls_poll_search, one tsvector per poll under a
+GIN index. Both are created by migration 0010. Every term is matched as a
+prefix and all terms must match. Results are ranked with the question weighed
+above the description (bm25 on SQLite, ts_rank on PostgreSQL). Other backends
+fall back to an unindexed icontains scan, newest first.
+
+Only the text is indexed: the active flag and category are read from
+polls_poll when searching, so (de)activating a poll needs no reindex.
+Signals (polls.signals) reindex a poll when it is saved or deleted through the
+ORM. ``bulk_create()`` and queryset ``update()`` of the text bypass signals;
+call index() after them, or rebuild with ``manage.py rebuild_search_index``.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Count, Q
+
+from .models import Poll
+from .pagination import Page
+
+FTS_TABLE = 'polls_poll_fts'
+TSV_TABLE = 'polls_poll_search'
+# tsvector of a poll, with the question in the higher-ranked weight class
+TSV_DOCUMENT = "setweight(to_tsvector('simple', question), 'A') || setweight(to_tsvector('simple', description), 'B')"
+MAX_TERMS = 8
+BATCH_SIZE = 500
+
+# Letters and digits only, so user input can't form FTS5 or tsquery operators
+_TERM = re.compile(r'[^\W_]+')
+
+
+def terms(text):
+    """Lower-cased search terms of ``text``, at most MAX_TERMS."""
+    return _TERM.findall(text.lower())[:MAX_TERMS]
+
+
+def _indexed(connection):
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _matches(connection, words, category=None):
+    """``(FROM ... WHERE sql, params, ORDER BY sql)`` for active polls matching every word."""
+    polls = Poll._meta.db_table
+    if connection.vendor == 'sqlite':
+        sql = f'FROM {FTS_TABLE} JOIN {polls} p ON p.id = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH %s'
+        params = [' '.join(f'"{word}"*' for word in words)]
+        order = f'{FTS_TABLE}.rank, p.id DESC'
+    else:
+        sql = (
+            f"FROM {TSV_TABLE} s JOIN {polls} p ON p.id = s.poll_id, to_tsquery('simple', %s) query "
+            "WHERE s.document @@ query"
+        )
+        params = [' & '.join(f'{word}:*' for word in words)]
+        order = 'ts_rank(s.document, query) DESC, p.id DESC'
+    sql += ' AND p.is_active = %s'
+    params.append(True)
+    if category:
+        sql += ' AND p.category = %s'
+        params.append(category)
+    return sql, params, order
+
+
+def unindexed_queryset(words, category=None):
+    """Active polls containing every word, found by scanning; for backends without an index."""
+    queryset = Poll.objects.filter(is_active=True)
+    for word in words:
+        queryset = queryset.filter(Q(question__icontains=word) | Q(description__icontains=word))
+    if category:
+        queryset = queryset.filter(category=category)
+    return queryset
+
+
+def ranked_ids(text, category=None, offset=0, limit=20):
+    """Ids of the active polls matching ``text``, best match first."""
+    words = terms(text)
+    if not words:
+        return []
+    connection = connections[router.db_for_read(Poll)]
+    if not _indexed(connection):
+        queryset = unindexed_queryset(words, category).order_by('-created_at', '-pk')
+        return list(queryset.values_list('pk', flat=True)[offset:offset + limit])
+    sql, params, order = _matches(connection, words, category)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT p.id {sql} ORDER BY {order} LIMIT %s OFFSET %s', [*params, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def facets(text):
+    """``{category: number of active polls matching text}``, across all categories."""
+    words = terms(text)
+    if not words:
+        return {}
+    connection = connections[router.db_for_read(Poll)]
+    if not _indexed(connection):
+        rows = unindexed_queryset(words).values_list('category').annotate(n=Count('pk')).order_by()
+        return dict(rows)
+    sql, params, _ = _matches(connection, words)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT p.category, COUNT(*) {sql} GROUP BY p.category', params)
+        return dict(cursor.fetchall())
+
+
+def page(text, category=None, cursor=None, per_page=None):
+    """
+    One page of ranked results as a pagination.Page of polls with their
+    creators. Rank order has no keyset, so the cursor is the row offset.
+    """
+    per_page = per_page or getattr(settings, 'POLLS_PAGE_SIZE', 20)
+    offset = int(cursor) if cursor and cursor.isdigit() else 0
+    ids = ranked_ids(text, category, offset, per_page + 1)
+    next_cursor = None
+    if len(ids) > per_page:
+        ids = ids[:per_page]
+        next_cursor = str(offset + per_page)
+    polls = Poll.objects.select_related('created_by').in_bulk(ids)
+    return Page([polls[pk] for pk in ids if pk in polls], next_cursor)
+
+
+def index(poll_ids):
+    """(Re)index the text of ``poll_ids``; ids of polls that no longer exist are dropped."""
+    connection = connections[router.db_for_write(Poll)]
+    if not _indexed(connection):
+        return
+    poll_ids = list(poll_ids)
+    polls = Poll._meta.db_table
+    with connection.cursor() as cursor:
+        for start in range(0, len(poll_ids), BATCH_SIZE):
+            batch = poll_ids[start:start + BATCH_SIZE]
+            if connection.vendor == 'sqlite':
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', batch)
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, question, description) '
+                    f'SELECT id, question, description FROM {polls} WHERE id IN ({placeholders})',
+                    batch,
+                )
+            else:
+                cursor.execute(f'DELETE FROM {TSV_TABLE} WHERE poll_id = ANY(%s)', [batch])
+                cursor.execute(
+                    f'INSERT INTO {TSV_TABLE} (poll_id, document) '
+                    f'SELECT id, {TSV_DOCUMENT} FROM {polls} WHERE id = ANY(%s)',
+                    [batch],
+                )
+
+
+def rebuild():
+    """Reindex every poll in one pass. Returns the number of polls indexed."""
+    connection = connections[router.db_for_write(Poll)]
+    if not _indexed(connection):
+        return 0
+    polls = Poll._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, question, description) SELECT id, question, description FROM {polls}'
+            )
+            count = cursor.rowcount
+            # Merge the index into one b-tree per term, the fastest layout to query
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        else:
+            cursor.execute(f'DELETE FROM {TSV_TABLE}')
+            cursor.execute(f'INSERT INTO {TSV_TABLE} (poll_id, document) SELECT id, {TSV_DOCUMENT} FROM {polls}')
+            count = cursor.rowcount
+    return count
@@ -0,0 +1,49 @@
+"""Cache invalidation, search index and query metrics hooks, connected in PollsConfig.ready()."""
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metadata, metrics, pagecache, search, users, voted
+from .models import Option, Poll, Vote
+
+
+@receiver([post_save, post_delete], sender=Poll)
+def poll_changed(sender, instance, **kwargs):
+    metadata.invalidate(instance.pk)
+    pagecache.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Poll)
+def poll_text_changed(sender, instance, update_fields=None, **kwargs):
+    # Saves limited to other fields (counters, flags) leave the text alone
+    if update_fields is not None and not {'question', 'description'} & set(update_fields):
+        return
+    search.index([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Option)
+def option_changed(sender, instance, **kwargs):
+    metadata.invalidate(instance.poll_id)
+    pagecache.invalidate(instance.poll_id)
+
+
+# post_save only: a post_delete receiver would stop cascades from deleting
+# votes in bulk. Listing pages keep their totals until they expire.
+@receiver(post_save, sender=Vote)
+def vote_changed(sender, instance, **kwargs):
+    pagecache.invalidate_results(instance.poll_id)
+    # After commit, so a load that read the rows before it is retired too
+    transaction.on_commit(lambda: voted.forget([instance.user_id]))
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    # Profile edits, password changes and last_login updates alike
+    users.invalidate(instance.pk)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    metrics.instrument(connection)
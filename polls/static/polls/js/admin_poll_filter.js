@@ -0,0 +1,15 @@
+(function ($) {
+  // Apply the poll picked in the changelist's autocomplete filter
+  $(function () {
+    $("select.poll-filter").on("change", function () {
+      var params = new URLSearchParams(window.location.search);
+      params.delete("p");
+      if (this.value) {
+        params.set(this.dataset.parameter, this.value);
+      } else {
+        params.delete(this.dataset.parameter);
+      }
+      window.location.search = params.toString();
+    });
+  });
+})(django.jQuery);
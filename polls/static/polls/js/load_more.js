@@ -0,0 +1,50 @@
+(function () {
+  // Replace the "Load more" placeholder with the next page fragment
+  function load(placeholder) {
+    var link = placeholder.querySelector(".load-more");
+    if (placeholder.dataset.loading) {
+      return;
+    }
+    placeholder.dataset.loading = "true";
+    fetch(link.dataset.fragmentUrl, { credentials: "same-origin" })
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.statusText);
+        }
+        return response.text();
+      })
+      .then(function (html) {
+        placeholder.insertAdjacentHTML("beforebegin", html);
+        placeholder.remove();
+        watch();
+      })
+      .catch(function () {
+        // Fall back to the full-page link
+        window.location.href = link.href;
+      });
+  }
+
+  function watch() {
+    var placeholder = document.querySelector("[data-load-more]");
+    if (!placeholder) {
+      return;
+    }
+    placeholder.querySelector(".load-more").addEventListener("click", function (event) {
+      if (!placeholder.dataset.loading) {
+        event.preventDefault();
+        load(placeholder);
+      }
+    });
+    if ("IntersectionObserver" in window) {
+      var observer = new IntersectionObserver(function (entries) {
+        if (entries[0].isIntersecting) {
+          observer.disconnect();
+          load(placeholder);
+        }
+      });
+      observer.observe(placeholder);
+    }
+  }
+
+  watch();
+})();
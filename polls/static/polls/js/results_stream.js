@@ -0,0 +1,23 @@
+(function () {
+  const table = document.getElementById("results-table");
+  if (!table || !window.EventSource) {
+    return;
+  }
+  const total = document.getElementById("total-votes");
+  const source = new EventSource(table.dataset.streamUrl);
+
+  // Each frame carries the full counts for the poll, so applying it is idempotent
+  source.onmessage = function (event) {
+    var data = JSON.parse(event.data);
+    total.textContent = data.total_votes;
+    data.options.forEach(function (option) {
+      var row = table.querySelector('tr[data-option-id="' + option.id + '"]');
+      if (!row) {
+        return;
+      }
+      row.querySelector(".option-votes").textContent = option.votes;
+      row.querySelector(".option-percentage").textContent = option.percentage + "%";
+      row.querySelector(".progress-fill").style.width = option.percentage + "%";
+    });
+  };
+})();
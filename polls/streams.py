@@ -0,0 +1,83 @@
+"""
+In-process fan-out of poll result updates for Server-Sent Events.
+
+Each poll with subscribers gets one hub with one watcher task. The watcher
+checks the results cache version every POLLS_STREAM_INTERVAL seconds and, when
+it has moved, loads the results once and hands them to every subscriber. A
+subscriber holds at most one pending frame, so a burst of votes collapses into
+one update per interval and slow clients only ever get the latest numbers.
+
+Hubs live in the server process, so votes cast through other processes are
+only seen when CACHES points at a shared backend.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+
+from . import results_cache
+
+_hubs = {}
+
+
+class PollHub:
+    def __init__(self, poll_id, load):
+        self.poll_id = poll_id
+        self.load = load
+        self.subscribers = set()
+        self.latest = None
+        self.task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers.add(queue)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._watch())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, frame):
+        self.latest = frame
+        for queue in self.subscribers:
+            if queue.full():
+                # Replace the unsent frame instead of queueing behind it
+                queue.get_nowait()
+            queue.put_nowait(frame)
+
+    async def _watch(self):
+        interval = getattr(settings, 'POLLS_STREAM_INTERVAL', 1.0)
+        seen = None
+        try:
+            while self.subscribers:
+                version = await sync_to_async(results_cache.get_version)(self.poll_id)
+                if version != seen:
+                    seen = version
+                    try:
+                        payload = await sync_to_async(self.load)(self.poll_id)
+                    except Http404:
+                        # Poll deleted: None tells subscribers to close
+                        self.publish(None)
+                        break
+                    self.publish((version, payload))
+                await asyncio.sleep(interval)
+        finally:
+            self.task = None
+            if _hubs.get(self.poll_id) is self:
+                del _hubs[self.poll_id]
+
+
+def get_hub(poll_id, load):
+    """Return the hub for ``poll_id``, creating it on first subscription."""
+    hub = _hubs.get(poll_id)
+    if hub is None:
+        hub = _hubs[poll_id] = PollHub(poll_id, load)
+    return hub
+
+
+def hub_count():
+    return len(_hubs)
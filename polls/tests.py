@@ -1,6 +1,38 @@
-from django.test import TestCase, Client
-from django.urls import reverse
-from .models import Poll, Option
+import asyncio
+import csv
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import Sum
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from polling_system import urls as project_urls
+from . import (
+    analytics, benchmarks, bloom, counters, ingest, metadata, pagecache, replicas, results_cache, rollups, search,
+    streams, throttling, urls as polls_urls, users, voted,
+)
+from .metrics import QueryBudgetExceeded, registry
+from .pagination import decode_cursor, encode_cursor, paginate
+from .models import Poll, Option, OptionCounterShard, PendingVote, Vote, VoteRollup
 
 
 class PollModelTest(TestCase):
@@ -15,12 +47,13 @@ class PollModelTest(TestCase):
     def test_option_str(self):
         self.assertEqual(str(self.opt1), "Option A")
 
-    def test_total_votes(self):
-        self.assertEqual(self.poll.total_votes(), 10)
+    def test_count_votes(self):
+        self.assertEqual(self.poll.count_votes(), 10)
 
-    def test_total_votes_no_options(self):
+    def test_count_votes_no_options(self):
         poll = Poll.objects.create(question="Empty poll?")
-        self.assertEqual(poll.total_votes(), 0)
+        self.assertEqual(poll.count_votes(), 0)
+        self.assertEqual(poll.total_votes, 0)
 
     def test_option_percentage(self):
         self.assertEqual(self.opt1.percentage(10), 30.0)
@@ -128,6 +161,7 @@ class VoteViewTest(TestCase):
 
 class PollResultsViewTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.poll = Poll.objects.create(question="Results Poll?")
         self.opt1 = Option.objects.create(poll=self.poll, text="A", vote_count=5)
@@ -149,3 +183,1823 @@ class PollResultsViewTest(TestCase):
     def test_results_not_found(self):
         response = self.client.get(reverse('poll_results', args=[9999]))
         self.assertEqual(response.status_code, 404)
+
+
+class TotalVotesCounterTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="voter", password="pass12345")
+        self.poll = Poll.objects.create(question="Counter Poll?", created_by=self.user)
+        self.opt1 = Option.objects.create(poll=self.poll, text="Yes")
+        self.opt2 = Option.objects.create(poll=self.poll, text="No")
+
+    def test_vote_increments_poll_total(self):
+        self.client.login(username="voter", password="pass12345")
+        self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.opt1.id})
+        self.poll.refresh_from_db()
+        self.assertEqual(self.poll.total_votes, 1)
+        self.assertEqual(self.poll.total_votes, self.poll.count_votes())
+
+    def test_duplicate_vote_does_not_increment_total(self):
+        self.client.login(username="voter", password="pass12345")
+        self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.opt1.id})
+        self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.opt2.id})
+        self.poll.refresh_from_db()
+        self.assertEqual(self.poll.total_votes, 1)
+
+    def test_reconcile_repairs_drift(self):
+        Vote.objects.create(user=self.user, poll=self.poll, option=self.opt1)
+        Option.objects.filter(pk=self.opt2.pk).update(vote_count=4)
+        Poll.objects.filter(pk=self.poll.pk).update(total_votes=9)
+        out = StringIO()
+        call_command('reconcile_votes', stdout=out)
+        self.assertIn("2 option(s) and 1 poll(s)", out.getvalue())
+        self.poll.refresh_from_db()
+        self.opt1.refresh_from_db()
+        self.opt2.refresh_from_db()
+        self.assertEqual((self.opt1.vote_count, self.opt2.vote_count), (1, 0))
+        self.assertEqual(self.poll.total_votes, 1)
+
+    def test_reconcile_dry_run_does_not_write(self):
+        Poll.objects.filter(pk=self.poll.pk).update(total_votes=9)
+        call_command('reconcile_votes', '--dry-run', stdout=StringIO())
+        self.poll.refresh_from_db()
+        self.assertEqual(self.poll.total_votes, 9)
+
+
+class ListingQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="owner", password="pass12345")
+
+    def _make_polls(self, n):
+        for i in range(n):
+            poll = Poll.objects.create(question=f"Poll {i}?", created_by=self.user)
+            Option.objects.create(poll=poll, text="A", vote_count=1)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_poll_list_query_count_is_constant(self):
+        self._make_polls(2)
+        few = self._count_queries(reverse('poll_list'))
+        self._make_polls(30)
+        many = self._count_queries(reverse('poll_list'))
+        self.assertEqual(few, many)
+
+    def test_my_polls_query_count_is_constant(self):
+        self.client.login(username="owner", password="pass12345")
+        self._make_polls(2)
+        # Fills the user cache, so both counts below are of warm requests
+        self._count_queries(reverse('my_polls'))
+        few = self._count_queries(reverse('my_polls'))
+        self._make_polls(30)
+        many = self._count_queries(reverse('my_polls'))
+        self.assertEqual(few, many)
+
+
+# Query budgets describe the default counter and ingestion modes
+@override_settings(POLLS_QUERY_BUDGETS={})
+@override_settings(POLLS_VOTE_COUNTER_SHARDS=4)
+class ShardedCounterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.poll = Poll.objects.create(question="Sharded Poll?")
+        self.opt1 = Option.objects.create(poll=self.poll, text="Hot", vote_count=2)
+        self.opt2 = Option.objects.create(poll=self.poll, text="Cold")
+        self.users = [
+            User.objects.create_user(username=f"user{i}", password="pass12345") for i in range(3)
+        ]
+
+    def _vote(self, user, option):
+        self.client.force_login(user)
+        self.client.post(reverse('vote', args=[self.poll.id]), {'option': option.id})
+
+    def test_vote_writes_shard_not_option_row(self):
+        self._vote(self.users[0], self.opt1)
+        self.opt1.refresh_from_db()
+        self.assertEqual(self.opt1.vote_count, 2)
+        self.assertEqual(
+            sum(OptionCounterShard.objects.filter(option=self.opt1).values_list('count', flat=True)), 1
+        )
+
+    def test_results_include_unfolded_shards(self):
+        self._vote(self.users[0], self.opt1)
+        self._vote(self.users[1], self.opt1)
+        self._vote(self.users[2], self.opt2)
+        cache.clear()
+        response = self.client.get(reverse('poll_results', args=[self.poll.id]))
+        self.assertEqual(response.context['total_votes'], 5)
+        self.assertContains(response, "80.0%")
+
+    def test_load_counts_sets_percentage(self):
+        OptionCounterShard.objects.create(option=self.opt2, shard=0, count=2)
+        options = counters.load_counts(self.poll, [self.opt1, self.opt2])
+        self.assertEqual([o.current_count for o in options], [2, 2])
+        self.assertEqual(self.opt2.percentage(4), 50.0)
+
+    def test_fold_moves_shards_into_columns(self):
+        OptionCounterShard.objects.create(option=self.opt1, shard=0, count=3)
+        OptionCounterShard.objects.create(option=self.opt1, shard=1, count=1)
+        call_command('fold_vote_shards', stdout=StringIO())
+        self.opt1.refresh_from_db()
+        self.poll.refresh_from_db()
+        self.assertEqual(self.opt1.vote_count, 6)
+        self.assertEqual(self.poll.total_votes, 4)
+        self.assertFalse(OptionCounterShard.objects.exclude(count=0).exists())
+
+    def test_reconcile_discards_shard_deltas(self):
+        OptionCounterShard.objects.create(option=self.opt1, shard=0, count=3)
+        call_command('reconcile_votes', stdout=StringIO())
+        self.assertFalse(OptionCounterShard.objects.exclude(count=0).exists())
+
+
+# Query budgets describe the default counter and ingestion modes
+@override_settings(POLLS_QUERY_BUDGETS={})
+@override_settings(POLLS_VOTE_INGESTION='queued', POLLS_VOTE_QUEUE_MAX=3)
+class QueuedIngestionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.poll = Poll.objects.create(question="Queued Poll?")
+        self.opt1 = Option.objects.create(poll=self.poll, text="A")
+        self.opt2 = Option.objects.create(poll=self.poll, text="B")
+        self.users = [
+            User.objects.create_user(username=f"q{i}", password="pass12345") for i in range(4)
+        ]
+
+    def _vote(self, user, option):
+        self.client.force_login(user)
+        return self.client.post(reverse('vote', args=[self.poll.id]), {'option': option.id})
+
+    def test_vote_is_queued_not_written(self):
+        response = self._vote(self.users[0], self.opt1)
+        self.assertRedirects(response, reverse('poll_results', args=[self.poll.id]))
+        self.assertEqual(PendingVote.objects.count(), 1)
+        self.assertFalse(Vote.objects.exists())
+        self.opt1.refresh_from_db()
+        self.assertEqual(self.opt1.vote_count, 0)
+
+    def test_queued_duplicate_rejected(self):
+        self._vote(self.users[0], self.opt1)
+        response = self._vote(self.users[0], self.opt2)
+        self.assertContains(response, "Vote Recorded")
+        self.assertEqual(PendingVote.objects.count(), 1)
+
+    def test_backpressure_when_queue_full(self):
+        for user in self.users[:3]:
+            self._vote(user, self.opt1)
+        response = self._vote(self.users[3], self.opt1)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+    def test_queue_depth_is_not_counted_per_vote(self):
+        self._vote(self.users[0], self.opt1)
+        with CaptureQueriesContext(connection) as ctx:
+            self._vote(self.users[1], self.opt1)
+        counts = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT COUNT(')]
+        self.assertFalse([sql for sql in counts if 'polls_pendingvote' in sql])
+
+    def test_flush_resets_queue_depth(self):
+        for user in self.users[:3]:
+            self._vote(user, self.opt1)
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest.flush()
+        self.assertEqual(self._vote(self.users[3], self.opt1).status_code, 302)
+
+    def test_flush_applies_batch(self):
+        self._vote(self.users[0], self.opt1)
+        self._vote(self.users[1], self.opt1)
+        self._vote(self.users[2], self.opt2)
+        queued_at = PendingVote.objects.get(user=self.users[0]).voted_at
+        self.assertEqual(ingest.flush(batch_size=2), 2)
+        self.assertEqual(ingest.drain(), 1)
+        self.assertFalse(PendingVote.objects.exists())
+        self.opt1.refresh_from_db()
+        self.poll.refresh_from_db()
+        self.assertEqual(self.opt1.vote_count, 2)
+        self.assertEqual(self.poll.total_votes, 3)
+        self.assertEqual(Vote.objects.get(user=self.users[0]).voted_at, queued_at)
+
+    def test_flush_skips_votes_already_recorded(self):
+        PendingVote.objects.create(user=self.users[0], poll=self.poll, option=self.opt1)
+        Vote.objects.create(user=self.users[0], poll=self.poll, option=self.opt2)
+        self.assertEqual(ingest.flush(), 0)
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertFalse(PendingVote.objects.exists())
+
+    def test_flush_command_recovers_leftover_queue(self):
+        PendingVote.objects.create(user=self.users[0], poll=self.poll, option=self.opt1)
+        out = StringIO()
+        call_command('flush_votes', stdout=out)
+        self.assertIn("Flushed 1 queued vote(s).", out.getvalue())
+        self.assertTrue(Vote.objects.filter(user=self.users[0]).exists())
+
+
+class ResultsCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.owner = User.objects.create_user(username="owner", password="pass12345")
+        self.voter = User.objects.create_user(username="voter", password="pass12345")
+        self.poll = Poll.objects.create(question="Cached Poll?", created_by=self.owner)
+        self.opt1 = Option.objects.create(poll=self.poll, text="A")
+        self.opt2 = Option.objects.create(poll=self.poll, text="B")
+        self.url = reverse('poll_results', args=[self.poll.id])
+
+    def test_second_anonymous_hit_runs_no_queries(self):
+        self.assertEqual(self.client.get(self.url)['X-Results-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Results-Cache'], 'hit')
+        self.assertContains(response, "Cached Poll?")
+
+    def test_stats_count_hits_and_misses(self):
+        before = results_cache.stats()
+        self.client.get(self.url)
+        self.client.get(self.url)
+        after = results_cache.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_vote_invalidates_results(self):
+        self.client.get(self.url)
+        self.client.force_login(self.voter)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.opt1.id})
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Results-Cache'], 'miss')
+        self.assertEqual(response.context['total_votes'], 1)
+        self.assertEqual(response.context['user_vote'].option, self.opt1)
+
+    def test_user_vote_is_not_cached(self):
+        Vote.objects.create(user=self.voter, poll=self.poll, option=self.opt2)
+        self.client.get(self.url)
+        self.client.force_login(self.voter)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Results-Cache'], 'hit')
+        self.assertEqual(response.context['user_vote'].option, self.opt2)
+
+    def test_deactivate_invalidates_results(self):
+        self.client.get(self.url)
+        self.client.force_login(self.owner)
+        self.client.post(reverse('deactivate_poll', args=[self.poll.id]))
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Results-Cache'], 'miss')
+        self.assertFalse(response.context['poll'].is_active)
+
+    def test_delete_invalidates_results(self):
+        self.client.get(self.url)
+        self.client.force_login(self.owner)
+        self.client.post(reverse('delete_poll', args=[self.poll.id]))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_version_survives_evicted_key(self):
+        old = results_cache.get_version(self.poll.id)
+        cache.delete(f'polls:results-version:{self.poll.id}')
+        self.assertGreater(results_cache.get_version(self.poll.id), old)
+
+
+class ResultsJsonTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.voter = User.objects.create_user(username="voter", password="pass12345")
+        self.poll = Poll.objects.create(question="Json Poll?")
+        self.opt1 = Option.objects.create(poll=self.poll, text="A", vote_count=1)
+        self.opt2 = Option.objects.create(poll=self.poll, text="B", vote_count=3)
+        self.url = reverse('poll_results_json', args=[self.poll.id])
+
+    def test_json_payload(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_votes'], 4)
+        self.assertEqual(
+            [(o['id'], o['text'], o['votes'], o['percentage']) for o in data['options']],
+            [(self.opt1.id, "A", 1, 25.0), (self.opt2.id, "B", 3, 75.0)],
+        )
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_if_none_match_returns_304_without_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_last_modified_from_latest_vote(self):
+        Vote.objects.create(user=self.voter, poll=self.poll, option=self.opt1)
+        results_cache.bump(self.poll.id)
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_vote_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(self.voter)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.opt1.id})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_votes'], 5)
+
+    def test_etag_depends_on_the_body_not_the_cache_version(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], f'"{hashlib.md5(response.content).hexdigest()}"')
+        # Another worker's cache numbers the version differently
+        results_cache.bump(self.poll.id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_found(self):
+        self.assertEqual(self.client.get(reverse('poll_results_json', args=[9999])).status_code, 404)
+
+
+@override_settings(POLLS_STREAM_INTERVAL=0.01)
+class ResultsStreamTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.poll = Poll.objects.create(question="Stream Poll?")
+        Option.objects.create(poll=self.poll, text="A", vote_count=1)
+        Option.objects.create(poll=self.poll, text="B", vote_count=3)
+
+    async def test_stream_sends_current_results(self):
+        response = await self.async_client.get(reverse('poll_results_stream', args=[self.poll.id]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        frame = await anext(content)
+        await content.aclose()
+        self.assertTrue(frame.startswith(b'id: '))
+        self.assertIn(b'"total_votes": 4', frame)
+
+    def test_wsgi_requests_get_one_frame_and_a_retry(self):
+        url = reverse('poll_results_stream', args=[self.poll.id])
+        response = self.client.get(url)
+        self.assertFalse(response.streaming)
+        self.assertTrue(response.content.startswith(b'retry: 5000\n'))
+        self.assertIn(b'"total_votes": 4', response.content)
+        version = re.search(rb'^id: (\S+)$', response.content, re.M).group(1).decode()
+        response = self.client.get(url, HTTP_LAST_EVENT_ID=version)
+        self.assertEqual(response.content, b'retry: 5000\n\n')
+
+    def test_results_page_subscribes_only_when_streaming(self):
+        url = reverse('poll_results', args=[self.poll.id])
+        self.assertNotContains(self.client.get(url), 'data-stream-url')
+        with override_settings(POLLS_STREAM_RESULTS=True):
+            self.assertContains(self.client.get(url), 'data-stream-url')
+
+    async def test_stream_not_found(self):
+        response = await self.async_client.get(reverse('poll_results_stream', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_hub_coalesces_bursts(self):
+        loads = []
+        hub = streams.get_hub(self.poll.id, lambda poll_id: loads.append(poll_id) or {'n': len(loads)})
+        queue = hub.subscribe()
+        await queue.get()
+        for _ in range(500):
+            results_cache.bump(self.poll.id)
+        await asyncio.sleep(0.05)
+        self.assertEqual(queue.qsize(), 1)
+        self.assertLessEqual(len(loads), 6)
+        hub.unsubscribe(queue)
+        await asyncio.sleep(0.05)
+        self.assertEqual(streams.hub_count(), 0)
+
+    async def test_one_watcher_shared_by_subscribers(self):
+        hub = streams.get_hub(self.poll.id, lambda poll_id: {})
+        queues = [hub.subscribe() for _ in range(50)]
+        self.assertIs(streams.get_hub(self.poll.id, lambda poll_id: {}), hub)
+        await asyncio.gather(*(q.get() for q in queues))
+        for q in queues:
+            hub.unsubscribe(q)
+        await asyncio.sleep(0.05)
+        self.assertIsNone(hub.task)
+
+
+@override_settings(POLLS_PAGE_SIZE=3)
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="pager", password="pass12345")
+        self.polls = [
+            Poll.objects.create(question=f"Paged {i}?", created_by=self.user, category="sports")
+            for i in range(7)
+        ]
+        # Two polls share a timestamp so the id tie-breaker is exercised
+        Poll.objects.filter(pk=self.polls[4].pk).update(created_at=self.polls[3].created_at)
+
+    def _walk(self, queryset, **kwargs):
+        seen, cursor = [], None
+        while True:
+            page = paginate(queryset, cursor, **kwargs)
+            seen.extend(p.pk for p in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        seen = self._walk(Poll.objects.all())
+        expected = list(Poll.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_round_trip_and_bad_cursor(self):
+        poll = self.polls[0]
+        self.assertEqual(decode_cursor(encode_cursor(poll.created_at, poll.pk)), (poll.created_at, poll.pk))
+        self.assertIsNone(decode_cursor("not-a-cursor"))
+        response = self.client.get(reverse('poll_list'), {'cursor': 'garbage'})
+        self.assertEqual(len(response.context['polls']), 3)
+
+    def test_poll_list_next_page_and_fragment(self):
+        response = self.client.get(reverse('poll_list'), {'category': 'sports'})
+        self.assertContains(response, "Paged 6?")
+        self.assertNotContains(response, "Paged 3?")
+        more_url = response.context['more_url']
+        self.assertTrue(more_url.startswith(reverse('poll_list_more')))
+        self.assertIn("category=sports", more_url)
+        fragment = self.client.get(more_url)
+        self.assertContains(fragment, "Paged 3?")
+        self.assertNotContains(fragment, "<html")
+        self.assertNotContains(fragment, "Paged 6?")
+
+    def test_my_polls_stats_cover_all_pages(self):
+        Poll.objects.filter(pk=self.polls[0].pk).update(is_active=False, total_votes=4)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('my_polls'))
+        self.assertEqual(len(response.context['polls']), 3)
+        self.assertEqual(response.context['stats']['total_polls'], 7)
+        self.assertEqual(response.context['stats']['active_polls'], 6)
+        self.assertEqual(response.context['total_votes'], 4)
+        self.assertEqual(self.client.get(reverse('my_polls_more')).status_code, 200)
+
+    def test_vote_history_paginates_by_voted_at(self):
+        for poll in self.polls:
+            option = Option.objects.create(poll=poll, text="X")
+            Vote.objects.create(user=self.user, poll=poll, option=option)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('vote_history'))
+        self.assertEqual(len(response.context['user_votes']), 3)
+        seen = self._walk(Vote.objects.filter(user=self.user), field='voted_at')
+        self.assertEqual(len(set(seen)), 7)
+        fragment = self.client.get(response.context['more_url'])
+        self.assertContains(fragment, "<tr>", count=3)
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans are checked with SQLite's EXPLAIN QUERY PLAN")
+class HotPathQueryPlanTest(TestCase):
+    """Fail if a view's queries fall back to a full scan of a polls table or an unindexed sort."""
+
+    # A bare "SCAN <table>" means no index was used; "SCAN t USING INDEX i" is an ordered index walk
+    FULL_SCAN = re.compile(r'\bSCAN (polls_\w+)(?: AS \w+)?$')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="planner", password="pass12345")
+        self.client.force_login(self.user)
+        self.poll = Poll.objects.create(question="Plan Poll?", created_by=self.user, category="sports")
+        self.option = Option.objects.create(poll=self.poll, text="A")
+        other = Poll.objects.create(question="Other?", created_by=self.user)
+        Vote.objects.create(user=self.user, poll=other, option=Option.objects.create(poll=other, text="B"))
+
+    def full_scans(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            getattr(self.client, method)(url, data or {})
+        scans = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    match = self.FULL_SCAN.search(row[-1])
+                    if match:
+                        scans.append(f'{match.group(1)}: {sql}')
+                    elif 'TEMP B-TREE FOR ORDER BY' in row[-1]:
+                        # Paginated listings must read rows in index order
+                        scans.append(f'sort: {sql}')
+        return scans
+
+    def assertNoFullScans(self, method, url, data=None):
+        scans = self.full_scans(method, url, data)
+        self.assertEqual(scans, [], "Full scans or sorts on hot path:\n" + "\n".join(scans))
+
+    def test_poll_list(self):
+        self.assertNoFullScans('get', reverse('poll_list'))
+
+    def test_poll_list_category_next_page(self):
+        cursor = encode_cursor(self.poll.created_at, self.poll.pk + 1)
+        self.assertNoFullScans('get', reverse('poll_list_more'), {'category': 'sports', 'cursor': cursor})
+
+    def test_poll_detail(self):
+        self.assertNoFullScans('get', reverse('poll_detail', args=[self.poll.id]))
+
+    def test_vote(self):
+        self.assertNoFullScans('post', reverse('vote', args=[self.poll.id]), {'option': self.option.id})
+
+    def test_poll_results(self):
+        self.assertNoFullScans('get', reverse('poll_results', args=[self.poll.id]))
+
+    def test_poll_results_json(self):
+        self.assertNoFullScans('get', reverse('poll_results_json', args=[self.poll.id]))
+
+    def test_my_polls(self):
+        self.assertNoFullScans('get', reverse('my_polls'))
+
+    def test_vote_history(self):
+        self.assertNoFullScans('get', reverse('vote_history'))
+
+    def test_user_profile(self):
+        self.assertNoFullScans('get', reverse('user_profile'))
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.client = Client()
+        Poll.objects.create(question="Metered Poll?")
+
+    def test_view_sample_recorded(self):
+        self.client.get(reverse('poll_list'))
+        snapshot = registry.snapshot('poll_list')
+        self.assertEqual(snapshot['request_duration_seconds'][0], 1)
+        self.assertEqual(snapshot['db_queries'], (1, 1))
+        self.assertGreater(snapshot['template_duration_seconds'][1], 0)
+
+    def test_prometheus_endpoint(self):
+        self.client.get(reverse('poll_list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE polls_request_duration_seconds histogram', body)
+        self.assertIn('polls_db_queries_count{view="poll_list"} 1', body)
+        self.assertIn('polls_results_cache_requests_total{result="hit"}', body)
+
+    def test_metrics_forbidden_from_other_addresses(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(POLLS_QUERY_BUDGETS={'poll_list': 0})
+    def test_budget_overrun_is_logged(self):
+        with self.assertLogs('polls.metrics', 'WARNING') as logs:
+            self.client.get(reverse('poll_list'))
+        self.assertIn("poll_list ran 1 queries (budget 0)", logs.output[0])
+        self.assertEqual(registry.budget_violations, {'poll_list': 1})
+
+    @override_settings(POLLS_QUERY_BUDGETS={'poll_list': 0}, POLLS_QUERY_BUDGET_STRICT=True)
+    def test_budget_overrun_raises_when_strict(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('poll_list'))
+
+
+@override_settings(POLLS_QUERY_BUDGET_STRICT=True)
+class QueryBudgetTest(TestCase):
+    """Every view stays within its POLLS_QUERY_BUDGETS entry for a logged-in user."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="budget", password="pass12345")
+        self.client.force_login(self.user)
+        self.poll = Poll.objects.create(question="Budget Poll?", created_by=self.user)
+        self.option = Option.objects.create(poll=self.poll, text="A")
+        for i in range(5):
+            poll = Poll.objects.create(question=f"Other {i}?", created_by=self.user)
+            option = Option.objects.create(poll=poll, text="B")
+            Vote.objects.create(user=self.user, poll=poll, option=option)
+
+    def test_views_within_budget(self):
+        pages = [
+            reverse('poll_list'),
+            reverse('poll_list_more'),
+            reverse('poll_detail', args=[self.poll.id]),
+            reverse('poll_results', args=[self.poll.id]),
+            reverse('poll_results_json', args=[self.poll.id]),
+            reverse('my_polls'),
+            reverse('my_polls_more'),
+            reverse('vote_history'),
+            reverse('vote_history_more'),
+            reverse('user_profile'),
+        ]
+        for url in pages:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.option.id})
+        self.assertEqual(response.status_code, 302)
+
+    def test_cold_vote_within_budget(self):
+        # First vote in a fresh process: no cached session, user, poll or voter filter
+        cache.clear()
+        metadata.clear_local()
+        bloom.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.option.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertLessEqual(len(ctx), settings.POLLS_QUERY_BUDGETS['vote'])
+
+
+class BenchmarkSupportTest(TestCase):
+    def test_seed_keeps_counters_consistent(self):
+        summary = benchmarks.seed(users=6, polls=5, options=3, votes=12)
+        self.assertEqual(summary['votes'], 12)
+        polls = Poll.objects.filter(created_by__username__startswith=benchmarks.USER_PREFIX)
+        self.assertEqual(polls.count(), 5)
+        for poll in polls:
+            self.assertEqual(poll.total_votes, poll.count_votes())
+            self.assertEqual(poll.total_votes, poll.votes.count())
+            for option in poll.options.all():
+                self.assertEqual(option.vote_count, option.votes.count())
+
+    def test_voter_sessions_have_no_seeded_votes(self):
+        benchmarks.seed(users=6, polls=5, options=3, votes=15)
+        voters = benchmarks.login_sessions(3, voters=True)
+        self.assertEqual(len(voters), 3)
+        self.assertFalse(Vote.objects.filter(user_id__in=[pk for pk, _ in voters]).exists())
+
+    def test_clear_only_removes_benchmark_data(self):
+        user = User.objects.create_user(username='realuser', password='x')
+        Poll.objects.create(question='Real?', description='d', created_by=user)
+        benchmarks.seed(users=4, polls=3, options=2, votes=4)
+        call_command('seed_benchmark_data', clear=True, stdout=StringIO())
+        self.assertEqual(list(Poll.objects.values_list('question', flat=True)), ['Real?'])
+        self.assertTrue(User.objects.filter(username='realuser').exists())
+
+    def test_percentile_and_compare(self):
+        values = [i / 100 for i in range(1, 101)]
+        self.assertEqual(benchmarks.percentile(values, 0.5), 0.51)
+        self.assertEqual(benchmarks.percentile(values, 0.99), 0.99)
+        self.assertEqual(benchmarks.percentile([], 0.5), 0.0)
+        baseline = {'scenarios': {'poll_list': {'throughput_rps': 100.0, 'p50_ms': 10.0, 'p99_ms': 40.0}}}
+        current = {'scenarios': {
+            'poll_list': {'throughput_rps': 120.0, 'p50_ms': 8.0, 'p99_ms': 40.0},
+            'vote': {'throughput_rps': 50.0, 'p50_ms': 20.0, 'p99_ms': 60.0},
+        }}
+        self.assertEqual(
+            benchmarks.compare(baseline, current),
+            {'poll_list': {'throughput_rps': 20.0, 'p50_ms': -20.0, 'p99_ms': 0.0}},
+        )
+
+
+class ImportPollsTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = f'{self.tmp.name}/{name}'
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_imports_polls_options_and_votes(self):
+        User.objects.create_user(username='alice', password='x')
+        polls = self.write('polls.jsonl', (
+            '{"id": "a", "question": "Tabs?", "description": "d", "category": "technology", '
+            '"created_by": "alice", "created_at": "2020-01-01T00:00:00Z", "options": ["Tabs", "Spaces"]}\n'
+            '{"id": "b", "question": "Tea?", "description": "d", "category": "sports", '
+            '"is_active": false, "options": ["Yes", "No"]}\n'
+        ))
+        votes = self.write('votes.csv', (
+            'poll,option,user,voted_at\n'
+            'a,Tabs,alice,2020-01-02T00:00:00Z\n'
+            'a,Spaces,bob,2020-01-03T00:00:00Z\n'
+            'a,Tabs,bob,2020-01-04T00:00:00Z\n'
+            'b,No,bob,\n'
+        ))
+        out = StringIO()
+        call_command('import_polls', polls, votes=votes, batch_size=2, stdout=out)
+        self.assertIn('Skipped 1 duplicate vote', out.getvalue())
+
+        tabs = Poll.objects.get(question='Tabs?')
+        self.assertEqual(tabs.created_by.username, 'alice')
+        self.assertEqual(tabs.created_at.year, 2020)
+        self.assertEqual(tabs.total_votes, 2)
+        self.assertEqual(dict(tabs.options.values_list('text', 'vote_count')), {'Tabs': 1, 'Spaces': 1})
+        self.assertFalse(Poll.objects.get(question='Tea?').is_active)
+        bob = User.objects.get(username='bob')
+        self.assertFalse(bob.has_usable_password())
+        # The first vote in the file wins
+        self.assertEqual(Vote.objects.get(user=bob, poll=tabs).option.text, 'Spaces')
+        self.assertEqual(Vote.objects.count(), 3)
+
+    def test_csv_options_and_invalid_rows_roll_back(self):
+        polls = self.write('polls.csv', 'id,question,description,options\nx,Q?,d,One|Two\n')
+        votes = self.write('votes.jsonl', '{"poll": "x", "option": "Three", "user": "carol"}\n')
+        with self.assertRaisesMessage(CommandError, 'votes.jsonl:1'):
+            call_command('import_polls', polls, votes=votes, stdout=StringIO())
+        self.assertFalse(Poll.objects.exists())
+
+        call_command('import_polls', polls, stdout=StringIO())
+        self.assertEqual(list(Poll.objects.get().options.values_list('text', flat=True)), ['One', 'Two'])
+
+
+class ExportPollTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.owner = User.objects.create_user(username='owner', password='pass')
+        self.poll = Poll.objects.create(question='Export?', description='d', created_by=self.owner)
+        self.yes = Option.objects.create(poll=self.poll, text='Yes, "quoted"', vote_count=2)
+        self.no = Option.objects.create(poll=self.poll, text='No', vote_count=1)
+        for i, option in enumerate([self.yes, self.yes, self.no]):
+            voter = User.objects.create_user(username=f'voter{i}', password='pass')
+            Vote.objects.create(user=voter, poll=self.poll, option=option)
+        self.url = reverse('export_poll', args=[self.poll.id])
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_only_creator_can_export(self):
+        User.objects.create_user(username='other', password='pass')
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_streams_csv_votes(self):
+        self.client.login(username='owner', password='pass')
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertIn('poll-%d-votes.csv' % self.poll.id, response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(self.content(response).decode())))
+        self.assertEqual(rows[0], ['vote_id', 'voted_at', 'user', 'option_id', 'option'])
+        self.assertEqual([row[2:] for row in rows[1:]], [
+            ['voter0', str(self.yes.id), 'Yes, "quoted"'],
+            ['voter1', str(self.yes.id), 'Yes, "quoted"'],
+            ['voter2', str(self.no.id), 'No'],
+        ])
+
+    def test_gzipped_jsonl_results(self):
+        self.client.login(username='owner', password='pass')
+        response = self.client.get(self.url, {'format': 'jsonl', 'data': 'results', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(self.content(response)).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [
+                {'option_id': self.yes.id, 'option': 'Yes, "quoted"', 'votes': 2, 'percentage': 66.7},
+                {'option_id': self.no.id, 'option': 'No', 'votes': 1, 'percentage': 33.3},
+            ],
+        )
+
+    def test_unknown_format_rejected(self):
+        self.client.login(username='owner', password='pass')
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}).status_code, 400)
+
+    def test_command_writes_gzip_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/votes.jsonl.gz'
+            call_command('export_poll', self.poll.id, format='jsonl', output=path, chunk_size=1, stdout=StringIO())
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual([json.loads(line)['user'] for line in f], ['voter0', 'voter1', 'voter2'])
+
+
+class VotedIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='voter', password='pass')
+        self.polls = []
+        for i in range(3):
+            poll = Poll.objects.create(question=f'Indexed {i}?', description='d')
+            Option.objects.create(poll=poll, text=f'First {i}')
+            Option.objects.create(poll=poll, text=f'Second {i}')
+            self.polls.append(poll)
+        self.client.login(username='voter', password='pass')
+
+    def test_votes_retire_index_and_list_shows_badges(self):
+        self.client.get(reverse('poll_list'))  # warm the index
+        for poll in self.polls[:2]:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('vote', args=[poll.id]), {'option': poll.options.last().id})
+
+        response = self.client.get(reverse('poll_list'))  # reloads the retired index
+        self.assertEqual(response.content.decode().count('voted-badge'), 2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('poll_list'))
+        self.assertEqual(response.content.decode().count('voted-badge'), 2)
+        self.assertFalse([q for q in ctx.captured_queries if 'polls_vote' in q['sql']])
+
+    def test_saved_vote_bumps_the_index_version(self):
+        poll = self.polls[0]
+        version = voted._version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Vote.objects.create(user=self.user, poll=poll, option=poll.options.first())
+        self.assertNotEqual(voted._version(self.user.pk), version)
+        self.assertEqual(voted.load(self.user), {poll.id: poll.options.first().id})
+
+    def test_detail_and_results_check_the_vote_rows(self):
+        poll = self.polls[0]
+        option = poll.options.first()
+        self.client.get(reverse('poll_list'))  # caches an index without this vote
+        vote = Vote.objects.create(user=self.user, poll=poll, option=option)
+        for url in (reverse('poll_detail', args=[poll.id]), reverse('poll_results', args=[poll.id])):
+            self.assertContains(self.client.get(url), option.text)
+        self.assertContains(self.client.get(reverse('poll_detail', args=[poll.id])), 'Vote Recorded')
+        vote.delete()
+        self.assertNotContains(self.client.get(reverse('poll_detail', args=[poll.id])), 'Vote Recorded')
+
+    def test_stale_index_repaired_on_duplicate_vote(self):
+        poll = self.polls[2]
+        option = poll.options.first()
+        self.client.get(reverse('poll_list'))  # cache an empty index
+        Vote.objects.bulk_create([Vote(user=self.user, poll=poll, option=option)])  # no signals
+        response = self.client.post(reverse('vote', args=[poll.id]), {'option': option.id})
+        self.assertContains(response, 'Vote Recorded')
+        self.assertEqual(self.client.get(reverse('poll_list')).content.decode().count('voted-badge'), 1)
+        self.assertEqual(Vote.objects.filter(user=self.user).count(), 1)
+
+
+class VoteRollupTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.poll = Poll.objects.create(question='Over time?', description='d')
+        self.opt1 = Option.objects.create(poll=self.poll, text='A')
+        self.opt2 = Option.objects.create(poll=self.poll, text='B')
+        self.users = [User.objects.create_user(username=f'r{i}', password='pass') for i in range(4)]
+
+    def _vote_at(self, user, option, moment):
+        Vote.objects.create(user=user, poll=self.poll, option=option, voted_at=moment)
+        rollups.add([(self.poll.pk, option.pk, moment)])
+
+    def test_vote_view_counts_every_granularity(self):
+        self.client.force_login(self.users[0])
+        self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.opt1.id})
+        self.assertEqual(
+            sorted(VoteRollup.objects.filter(option=self.opt1).values_list('granularity', 'count')),
+            [('day', 1), ('hour', 1), ('minute', 1)],
+        )
+
+    def test_incremental_rollups_match_rebuild(self):
+        base = datetime(2026, 3, 1, 10, 15, 30, tzinfo=dt_timezone.utc)
+        moments = [base, base + timedelta(seconds=20), base + timedelta(minutes=50), base + timedelta(days=1)]
+        for user, moment in zip(self.users, moments):
+            self._vote_at(user, self.opt1 if moment != moments[2] else self.opt2, moment)
+        incremental = sorted(VoteRollup.objects.values_list('option_id', 'granularity', 'bucket', 'count'))
+        self.assertIn((self.opt1.id, 'minute', base.replace(second=0), 2), incremental)
+        self.assertIn((self.opt1.id, 'hour', base.replace(minute=0, second=0), 2), incremental)
+
+        call_command('backfill_vote_rollups', stdout=StringIO())
+        self.assertEqual(sorted(VoteRollup.objects.values_list('option_id', 'granularity', 'bucket', 'count')), incremental)
+
+    def test_queued_flush_adds_rollups(self):
+        for user in self.users[:3]:
+            PendingVote.objects.create(user=user, poll=self.poll, option=self.opt2)
+        ingest.flush()
+        self.assertEqual(VoteRollup.objects.get(option=self.opt2, granularity='day').count, 3)
+
+    def test_timeline_json_reads_only_rollups(self):
+        now = timezone.now()
+        self._vote_at(self.users[0], self.opt1, now - timedelta(hours=2))
+        self._vote_at(self.users[1], self.opt2, now - timedelta(hours=2))
+        self._vote_at(self.users[2], self.opt2, now)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('poll_timeline_json', args=[self.poll.id]), {'granularity': 'hour'})
+        self.assertFalse([q for q in ctx.captured_queries if 'polls_vote"' in q['sql']])
+        data = response.json()
+        self.assertEqual([b['total'] for b in data['buckets']], [2, 1])
+        self.assertEqual(data['buckets'][0]['counts'], {str(self.opt1.id): 1, str(self.opt2.id): 1})
+
+    def test_sharded_buckets_are_summed(self):
+        now = timezone.now()
+        with mock.patch.object(rollups.random, 'randrange', side_effect=[0, 1, 1]):
+            for user in self.users[:3]:
+                Vote.objects.create(user=user, poll=self.poll, option=self.opt1, voted_at=now)
+                rollups.add([(self.poll.pk, self.opt1.pk, now)], shards=2)
+        self.assertEqual(VoteRollup.objects.filter(granularity='minute').count(), 2)
+        buckets = rollups.timeline(self.poll, 'minute')['buckets']
+        self.assertEqual([(b['counts'], b['total']) for b in buckets], [({self.opt1.pk: 3}, 3)])
+
+    def test_timeline_page_and_bad_parameters(self):
+        self._vote_at(self.users[0], self.opt1, timezone.now())
+        url = reverse('poll_timeline', args=[self.poll.id])
+        self.assertContains(self.client.get(url, {'granularity': 'minute'}), 'progress-fill')
+        self.assertEqual(self.client.get(url, {'granularity': 'week'}).status_code, 400)
+        json_url = reverse('poll_timeline_json', args=[self.poll.id])
+        self.assertEqual(self.client.get(json_url, {'since': 'yesterday'}).status_code, 400)
+
+    def test_prune_drops_only_old_minute_buckets(self):
+        self._vote_at(self.users[0], self.opt1, timezone.now() - timedelta(days=30))
+        call_command('backfill_vote_rollups', prune=True, stdout=StringIO())
+        self.assertEqual(sorted(VoteRollup.objects.values_list('granularity', flat=True)), ['day', 'hour'])
+
+
+class CreatorAnalyticsTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='creator', password='pass')
+        self.now = datetime(2026, 3, 15, 12, 0, tzinfo=dt_timezone.utc)
+        spec = [
+            ('technology', [6, 4], True),
+            ('technology', [5, 5, 0], True),
+            ('sports', [9, 1], False),
+            ('sports', [0, 0], True),
+        ]
+        for i, (category, counts, active) in enumerate(spec):
+            poll = Poll.objects.create(
+                question=f'Q{i}?', description='d', category=category, created_by=self.owner,
+                is_active=active, total_votes=sum(counts),
+            )
+            for n, count in enumerate(counts):
+                option = Option.objects.create(poll=poll, text=f'O{n}', vote_count=count)
+                if count:
+                    VoteRollup.objects.create(
+                        poll=poll, option=option, granularity='day', count=count,
+                        bucket=self.now.replace(hour=0) - timedelta(days=i * 4),
+                    )
+        Poll.objects.create(question='No options?', description='d', category='education', created_by=self.owner)
+        Poll.objects.create(question='Not mine?', description='d', total_votes=100)
+
+    def check_summary(self):
+        with self.assertNumQueries(2):
+            summary = analytics.creator_summary(self.owner, now=self.now)
+        self.assertEqual(summary['total_polls'], 5)
+        self.assertEqual(summary['active_polls'], 4)
+        self.assertEqual(summary['total_options'], 9)
+        self.assertEqual(summary['total_votes'], 30)
+        self.assertEqual(summary['polls_with_votes'], 3)
+        self.assertEqual(summary['participation_rate'], 60.0)
+        self.assertEqual(summary['median_votes_per_poll'], 10)
+        # Margins: 20, 0 and 80 points
+        self.assertEqual(summary['mean_leader_margin'], 33.3)
+        self.assertEqual([r['question'] for r in summary['closest_races']], ['Q1?', 'Q0?', 'Q2?'])
+        self.assertEqual(
+            [(c['code'], c['polls'], c['votes'], c['share']) for c in summary['categories']],
+            [('technology', 2, 20, 66.7), ('sports', 2, 10, 33.3), ('education', 1, 0, 0)],
+        )
+        trend = summary['trend']
+        self.assertEqual(len(trend['days']), 14)
+        self.assertEqual((trend['recent'], trend['previous']), (20, 10))
+        self.assertEqual(trend['change_pct'], 100.0)
+        self.assertGreater(trend['slope_per_day'], 0)
+        return summary
+
+    def test_pure_python_summary(self):
+        with mock.patch.object(analytics, 'np', None):
+            self.check_summary()
+
+    @skipUnless(analytics.np is not None, 'NumPy is not installed')
+    def test_numpy_matches_pure_python(self):
+        vectorized = self.check_summary()
+        with mock.patch.object(analytics, 'np', None):
+            self.assertEqual(analytics.creator_summary(self.owner, now=self.now), vectorized)
+
+    def test_dashboard_query_count_does_not_grow(self):
+        self.client.force_login(self.owner)
+        self.client.get(reverse('my_polls'))  # fills the user cache
+        with CaptureQueriesContext(connection) as few:
+            self.assertContains(self.client.get(reverse('my_polls')), 'Closest Races')
+        for i in range(10):
+            poll = Poll.objects.create(question=f'Extra {i}?', description='d', created_by=self.owner)
+            Option.objects.create(poll=poll, text='A', vote_count=i)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse('my_polls'))
+        self.assertEqual(len(few), len(many))
+
+
+class PollMetadataCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metadata.clear_local()
+        self.client = Client()
+        self.owner = User.objects.create_user(username='meta-owner', password='pass')
+        self.poll = Poll.objects.create(question='Cached?', description='d', created_by=self.owner)
+        self.opt1 = Option.objects.create(poll=self.poll, text='One')
+        self.opt2 = Option.objects.create(poll=self.poll, text='Two')
+        self.url = reverse('poll_detail', args=[self.poll.id])
+
+    def test_detail_reads_no_poll_rows_when_warm(self):
+        self.client.force_login(self.owner)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Two')
+        self.assertContains(response, 'Manage Poll')
+        tables = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('polls_poll', tables)
+        self.assertNotIn('polls_option', tables)
+        self.assertLessEqual(len(ctx.captured_queries), 3)  # session, user, voted index
+
+    def test_poll_and_option_changes_invalidate(self):
+        self.client.get(self.url)
+        self.poll.question = 'Renamed?'
+        self.poll.save()
+        self.assertContains(self.client.get(self.url), 'Renamed?')
+        self.opt2.delete()
+        self.assertNotContains(self.client.get(self.url), 'Two')
+        Option.objects.create(poll=self.poll, text='Three')
+        self.assertContains(self.client.get(self.url), 'Three')
+
+    def test_deactivate_and_delete_invalidate(self):
+        self.client.get(self.url)
+        self.client.force_login(self.owner)
+        self.client.post(reverse('deactivate_poll', args=[self.poll.id]))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.post(reverse('delete_poll', args=[self.poll.id]))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_version_bump_retires_other_process_copies(self):
+        metadata.get_poll(self.poll.id)
+        # Another process changed the poll: only the shared version moves
+        Poll.objects.filter(pk=self.poll.pk).update(question='Elsewhere?')
+        cache.incr(f'polls:meta-version:{self.poll.id}')
+        self.assertEqual(metadata.get_poll(self.poll.id).question, 'Elsewhere?')
+
+    @override_settings(POLLS_METADATA_CACHE_SIZE=2, POLLS_METADATA_SHARED=False)
+    def test_local_tier_is_bounded_lru(self):
+        others = [Poll.objects.create(question=f'Other {i}?', description='d') for i in range(2)]
+        metadata.get_poll(self.poll.id)
+        metadata.get_poll(others[0].id)
+        metadata.get_poll(self.poll.id)  # most recently used
+        metadata.get_poll(others[1].id)
+        self.assertEqual(metadata.stats()['local_entries'], 2)
+        with self.assertNumQueries(0):
+            metadata.get_poll(self.poll.id)
+        with self.assertNumQueries(1):
+            metadata.get_poll(others[0].id)
+
+    @override_settings(POLLS_METADATA_SHARED=False, POLLS_METADATA_LOCAL_TTL=0)
+    def test_local_copies_expire(self):
+        metadata.get_poll(self.poll.id)
+        Poll.objects.filter(pk=self.poll.pk).update(question='Unannounced?')
+        self.assertEqual(metadata.get_poll(self.poll.id).question, 'Unannounced?')
+
+    def test_vote_rechecks_active_flag_in_database(self):
+        voter = User.objects.create_user(username='meta-voter', password='pass')
+        self.client.force_login(voter)
+        self.client.get(self.url)
+        # Deactivated where this process can't see it: no signal, no version bump
+        Poll.objects.filter(pk=self.poll.pk).update(is_active=False)
+        response = self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.opt1.id})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Vote.objects.filter(poll=self.poll).exists())
+
+    def test_built_instances_are_independent(self):
+        first = metadata.get_poll(self.poll.id)
+        first.options.all()[0].text = 'Mutated'
+        self.assertEqual(metadata.get_poll(self.poll.id).options.all()[0].text, 'One')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Exercises the SQLite connection settings')
+class SQLiteConcurrencyTest(SimpleTestCase):
+    """
+    Many processes voting at once against a file database (the in-memory test
+    database is a single shared connection, so it can't show lock contention).
+    """
+    databases = {'default'}
+
+    def manage(self, *args, env):
+        return subprocess.run(
+            [sys.executable, 'manage.py', *args],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=300,
+        )
+
+    def test_parallel_voters_get_no_lock_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, DB_NAME=os.path.join(directory, 'stress.sqlite3'))
+            env.pop('DB_SQLITE_TUNING', None)
+            migrate = self.manage('migrate', '-v0', env=env)
+            self.assertEqual(migrate.returncode, 0, migrate.stderr)
+            result = self.manage('stress_votes', '--voters', '240', '--workers', '16', env=env)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn('240/240 votes', result.stdout)
+        self.assertIn(', 0 errors', result.stdout)
+
+    def test_connections_use_wal(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        options = settings.DATABASES['default']['OPTIONS']
+        self.assertEqual(options['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('journal_mode=WAL', options['init_command'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Uses a second SQLite file as the replica')
+class ReadReplicaRoutingTest(TestCase):
+    """
+    A separate, unreplicated SQLite file stands in for the replica, so which
+    database a view read from shows in what it renders.
+    """
+
+    # Resolved when the class is set up, after the replica is registered
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = connections.configure_settings({
+            'default': connections.settings['default'],
+            'replica': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(cls.directory.name, 'replica.sqlite3'),
+            },
+        })['replica']
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        metadata.clear_local()
+        self.user = User.objects.create_user(username='replica-voter', password='pass')
+        self.poll = Poll.objects.create(question='Primary only?', description='d')
+        self.option = Option.objects.create(poll=self.poll, text='Yes')
+        self.client.force_login(self.user)
+
+    def test_listing_reads_the_replica(self):
+        Poll.objects.using('replica').create(question='Replicated?', description='d')
+        response = self.client.get(reverse('poll_list'))
+        self.assertContains(response, 'Replicated?')
+        self.assertNotContains(response, 'Primary only?')
+
+    def test_vote_pins_browser_to_primary(self):
+        response = self.client.post(reverse('vote', args=[self.poll.id]), {'option': self.option.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertEqual(Vote.objects.using('default').count(), 1)
+        self.assertEqual(Vote.objects.using('replica').count(), 0)
+        self.assertContains(self.client.get(reverse('vote_history')), 'Primary only?')
+
+        other = Client()
+        other.force_login(self.user)
+        self.assertNotContains(other.get(reverse('vote_history')), 'Primary only?')
+
+    def test_cached_results_are_filled_from_primary(self):
+        response = self.client.get(reverse('poll_results', args=[self.poll.id]))
+        self.assertContains(response, 'Primary only?')
+
+    def test_router(self):
+        router = replicas.ReplicaRouter()
+        self.assertEqual(router.db_for_write(Vote), 'default')
+        self.assertEqual(router.db_for_read(Vote), 'default')
+        self.assertIsNone(router.db_for_read(User))
+        view = replicas.read_from_replica(lambda request: router.db_for_read(Poll))
+        request = mock.Mock(COOKIES={})
+        self.assertEqual(view(request), 'replica')
+        request.COOKIES[replicas.PIN_COOKIE] = '1'
+        self.assertEqual(view(request), 'default')
+
+
+@override_settings(POLLS_THROTTLE_ENABLED=True, POLLS_THROTTLE_STORE='polls.throttling.LocalStore')
+class ThrottlingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metadata.clear_local()
+        throttling.reset()
+        registry.reset()
+        self.user = User.objects.create_user(username='flooder', password='pass')
+        self.polls = [Poll.objects.create(question=f'Throttled {i}?', description='d') for i in range(3)]
+        self.options = [Option.objects.create(poll=poll, text='Yes') for poll in self.polls]
+        self.client.force_login(self.user)
+
+    def vote(self, client, i):
+        return client.post(reverse('vote', args=[self.polls[i].id]), {'option': self.options[i].id})
+
+    @override_settings(POLLS_THROTTLE_RATES={'vote': {'ip': '2/m'}})
+    def test_address_flood_is_shed_before_any_query(self):
+        self.assertEqual(self.vote(self.client, 0).status_code, 302)
+        self.assertEqual(self.vote(self.client, 1).status_code, 302)
+        with self.assertNumQueries(0):
+            response = self.vote(self.client, 2)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertIn(
+            'polls_throttled_requests_total{scope="vote",key="ip"} 1', registry.render_prometheus()
+        )
+
+    @override_settings(POLLS_THROTTLE_RATES={'vote': {'user': '1/m'}})
+    def test_user_buckets_are_separate(self):
+        self.assertEqual(self.vote(self.client, 0).status_code, 302)
+        self.assertEqual(self.vote(self.client, 1).status_code, 429)
+        other = Client()
+        other.force_login(User.objects.create_user(username='patient', password='pass'))
+        self.assertEqual(self.vote(other, 1).status_code, 302)
+
+    @override_settings(POLLS_THROTTLE_RATES={'vote': {'poll': '1/s'}})
+    def test_poll_bucket(self):
+        self.assertEqual(self.vote(self.client, 0).status_code, 302)
+        other = Client()
+        other.force_login(User.objects.create_user(username='second', password='pass'))
+        self.assertEqual(self.vote(other, 0).status_code, 429)
+        self.assertEqual(self.vote(other, 1).status_code, 302)
+
+    @override_settings(POLLS_THROTTLE_RATES={'register': {'ip': '1/h'}})
+    def test_register_throttles_posts_only(self):
+        client = Client()
+        data = {'username': 'newbie', 'password1': 'x', 'password2': 'y'}
+        self.assertEqual(client.post(reverse('register'), data).status_code, 200)
+        self.assertEqual(client.post(reverse('register'), data).status_code, 429)
+        self.assertEqual(client.get(reverse('register')).status_code, 200)
+
+    @override_settings(POLLS_THROTTLE_RATES={'vote': {'poll': '1/m'}})
+    def test_anonymous_posts_leave_poll_buckets_alone(self):
+        anonymous = Client()
+        for _ in range(3):
+            self.assertEqual(self.vote(anonymous, 0).status_code, 302)
+        self.assertEqual(self.vote(self.client, 0).status_code, 302)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    @override_settings(POLLS_THROTTLE_RATES={'vote': {'ip': '2/m', 'user': '1/m'}})
+    def test_rejected_requests_take_no_tokens(self):
+        self.assertEqual(self.vote(self.client, 0).status_code, 302)
+        # The user bucket is empty, so the address bucket keeps its token
+        self.assertEqual(self.vote(self.client, 1).status_code, 429)
+        other = Client()
+        other.force_login(User.objects.create_user(username='neighbour', password='pass'))
+        self.assertEqual(self.vote(other, 1).status_code, 302)
+
+    @override_settings(POLLS_THROTTLE_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_client_ip_ignores_client_written_entries(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7')
+        self.assertEqual(throttling.client_ip(request), '203.0.113.7')
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7, 10.0.0.2')
+        with override_settings(POLLS_THROTTLE_TRUSTED_PROXIES=2):
+            self.assertEqual(throttling.client_ip(request), '203.0.113.7')
+
+    def test_bucket_refills_over_the_period(self):
+        store = throttling.LocalStore()
+        bucket = [('k', 2, 60)]
+        self.assertEqual(store.take(bucket, now=0), (None, 0))
+        self.assertEqual(store.take(bucket, now=0), (None, 0))
+        self.assertEqual(store.take(bucket, now=0), ('k', 30))
+        self.assertEqual(store.take(bucket, now=15), ('k', 15))
+        self.assertEqual(store.take(bucket, now=45), (None, 0))
+
+    def test_all_or_nothing(self):
+        for store in (throttling.LocalStore(), throttling.CacheStore()):
+            with self.subTest(store=type(store).__name__):
+                self.assertEqual(store.take([('full', 5, 60), ('once', 1, 60)], now=0), (None, 0))
+                self.assertEqual(store.take([('full', 5, 60), ('once', 1, 60)], now=0), ('once', 60))
+                # The rejection took nothing from 'full', which still has 4 tokens
+                for _ in range(4):
+                    self.assertEqual(store.take([('full', 5, 60)], now=0), (None, 0))
+                self.assertEqual(store.take([('full', 5, 60)], now=0), ('full', 12))
+
+    def test_cache_store_is_shared(self):
+        self.assertEqual(throttling.CacheStore().take([('k', 1, 60)], now=0), (None, 0))
+        self.assertEqual(throttling.CacheStore().take([('k', 1, 60)], now=1), ('k', 59))
+
+    def test_local_store_is_bounded(self):
+        store = throttling.LocalStore(max_keys=2)
+        for key in 'abc':
+            store.take([(key, 1, 60)], now=0)
+        self.assertEqual(store.take([('a', 1, 60)], now=0), (None, 0))  # evicted, so full again
+        self.assertEqual(store.take([('c', 1, 60)], now=0), ('c', 60))
+
+
+class VoterBloomFilterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metadata.clear_local()
+        bloom.clear()
+        self.poll = Poll.objects.create(question='Bloom?', description='d')
+        self.option = Option.objects.create(poll=self.poll, text='Yes')
+        self.users = [User.objects.create_user(username=f'bloom{i}', password='pass') for i in range(3)]
+        self.url = reverse('vote', args=[self.poll.id])
+
+    def post_vote(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'option': self.option.id})
+        return response, [q['sql'] for q in ctx.captured_queries]
+
+    def test_measured_false_positive_rate(self):
+        voter_filter = bloom.BloomFilter(10000, 0.01)
+        for user_id in range(10000):
+            voter_filter.add(user_id)
+        self.assertTrue(all(user_id in voter_filter for user_id in range(10000)))
+        others = range(10 ** 6, 10 ** 6 + 20000)
+        rate = sum(user_id in voter_filter for user_id in others) / len(others)
+        self.assertLess(rate, 0.015)
+
+        # Twice the load it was sized for: why filters are rebuilt when full
+        for user_id in range(10000, 20000):
+            voter_filter.add(user_id)
+        overloaded = sum(user_id in voter_filter for user_id in others) / len(others)
+        self.assertGreater(overloaded, 0.1)
+
+    def test_full_filter_grows_instead_of_being_rebuilt(self):
+        builds = bloom.stats()['builds']
+        bloom.might_have_voted(self.poll.id, 0)
+        for user_id in range(2 * bloom.MIN_CAPACITY + 1):
+            bloom.add(self.poll.id, user_id)
+        voter_filter = bloom._filters[self.poll.id]
+        self.assertEqual(len(voter_filter.layers), 2)
+        self.assertTrue(all(user_id in voter_filter for user_id in range(2 * bloom.MIN_CAPACITY + 1)))
+        self.assertFalse(bloom.might_have_voted(self.poll.id, 10 ** 6))
+        self.assertEqual(bloom.stats()['builds'], builds + 1)
+
+    def test_checks_during_a_build_use_the_exact_lookup(self):
+        building, unbuilt = [], bloom.stats()['unbuilt']
+
+        def build(poll_id):
+            # A second vote arrives while the first request is still building
+            building.append(bloom.might_have_voted(poll_id, self.users[1].pk))
+            return bloom._empty(0)
+
+        with mock.patch.object(bloom, '_build', side_effect=build) as mocked:
+            self.assertFalse(bloom.might_have_voted(self.poll.id, self.users[0].pk))
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(building, [True])
+        self.assertEqual(bloom.stats()['unbuilt'], unbuilt + 1)
+
+    def test_filter_is_sized_from_total_votes(self):
+        Poll.objects.filter(pk=self.poll.pk).update(total_votes=5000)
+        Vote.objects.create(user=self.users[0], poll=self.poll, option=self.option)
+        voter_filter = bloom._build(self.poll.id)
+        self.assertEqual(voter_filter.layers[0].capacity, 10000)
+        self.assertEqual(voter_filter.count, 1)
+        self.assertIn(self.users[0].pk, voter_filter)
+
+    def test_first_vote_skips_exact_check(self):
+        self.post_vote(self.users[0])  # builds the filter
+        response, queries = self.post_vote(self.users[1])
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse([sql for sql in queries if '"polls_vote"."user_id" =' in sql])
+
+    def test_repeat_vote_never_attempts_insert(self):
+        self.post_vote(self.users[0])
+        response, queries = self.post_vote(self.users[0])
+        self.assertContains(response, 'Vote Recorded')
+        self.assertFalse([sql for sql in queries if sql.startswith('INSERT')])
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_vote_recorded_elsewhere_is_still_rejected(self):
+        self.post_vote(self.users[0])
+        # Recorded by another process, so missing from this one's filter
+        Vote.objects.create(user=self.users[1], poll=self.poll, option=self.option)
+        self.assertFalse(bloom.might_have_voted(self.poll.id, self.users[1].pk))
+        response, _ = self.post_vote(self.users[1])
+        self.assertContains(response, 'Vote Recorded')
+        self.assertTrue(bloom.might_have_voted(self.poll.id, self.users[1].pk))
+        self.assertEqual(Vote.objects.filter(user=self.users[1]).count(), 1)
+
+
+class AdminChangelistTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metadata.clear_local()
+        self.admin = User.objects.create_superuser(username='admin', password='pass')
+        self.client.force_login(self.admin)
+        # Fills the user cache, so counted requests don't read auth_user
+        self.client.get(reverse('admin:index'))
+
+    def add_polls(self, n):
+        for i in range(n):
+            creator = User.objects.create_user(username=f'creator{Poll.objects.count()}')
+            poll = Poll.objects.create(question=f'Admin poll {Poll.objects.count()}?', description='d', created_by=creator)
+            option = Option.objects.create(poll=poll, text='Yes')
+            Option.objects.create(poll=poll, text='No')
+            Vote.objects.create(user=creator, poll=poll, option=option)
+
+    def queries_for(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in ctx.captured_queries]
+
+    def test_changelists_cost_constant_queries(self):
+        for name in ('admin:polls_poll_changelist', 'admin:polls_vote_changelist'):
+            self.add_polls(2)
+            _, few = self.queries_for(reverse(name))
+            self.add_polls(20)
+            _, many = self.queries_for(reverse(name))
+            self.assertEqual(len(few), len(many), name)
+
+    def test_vote_filter_lists_no_polls(self):
+        self.add_polls(5)
+        response, _ = self.queries_for(reverse('admin:polls_vote_changelist'))
+        self.assertContains(response, 'poll-filter')
+        self.assertNotContains(response, '?poll=')
+        poll = Poll.objects.first()
+        response, queries = self.queries_for(reverse('admin:polls_vote_changelist') + f'?poll={poll.id}')
+        self.assertContains(response, '1 vote')
+        # The selected poll, exact count, the page
+        self.assertEqual(len(queries), 3)
+        self.assertIn('"polls_poll"."question" AS "question" FROM "polls_poll" WHERE', queries[0])
+
+    @override_settings(POLLS_ADMIN_ESTIMATE_THRESHOLD=1)
+    def test_large_tables_are_counted_from_an_estimate(self):
+        self.add_polls(3)
+        Vote.objects.filter(poll=Poll.objects.first()).delete()
+        _, queries = self.queries_for(reverse('admin:polls_vote_changelist'))
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+        self.assertTrue([sql for sql in queries if sql.startswith('SELECT MAX("id") FROM "polls_vote"')])
+        # Filtered lists are counted exactly
+        poll = Poll.objects.last()
+        response, queries = self.queries_for(reverse('admin:polls_vote_changelist') + f'?poll={poll.id}')
+        self.assertTrue([sql for sql in queries if 'COUNT(' in sql])
+        self.assertContains(response, '1 vote')
+
+    def run_action(self, action, polls):
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:polls_poll_changelist'), {
+                'action': action, '_selected_action': [poll.pk for poll in polls],
+            })
+        self.assertEqual(response.status_code, 302)
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+
+    def test_bulk_actions_are_set_based(self):
+        self.add_polls(4)
+        polls = list(Poll.objects.all())
+        metadata.get_poll(polls[0].pk)
+        self.assertEqual(len(self.run_action('deactivate_polls', polls)), 1)
+        self.assertFalse(Poll.objects.filter(is_active=True).exists())
+        self.assertFalse(metadata.get_poll(polls[0].pk).is_active)
+        self.assertEqual(len(self.run_action('activate_polls', polls[:2])), 1)
+        self.assertEqual(Poll.objects.filter(is_active=True).count(), 2)
+
+        Poll.objects.update(total_votes=7)
+        Option.objects.update(vote_count=7)
+        updates = self.run_action('recount_votes', polls)
+        self.assertEqual(len(updates), 3)  # options, polls, shards
+        self.assertEqual(sorted(Poll.objects.values_list('total_votes', flat=True)), [1, 1, 1, 1])
+        self.assertEqual(Option.objects.aggregate(n=Sum('vote_count'))['n'], 4)
+
+
+class PollSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="searcher", password="pass12345")
+        self.python = Poll.objects.create(
+            question="Favourite programming language?", description="Python, Rust or Go", category="technology",
+        )
+        self.football = Poll.objects.create(
+            question="Best football club?", description="Programming the weekend around matches", category="sports",
+        )
+        self.closed = Poll.objects.create(question="Old programming poll?", description="d", is_active=False)
+        self.cafe = Poll.objects.create(question="Café or tea?", description="Morning drinks", category="education")
+
+    def test_prefix_match_ranks_questions_first_and_skips_inactive(self):
+        self.assertEqual(search.ranked_ids("program"), [self.python.pk, self.football.pk])
+        self.assertEqual(search.ranked_ids("PROG lang"), [self.python.pk])
+        self.assertEqual(search.ranked_ids("cafe"), [self.cafe.pk])
+        self.assertEqual(search.ranked_ids("program", category="sports"), [self.football.pk])
+        self.assertEqual(search.facets("program"), {"technology": 1, "sports": 1})
+
+    def test_operators_in_input_are_plain_words(self):
+        self.assertEqual(search.terms('"rust" OR NEAR(go*'), ["rust", "or", "near", "go"])
+        self.assertEqual(search.ranked_ids('python" OR "x'), [])
+        self.assertEqual(search.ranked_ids("?!"), [])
+
+    def test_signals_keep_the_index_in_sync(self):
+        self.python.question = "Favourite editor?"
+        self.python.description = "Vim or Emacs"
+        self.python.save()
+        self.assertEqual(search.ranked_ids("program"), [self.football.pk])
+        self.assertEqual(search.ranked_ids("emacs"), [self.python.pk])
+        self.football.delete()
+        self.assertEqual(search.ranked_ids("program"), [])
+        # Deactivating needs no reindex; the flag is read at search time
+        Poll.objects.filter(pk=self.closed.pk).update(is_active=True)
+        self.assertEqual(search.ranked_ids("old"), [self.closed.pk])
+
+    def test_bulk_created_polls_need_a_rebuild(self):
+        Poll.objects.bulk_create([Poll(question=f"Bulk quiz {i}?", description="d") for i in range(3)])
+        self.assertEqual(search.ranked_ids("quiz"), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 7 poll(s)', out.getvalue())
+        self.assertEqual(len(search.ranked_ids("quiz")), 3)
+
+    def test_imported_polls_are_searchable(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{"id": "a", "question": "Imported trivia?", "description": "d", "options": ["A", "B"]}\n')
+        self.addCleanup(os.unlink, f.name)
+        call_command('import_polls', f.name, stdout=StringIO())
+        self.assertEqual(search.ranked_ids("trivia"), [Poll.objects.get(question="Imported trivia?").pk])
+
+    @override_settings(POLLS_PAGE_SIZE=2, POLLS_QUERY_BUDGET_STRICT=True)
+    def test_search_view_pages_and_facets(self):
+        for i in range(3):
+            Poll.objects.create(question=f"Programming quiz {i}?", description="d", category="technology")
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('poll_search'), {'q': 'programming'})
+        self.assertEqual(len(response.context['polls']), 2)
+        self.assertContains(response, 'value="programming"')
+        categories = {code: count for code, _, count in response.context['categories']}
+        self.assertEqual(categories['all'], 5)
+        self.assertEqual(categories['technology'], 4)
+        self.assertEqual(categories['entertainment'], 0)
+        seen = [poll.pk for poll in response.context['polls']]
+        more_url = response.context['more_url']
+        while more_url:
+            fragment = self.client.get(more_url)
+            self.assertNotContains(fragment, "<html")
+            seen.extend(poll.pk for poll in fragment.context['polls'])
+            more_url = fragment.context.get('more_url')
+        self.assertEqual(seen, search.ranked_ids('programming', limit=10))
+
+        response = self.client.get(reverse('poll_search'), {'q': 'programming', 'category': 'sports'})
+        self.assertEqual([poll.pk for poll in response.context['polls']], [self.football.pk])
+        response = self.client.get(reverse('poll_search'), {'q': 'nothingmatches'})
+        self.assertContains(response, "No Matching Polls")
+        self.assertRedirects(self.client.get(reverse('poll_search'), {'q': ' '}), reverse('poll_list'))
+
+
+class AsyncViewsTest(TestCase):
+    """The native async views, routed in by POLLS_ASYNC_VIEWS and driven through the async client."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Cleanups run in reverse, so the URLs are rebuilt after the setting is restored
+        cls.addClassCleanup(cls.reload_urls)
+        cls.enterClassContext(override_settings(POLLS_ASYNC_VIEWS=True))
+        cls.reload_urls()
+
+    @staticmethod
+    def reload_urls():
+        importlib.reload(polls_urls)
+        importlib.reload(project_urls)
+        clear_url_caches()
+
+    def setUp(self):
+        cache.clear()
+        metadata.clear_local()
+        bloom.clear()
+        registry.reset()
+        self.user = User.objects.create_user(username="asyncer", password="pass12345")
+        self.poll = Poll.objects.create(question="Async Poll?", description="d", created_by=self.user)
+        self.yes = Option.objects.create(poll=self.poll, text="Yes")
+        self.no = Option.objects.create(poll=self.poll, text="No")
+        voted_poll = Poll.objects.create(question="Already voted?", description="d")
+        Vote.objects.create(user=self.user, poll=voted_poll, option=Option.objects.create(poll=voted_poll, text="A"))
+
+    def test_hot_views_are_async(self):
+        for url in (reverse('poll_list'), reverse('poll_detail', args=[self.poll.id]),
+                    reverse('vote', args=[self.poll.id]), reverse('poll_results', args=[self.poll.id])):
+            with self.subTest(url=url):
+                self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func))
+
+    @override_settings(POLLS_QUERY_BUDGET_STRICT=True)
+    async def test_pages_render_without_lazy_queries(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('poll_list'))
+        self.assertContains(response, "Async Poll?")
+        self.assertContains(response, "✓ Voted", count=1)
+        response = await self.async_client.get(reverse('poll_list_more'), {'category': 'sports'})
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('poll_detail', args=[self.poll.id]))
+        self.assertContains(response, "Yes")
+        self.assertContains(response, "asyncer")
+        response = await self.async_client.get(reverse('poll_results', args=[self.poll.id]))
+        self.assertEqual(response['X-Results-Cache'], 'miss')
+        response = await self.async_client.get(reverse('poll_results', args=[self.poll.id]))
+        self.assertEqual(response['X-Results-Cache'], 'hit')
+        # Queries run on sync_to_async threads still count toward the view
+        self.assertGreater(registry.snapshot('poll_detail')['db_queries'][1], 0)
+
+    @override_settings(POLLS_QUERY_BUDGETS={'poll_detail': 0})
+    async def test_query_budgets_apply_to_async_views(self):
+        with self.assertLogs('polls.metrics', 'WARNING'):
+            await self.async_client.get(reverse('poll_detail', args=[self.poll.id]))
+        self.assertEqual(registry.budget_violations, {'poll_detail': 1})
+
+    async def test_vote_is_recorded_once(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('vote', args=[self.poll.id])
+        response = await self.async_client.post(url, {'option': self.yes.id})
+        self.assertRedirects(response, reverse('poll_results', args=[self.poll.id]), fetch_redirect_response=False)
+        response = await self.async_client.post(url, {'option': self.no.id})
+        self.assertContains(response, "Yes")
+        self.assertTrue(response.context['already_voted'])
+        self.assertEqual(await Vote.objects.filter(poll=self.poll).acount(), 1)
+        await self.poll.arefresh_from_db()
+        self.assertEqual(self.poll.total_votes, 1)
+        response = await self.async_client.get(reverse('poll_results', args=[self.poll.id]))
+        self.assertEqual(response.context['total_votes'], 1)
+
+    async def test_concurrent_votes_keep_one_per_user(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('vote', args=[self.poll.id])
+        responses = await asyncio.gather(*(
+            self.async_client.post(url, {'option': option.id}) for option in (self.yes, self.no, self.yes)
+        ))
+        self.assertEqual(sorted(r.status_code for r in responses), [200, 200, 302])
+        self.assertEqual(await Vote.objects.filter(poll=self.poll).acount(), 1)
+        self.assertEqual(sum([o.vote_count async for o in Option.objects.filter(poll=self.poll)]), 1)
+
+    async def test_vote_requires_login(self):
+        response = await self.async_client.post(reverse('vote', args=[self.poll.id]), {'option': self.yes.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response['Location'])
+        self.assertFalse(await Vote.objects.filter(poll=self.poll).aexists())
+
+    @override_settings(POLLS_THROTTLE_ENABLED=True, POLLS_THROTTLE_RATES={'vote': {'user': '1/m'}})
+    async def test_vote_is_throttled(self):
+        throttling.reset()
+        await self.async_client.aforce_login(self.user)
+        url = reverse('vote', args=[self.poll.id])
+        self.assertEqual((await self.async_client.post(url, {'option': self.yes.id})).status_code, 302)
+        response = await self.async_client.post(url, {'option': self.no.id})
+        self.assertEqual(response.status_code, 429)
+
+
+class SessionAndUserCacheTest(TestCase):
+    """Cached-DB and signed-cookie sessions, and the user cache behind request.user."""
+
+    def setUp(self):
+        cache.clear()
+        metadata.clear_local()
+        self.user = User.objects.create_user(username="cached", password="pass12345", email="old@example.com")
+        self.poll = Poll.objects.create(question="Cached user?", description="d", created_by=self.user)
+        Option.objects.create(poll=self.poll, text="Yes")
+        Option.objects.create(poll=self.poll, text="No")
+
+    def warm_queries(self, url):
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return ' '.join(q['sql'] for q in ctx.captured_queries)
+
+    def test_warm_requests_skip_session_and_user_tables(self):
+        self.client.force_login(self.user)
+        for url in (reverse('poll_list'), reverse('poll_results', args=[self.poll.id])):
+            with self.subTest(url=url):
+                sql = self.warm_queries(url)
+                self.assertNotIn('django_session', sql)
+                # Pages may join creators; request.user must not be looked up
+                self.assertNotIn('WHERE "auth_user"."id" =', sql)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        self.client.force_login(self.user)
+        sql = self.warm_queries(reverse('poll_list'))
+        self.assertNotIn('django_session', sql)
+        self.assertContains(self.client.get(reverse('user_profile')), "old@example.com")
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db', POLLS_USER_CACHE_TTL=0)
+    def test_uncached_mode_reads_both_tables(self):
+        self.client.force_login(self.user)
+        sql = self.warm_queries(reverse('poll_list'))
+        self.assertIn('django_session', sql)
+        self.assertIn('WHERE "auth_user"."id" =', sql)
+
+    def test_sessions_from_before_the_cached_backend_stay_logged_in(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertContains(self.client.get(reverse('user_profile')), "old@example.com")
+
+    def test_registration_logs_in_with_the_cached_backend(self):
+        self.client.post(reverse('register'), {
+            'username': 'newcomer', 'email': 'new@example.com',
+            'password1': 'Str0ng-pass-123', 'password2': 'Str0ng-pass-123',
+        })
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], 'polls.users.CachedModelBackend')
+
+    def test_edit_profile_refreshes_cached_user(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('user_profile')), "old@example.com")
+        self.client.post(reverse('edit_profile'), {'username': 'cached', 'email': 'new@example.com'})
+        response = self.client.get(reverse('user_profile'))
+        self.assertContains(response, "new@example.com")
+        self.assertNotContains(response, "old@example.com")
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('user_profile')).status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password("changed12345")
+        user.save()
+        response = self.client.get(reverse('user_profile'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response['Location'])
+
+    def test_deleted_user_is_logged_out(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('user_profile'))
+        self.user.delete()
+        self.assertEqual(self.client.get(reverse('user_profile')).status_code, 302)
+
+    async def test_async_lookup_uses_the_cache(self):
+        backend = users.CachedModelBackend()
+        user = await backend.aget_user(self.user.pk)
+        self.assertEqual(user.email, "old@example.com")
+        await User.objects.filter(pk=self.user.pk).aupdate(email="bypassed@example.com")
+        self.assertEqual((await backend.aget_user(self.user.pk)).email, "old@example.com")
+        await sync_to_async(users.invalidate)(self.user.pk)
+        self.assertEqual((await backend.aget_user(self.user.pk)).email, "bypassed@example.com")
+
+    def test_measure_view_queries_command(self):
+        out = StringIO()
+        call_command('measure_view_queries', '--repeat', '1', stdout=out)
+        output = out.getvalue()
+        self.assertIn('before', output)
+        self.assertIn('signed_cookies', output)
+        self.assertIn('poll_results', output)
+        with self.assertRaises(CommandError):
+            call_command('measure_view_queries', '--modes', 'redis', stdout=StringIO())
+
+
+@override_settings(POLLS_PAGE_CACHE_ENABLED=True)
+class AnonymousPageCacheTest(TestCase):
+    """Full-page caching of poll_list and poll_results for visitors without a session."""
+
+    def setUp(self):
+        cache.clear()
+        metadata.clear_local()
+        self.owner = User.objects.create_user(username="page-owner", password="pass12345")
+        self.poll = Poll.objects.create(question="Page cached?", description="d", created_by=self.owner)
+        self.yes = Option.objects.create(poll=self.poll, text="Yes")
+        self.no = Option.objects.create(poll=self.poll, text="No")
+        self.list_url = reverse('poll_list')
+        self.results_url = reverse('poll_results', args=[self.poll.id])
+
+    def test_repeat_requests_are_served_without_queries(self):
+        for url in (self.list_url, self.results_url):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first['X-Page-Cache'], 'miss')
+                with CaptureQueriesContext(connection) as ctx:
+                    second = self.client.get(url)
+                self.assertEqual(second['X-Page-Cache'], 'hit')
+                self.assertEqual(len(ctx.captured_queries), 0)
+                self.assertEqual(second.content, first.content)
+                self.assertContains(second, "Page cached?")
+                self.assertIn('public', second['Cache-Control'])
+                self.assertIn('s-maxage=10', second['Cache-Control'])
+                self.assertIn('Accept-Encoding', second['Vary'])
+                self.assertIn('Cookie', second['Vary'])
+
+    def test_hits_do_not_replay_diagnostic_headers(self):
+        self.client.get(self.results_url)
+        response = self.client.get(self.results_url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertFalse(response.has_header('X-Results-Cache'))
+
+    def test_query_string_is_normalized(self):
+        self.client.get(self.list_url + '?cursor=&category=technology')
+        response = self.client.get(self.list_url + '?category=technology&cursor=')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        response = self.client.get(self.list_url + '?category=technology&utm_source=mail')
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_gzip_variant_and_revalidation(self):
+        self.client.get(self.results_url)
+        response = self.client.get(self.results_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertIn("Page cached?", gzip.decompress(response.content).decode())
+        response = self.client.get(self.results_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_sessions_and_messages_bypass_the_cache(self):
+        self.client.get(self.list_url)
+        self.client.force_login(self.owner)
+        response = self.client.get(self.list_url)
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertContains(response, "page-owner")
+        visitor = Client()
+        visitor.cookies['messages'] = 'pending'
+        self.assertFalse(visitor.get(self.list_url).has_header('X-Page-Cache'))
+
+    def test_votes_and_poll_changes_invalidate(self):
+        self.client.get(self.results_url)
+        self.client.get(self.list_url)
+        voter = Client()
+        voter.force_login(User.objects.create_user(username="page-voter", password="pass12345"))
+        with self.captureOnCommitCallbacks(execute=True):
+            voter.post(reverse('vote', args=[self.poll.id]), {'option': self.yes.id})
+        response = self.client.get(self.results_url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertEqual(response.context['total_votes'], 1)
+        Poll.objects.create(question="Brand new?", description="d", created_by=self.owner)
+        self.assertContains(self.client.get(self.list_url), "Brand new?")
+        voter.force_login(self.owner)
+        voter.post(reverse('deactivate_poll', args=[self.poll.id]))
+        self.assertNotContains(self.client.get(self.list_url), "Page cached?")
+
+    def test_bulk_writes_retire_listings_explicitly(self):
+        self.client.get(self.list_url)
+        Poll.objects.bulk_create([Poll(question="Bulk imported?", description="d")])
+        self.assertNotContains(self.client.get(self.list_url), "Bulk imported?")
+        pagecache.invalidate_listings()
+        self.assertContains(self.client.get(self.list_url), "Bulk imported?")
+
+    def test_disabled_cache_leaves_responses_alone(self):
+        with override_settings(POLLS_PAGE_CACHE_ENABLED=False):
+            response = self.client.get(self.list_url)
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.assertFalse(response.has_header('Cache-Control'))
+
+    async def test_async_requests_share_the_cache(self):
+        first = await self.async_client.get(self.list_url)
+        second = await self.async_client.get(self.list_url)
+        self.assertEqual([first['X-Page-Cache'], second['X-Page-Cache']], ['miss', 'hit'])
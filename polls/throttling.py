@@ -0,0 +1,230 @@
+"""
+Token-bucket throttling for the write endpoints.
+
+``@throttle(scope)`` checks the buckets POLLS_THROTTLE_RATES configures for
+the scope before the view runs. Buckets are keyed by client address, poll
+(the view's ``id`` argument) and user. A scope with only an address bucket
+sheds a flood before the session is even loaded. Poll and user buckets only
+count authenticated requests, so anonymous POSTs that login_required turns
+away can't drain them. A request takes a token from every bucket or, if any
+is empty, from none; it then gets a 429 with Retry-After and is counted in
+polls.metrics. Other methods are never throttled.
+
+Rates are ``'N/period'`` (period s, m, h or d): bursts of up to N requests,
+refilled evenly over the period. LocalStore keeps buckets in process
+memory, so each worker enforces the limit separately. CacheStore shares
+them through the cache backend; it reads and writes without a lock, so
+requests racing for the last token may both get it. Stores implement
+take(buckets, now), and atake() for async views.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+from .metrics import registry
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# Checked in this order; only the address is known before the session is loaded
+KEYS = ('ip', 'poll', 'user')
+
+
+def parse_rate(rate):
+    """``'30/m'`` -> ``(30, 60)``: bucket capacity and seconds to refill it."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period[:1]]
+
+
+def _take(tokens, updated, capacity, period, now):
+    # Returns (tokens left, seconds to wait); a wait of 0 means allowed
+    tokens = min(capacity, tokens + (now - updated) * capacity / period)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) * period / capacity
+
+
+def _plan(buckets, states, now):
+    # (first empty key, its wait, new states); nothing is taken unless every bucket has a token
+    updates = {}
+    for key, capacity, period in buckets:
+        tokens, updated = states.get(key, (capacity, now))
+        tokens, wait = _take(tokens, updated, capacity, period, now)
+        if wait:
+            return key, wait, {}
+        updates[key] = (tokens, now)
+    return None, 0, updates
+
+
+class LocalStore:
+    """Buckets in process memory; the least recently used are dropped beyond ``max_keys``."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets, now):
+        """
+        Take a token from each ``(key, capacity, period)`` bucket, or from none
+        if one is empty. Returns ``(key, seconds to wait)`` for the first empty
+        bucket, or ``(None, 0)``.
+        """
+        with self._lock:
+            key, wait, updates = _plan(buckets, self._buckets, now)
+            for key_, state in updates.items():
+                self._buckets.pop(key_, None)
+                self._buckets[key_] = state
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return key, wait
+
+    async def atake(self, buckets, now):
+        return self.take(buckets, now)
+
+
+class CacheStore:
+    """Buckets in the Django cache, shared by every process using the same backend."""
+
+    prefix = 'polls:throttle:'
+
+    def _plan(self, buckets, found, now):
+        states = {key[len(self.prefix):]: state for key, state in found.items()}
+        key, wait, updates = _plan(buckets, states, now)
+        # An idle bucket is full again after one period, so it can expire then
+        timeout = max(period for _, _, period in buckets)
+        return key, wait, {self.prefix + key_: state for key_, state in updates.items()}, timeout
+
+    def take(self, buckets, now):
+        found = cache.get_many([self.prefix + key for key, _, _ in buckets])
+        key, wait, updates, timeout = self._plan(buckets, found, now)
+        if updates:
+            cache.set_many(updates, timeout)
+        return key, wait
+
+    async def atake(self, buckets, now):
+        found = await cache.aget_many([self.prefix + key for key, _, _ in buckets])
+        key, wait, updates, timeout = self._plan(buckets, found, now)
+        if updates:
+            await cache.aset_many(updates, timeout)
+        return key, wait
+
+
+_stores = {}
+
+
+def get_store():
+    path = getattr(settings, 'POLLS_THROTTLE_STORE', 'polls.throttling.LocalStore')
+    store = _stores.get(path)
+    if store is None:
+        store = _stores.setdefault(path, import_string(path)())
+    return store
+
+
+def reset():
+    """Forget every bucket held in process memory."""
+    _stores.clear()
+
+
+def client_ip(request):
+    header = getattr(settings, 'POLLS_THROTTLE_IP_HEADER', None)
+    if header and request.META.get(header):
+        # Each proxy appends the address it was reached from, so only entries
+        # counted from the right are trustworthy; the client writes the left
+        addresses = [part.strip() for part in request.META[header].split(',')]
+        proxies = getattr(settings, 'POLLS_THROTTLE_TRUSTED_PROXIES', 1)
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _buckets(scope, rates, request, kwargs, user):
+    # [(bucket kind, store key, capacity, period)]; user is only touched if
+    # the scope has poll or user buckets
+    buckets = []
+    for kind in KEYS:
+        if kind not in rates:
+            continue
+        if kind == 'ip':
+            identity = client_ip(request)
+        elif not user.is_authenticated:
+            continue
+        elif kind == 'poll':
+            identity = kwargs.get('id')
+        else:
+            identity = user.pk
+        if identity is None:
+            continue
+        capacity, period = parse_rate(rates[kind])
+        buckets.append((kind, f'{scope}:{kind}:{identity}', capacity, period))
+    return buckets
+
+
+def _rejected(scope, buckets, key, wait):
+    if wait:
+        kind = next(kind for kind, key_, _, _ in buckets if key_ == key)
+        registry.count_throttled(scope, kind)
+    return wait
+
+
+def check(scope, request, kwargs):
+    """Take a token from each of the scope's buckets, or none if one is empty. Returns 0, or seconds to wait."""
+    rates = getattr(settings, 'POLLS_THROTTLE_RATES', {}).get(scope, {})
+    buckets = _buckets(scope, rates, request, kwargs, getattr(request, 'user', None))
+    if not buckets:
+        return 0
+    key, wait = get_store().take([bucket[1:] for bucket in buckets], time.time())
+    return _rejected(scope, buckets, key, wait)
+
+
+async def acheck(scope, request, kwargs):
+    """Async check(); the user is only loaded if the scope has poll or user buckets."""
+    rates = getattr(settings, 'POLLS_THROTTLE_RATES', {}).get(scope, {})
+    user = await request.auser() if {'poll', 'user'} & set(rates) else None
+    buckets = _buckets(scope, rates, request, kwargs, user)
+    if not buckets:
+        return 0
+    key, wait = await get_store().atake([bucket[1:] for bucket in buckets], time.time())
+    return _rejected(scope, buckets, key, wait)
+
+
+def _too_many(wait):
+    response = HttpResponse(
+        'Too many requests. Please try again shortly.',
+        status=429, content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def _enabled(request):
+    return request.method == 'POST' and getattr(settings, 'POLLS_THROTTLE_ENABLED', False)
+
+
+def throttle(scope):
+    """Reject POSTs over the scope's POLLS_THROTTLE_RATES with 429 before the view runs."""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if _enabled(request):
+                    wait = await acheck(scope, request, kwargs)
+                    if wait:
+                        return _too_many(wait)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if _enabled(request):
+                wait = check(scope, request, kwargs)
+                if wait:
+                    return _too_many(wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
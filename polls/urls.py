@@ -1,14 +1,25 @@
+from django.conf import settings
 from django.contrib.auth import views as auth_views
 from django.urls import path
 
-from . import views
+from . import async_views, views
+
+# Views with native async versions, used when served through asgi.py
+hot = async_views if getattr(settings, 'POLLS_ASYNC_VIEWS', False) else views
 
 urlpatterns = [
     path('', views.home, name='home'),
-    path('polls/', views.poll_list, name='poll_list'),
-    path('poll/<int:id>/', views.poll_detail, name='poll_detail'),
-    path('poll/<int:id>/vote/', views.vote, name='vote'),
-    path('poll/<int:id>/results/', views.poll_results, name='poll_results'),
+    path('polls/', hot.poll_list, name='poll_list'),
+    path('polls/more/', hot.poll_list, {'fragment': True}, name='poll_list_more'),
+    path('polls/search/', views.poll_search, name='poll_search'),
+    path('polls/search/more/', views.poll_search, {'fragment': True}, name='poll_search_more'),
+    path('poll/<int:id>/', hot.poll_detail, name='poll_detail'),
+    path('poll/<int:id>/vote/', hot.vote, name='vote'),
+    path('poll/<int:id>/results/', hot.poll_results, name='poll_results'),
+    path('poll/<int:id>/results.json', views.poll_results_json, name='poll_results_json'),
+    path('poll/<int:id>/results/stream/', views.poll_results_stream, name='poll_results_stream'),
+    path('poll/<int:id>/results/timeline/', views.poll_timeline, name='poll_timeline'),
+    path('poll/<int:id>/results/timeline.json', views.poll_timeline_json, name='poll_timeline_json'),
 
     # Auth
     path('register/', views.register, name='register'),
@@ -19,12 +30,18 @@ urlpatterns = [
     path('poll/create/', views.create_poll, name='create_poll'),
     path('poll/<int:id>/deactivate/', views.deactivate_poll, name='deactivate_poll'),
     path('poll/<int:id>/delete/', views.delete_poll, name='delete_poll'),
+    path('poll/<int:id>/export/', views.export_poll, name='export_poll'),
     path('my-polls/', views.my_polls, name='my_polls'),
+    path('my-polls/more/', views.my_polls, {'fragment': True}, name='my_polls_more'),
 
     # Vote history
     path('history/', views.vote_history, name='vote_history'),
+    path('history/more/', views.vote_history, {'fragment': True}, name='vote_history_more'),
 
     # User profile
     path('profile/', views.user_profile, name='user_profile'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
+
+    # Monitoring
+    path('metrics/', views.metrics, name='metrics'),
 ]
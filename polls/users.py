@@ -0,0 +1,72 @@
+"""
+Short-lived cache of the User objects that authenticate requests.
+
+AuthenticationMiddleware resolves ``request.user`` from the user id in the
+session through the authentication backend, which costs an auth_user read on
+every authenticated request. CachedModelBackend, the first entry of
+AUTHENTICATION_BACKENDS, keeps the user in the cache backend for
+POLLS_USER_CACHE_TTL seconds instead; 0 turns the cache off.
+
+Saving or deleting a user through the ORM drops the entry (polls.signals):
+edit_profile, set_password() followed by save(), the admin, and the
+last_login update on login. The session hash Django checks on each request
+is derived from the cached password, so a password change still ends the
+user's other sessions on their next request. Queryset update()s of users
+bypass signals; the TTL bounds how long those go unseen.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+UserModel = get_user_model()
+
+
+def _key(user_id):
+    return f'polls:user:{user_id}'
+
+
+def _ttl():
+    return getattr(settings, 'POLLS_USER_CACHE_TTL', 60)
+
+
+def invalidate(user_id):
+    """Drop a cached user, now and again when the transaction commits."""
+    # The second delete stops a request that loaded the pre-commit row in
+    # between from caching it for a full TTL
+    key = _key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user() reads through the cache."""
+
+    def get_user(self, user_id):
+        ttl = _ttl()
+        if not ttl:
+            return super().get_user(user_id)
+        key = _key(user_id)
+        user = cache.get(key)
+        if user is None:
+            try:
+                user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, user, ttl)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        ttl = _ttl()
+        if not ttl:
+            return await super().aget_user(user_id)
+        key = _key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            try:
+                user = await UserModel._default_manager.aget(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            await cache.aset(key, user, ttl)
+        return user if self.user_can_authenticate(user) else None
@@ -1,13 +1,61 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
 from django.db import IntegrityError, transaction
-from django.db.models import F
-from django.http import HttpResponseForbidden
+from django.db.models import Max
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
+from . import analytics, bloom, counters, exports, ingest, metadata, results_cache, rollups, search, streams, voted
 from .forms import PollCreationForm, RegistrationForm, UserProfileForm
-from .models import Option, Poll, Vote
+from .metrics import registry as metrics_registry
+from .models import Option, PendingVote, Poll, Vote
+from .pagination import paginate
+from .replicas import pins_primary, read_from_replica
+from .throttling import throttle
+
+
+def _user_vote(user, poll):
+    # Authoritative lookup for the rare paths that hit an existing vote;
+    # votes still waiting in the ingestion queue count as cast
+    user_vote = Vote.objects.filter(user=user, poll=poll).select_related('option').first()
+    if user_vote is None and ingest.enabled():
+        user_vote = PendingVote.objects.filter(user=user, poll=poll).select_related('option').first()
+    if user_vote is not None:
+        # The voted index missed it
+        voted.forget([user.pk])
+    return user_vote
+
+
+def _own_vote(user, poll, options):
+    # The voted index may miss votes cast or deleted elsewhere, so the form
+    # is decided by the Vote row; the option comes from those already loaded
+    if not user.is_authenticated:
+        return None
+    option_id = Vote.objects.filter(user=user, poll=poll).values_list('option_id', flat=True).first()
+    if option_id is None and ingest.enabled():
+        option_id = PendingVote.objects.filter(user=user, poll=poll).values_list('option_id', flat=True).first()
+    return _vote_for(poll, options, option_id)
+
+
+def _vote_for(poll, options, option_id):
+    for option in options:
+        if option.pk == option_id:
+            return Vote(poll=poll, option=option)
+    return None
 
 
 def home(request):
@@ -17,39 +65,81 @@ def home(request):
     return render(request, 'polls/home.html')
 
 
-def poll_list(request):
+def _next_page_urls(request, page, view_name, fragment_name):
+    # Full-page link for plain navigation, fragment link for infinite scroll
+    if not page.has_next:
+        return {}
+    params = request.GET.copy()
+    params['cursor'] = page.next_cursor
+    query = params.urlencode()
+    return {
+        'next_url': f'{reverse(view_name)}?{query}',
+        'more_url': f'{reverse(fragment_name)}?{query}',
+    }
+
+
+# Predefined categories for filter UI
+CATEGORIES = [
+    ('all', 'All'),
+    ('technology', 'Technology'),
+    ('education', 'Education'),
+    ('entertainment', 'Entertainment'),
+    ('college_life', 'College Life'),
+    ('sports', 'Sports'),
+]
+
+
+@read_from_replica
+def poll_list(request, fragment=False):
     # List polls, optionally filter by category
     category = request.GET.get('category')
     polls_qs = Poll.objects.filter(is_active=True)
     if category and category != 'all':
         polls_qs = polls_qs.filter(category=category)
-    polls = polls_qs.prefetch_related('options').select_related('created_by')
-    # Predefined categories for filter UI
-    categories = [
-        ('all', 'All'),
-        ('technology', 'Technology'),
-        ('education', 'Education'),
-        ('entertainment', 'Entertainment'),
-        ('college_life', 'College Life'),
-        ('sports', 'Sports'),
-    ]
+    # total_votes is a stored column, so no per-row aggregate is needed
+    page = paginate(polls_qs.select_related('created_by'), request.GET.get('cursor'))
+    context = {'polls': page, **_next_page_urls(request, page, 'poll_list', 'poll_list_more')}
+    if fragment:
+        return render(request, 'polls/poll_list_items.html', context)
+    return render(request, 'polls/poll_list.html', {
+        **context,
+        'categories': [(code, label, None) for code, label in CATEGORIES],
+        'selected_category': category or 'all',
+    })
+
+
+@read_from_replica
+def poll_search(request, fragment=False):
+    # Ranked full-text search over active polls, with per-category match counts
+    query = request.GET.get('q', '').strip()
+    if not search.terms(query):
+        return redirect('poll_list')
+    category = request.GET.get('category')
+    if category == 'all':
+        category = None
+    page = search.page(query, category, request.GET.get('cursor'))
+    context = {'polls': page, 'query': query, **_next_page_urls(request, page, 'poll_search', 'poll_search_more')}
+    if fragment:
+        return render(request, 'polls/poll_list_items.html', context)
+    counts = search.facets(query)
     return render(request, 'polls/poll_list.html', {
-        'polls': polls,
-        'categories': categories,
+        **context,
+        'categories': [
+            (code, label, sum(counts.values()) if code == 'all' else counts.get(code, 0))
+            for code, label in CATEGORIES
+        ],
         'selected_category': category or 'all',
     })
 
 
 def poll_detail(request, id):
-    poll = get_object_or_404(Poll, pk=id)
+    # Poll and options from the metadata cache; only the user's vote is per request
+    poll = metadata.get_poll_or_404(id)
     if not poll.is_active:
         return HttpResponseForbidden("This poll is not active.")
 
-    already_voted = False
-    user_vote = None
-    if request.user.is_authenticated:
-        user_vote = Vote.objects.filter(user=request.user, poll=poll).select_related('option').first()
-        already_voted = user_vote is not None
+    user_vote = _own_vote(request.user, poll, poll.options.all())
+    already_voted = user_vote is not None
 
     return render(request, 'polls/poll_detail.html', {
         'poll': poll,
@@ -58,12 +148,30 @@ def poll_detail(request, id):
     })
 
 
+def _record_vote(user, poll, option):
+    # One transaction for the row, its counters and rollup; the unique
+    # constraint raises IntegrityError on a second vote
+    with transaction.atomic():
+        # The cached is_active may be stale in this process
+        if not Poll.objects.filter(pk=poll.pk, is_active=True).exists():
+            raise Http404("No Poll matches the given query.")
+        new_vote = Vote.objects.create(user=user, poll=poll, option=option)
+        counters.increment(option)
+        rollups.add([(poll.pk, option.pk, new_vote.voted_at)])
+        transaction.on_commit(lambda: results_cache.bump(poll.pk))
+        transaction.on_commit(lambda: bloom.add(poll.pk, user.pk))
+
+
+@throttle('vote')
 @login_required
+@pins_primary
 def vote(request, id):
     if request.method != 'POST':
         return redirect('poll_detail', id=id)
 
-    poll = get_object_or_404(Poll, pk=id, is_active=True)
+    poll = metadata.get_poll_or_404(id)
+    if not poll.is_active:
+        raise Http404("No Poll matches the given query.")
 
     option_id = request.POST.get('option')
     if not option_id:
@@ -74,15 +182,50 @@ def vote(request, id):
             'error': 'Please select an option before submitting.',
         })
 
-    option = get_object_or_404(Option, pk=option_id, poll=poll)
+    option = next((o for o in poll.options.all() if str(o.pk) == option_id), None)
+    if option is None:
+        raise Http404("No Option matches the given query.")
+
+    if ingest.enabled():
+        outcome = ingest.enqueue(request.user, poll, option)
+        if outcome == ingest.BUSY:
+            response = render(request, 'polls/poll_detail.html', {
+                'poll': poll,
+                'already_voted': False,
+                'user_vote': None,
+                'error': 'Voting is busy right now. Please try again in a few seconds.',
+            }, status=503)
+            response['Retry-After'] = '5'
+            return response
+        if outcome == ingest.DUPLICATE:
+            return render(request, 'polls/poll_detail.html', {
+                'poll': poll,
+                'already_voted': True,
+                'user_vote': _user_vote(request.user, poll),
+            })
+        voted.forget([request.user.pk])
+        messages.info(request, 'Your vote has been received and will appear in the results shortly.')
+        return redirect('poll_results', id=id)
+
+    # Repeat submissions are answered by a read instead of a failed insert
+    # under the write lock; first votes skip the read unless the filter errs
+    if bloom.might_have_voted(poll.pk, request.user.pk):
+        user_vote = _user_vote(request.user, poll)
+        if user_vote is not None:
+            return render(request, 'polls/poll_detail.html', {
+                'poll': poll,
+                'already_voted': True,
+                'user_vote': user_vote,
+            })
+        bloom.count_false_positive()
 
     try:
-        with transaction.atomic():
-            Vote.objects.create(user=request.user, poll=poll, option=option)
-            Option.objects.filter(pk=option.pk).update(vote_count=F('vote_count') + 1)
+        _record_vote(request.user, poll, option)
     except IntegrityError:
-        # Race condition: user voted simultaneously from two tabs
-        user_vote = Vote.objects.filter(user=request.user, poll=poll).select_related('option').first()
+        # Two tabs at once, or a vote recorded by another process since this
+        # one built its filter
+        bloom.add(poll.pk, request.user.pk)
+        user_vote = _user_vote(request.user, poll)
         return render(request, 'polls/poll_detail.html', {
             'poll': poll,
             'already_voted': True,
@@ -92,27 +235,209 @@ def vote(request, id):
     return redirect('poll_results', id=id)
 
 
-def poll_results(request, id):
-    poll = get_object_or_404(Poll, pk=id)
-    total_votes = poll.total_votes()
+def _build_results(id):
+    # Shared, user-independent part of the results page
+    poll = metadata.get_poll_or_404(id)
+    options = list(poll.options.all())
+    # Texts come from the metadata cache; only the counts are read here
+    counts = dict(Option.objects.filter(poll_id=poll.pk).values_list('pk', 'vote_count'))
+    for option in options:
+        option.vote_count = counts.get(option.pk, 0)
+    # Fresh shard sums: the entry is reused until the next vote bumps the version
+    options = counters.load_counts(poll, options, fresh=True)
+    return _results_context(poll, options)
+
+
+def _results_context(poll, options):
+    # Total from the options already loaded, so percentages always add up
+    total_votes = sum(option.current_count for option in options)
     options_data = [
         {
             'option': option,
             'percentage': option.percentage(total_votes),
         }
-        for option in poll.options.all()
+        for option in options
     ]
-    user_vote = None
-    if request.user.is_authenticated:
-        user_vote = Vote.objects.filter(user=request.user, poll=poll).select_related('option').first()
-    return render(request, 'polls/poll_results.html', {
-        'poll': poll,
-        'options_data': options_data,
-        'total_votes': total_votes,
+    return {'poll': poll, 'options_data': options_data, 'total_votes': total_votes}
+
+
+@read_from_replica
+def poll_results(request, id):
+    # Shared part comes from the versioned cache; only the user's vote is live
+    results, hit = results_cache.get_results(id, lambda: _build_results(id))
+    options = [item['option'] for item in results['options_data']]
+    user_vote = _own_vote(request.user, results['poll'], options)
+    response = render(request, 'polls/poll_results.html', {
+        **results,
         'user_vote': user_vote,
+        'stream_results': getattr(settings, 'POLLS_STREAM_RESULTS', False),
     })
+    response['X-Results-Cache'] = 'hit' if hit else 'miss'
+    return response
+
+
+def _results_document(id):
+    return results_cache.get_document(id, lambda: json.dumps(_results_payload(id)).encode())
+
 
+def _results_etag(request, id):
+    return _results_document(id)[1]
 
+
+def _results_last_modified(request, id):
+    return results_cache.get_last_modified(
+        id, lambda: Vote.objects.filter(poll_id=id).aggregate(latest=Max('voted_at'))['latest']
+    )
+
+
+def _results_payload(id):
+    results, _ = results_cache.get_results(id, lambda: _build_results(id))
+    poll = results['poll']
+    return {
+        'id': poll.id,
+        'question': poll.question,
+        'is_active': poll.is_active,
+        'total_votes': results['total_votes'],
+        'options': [
+            {
+                'id': item['option'].id,
+                'text': item['option'].text,
+                'votes': item['option'].current_count,
+                'percentage': item['percentage'],
+            }
+            for item in results['options_data']
+        ],
+    }
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=_results_etag, last_modified_func=_results_last_modified)
+def poll_results_json(request, id):
+    # Both validators come from the cache, so a 304 costs no database queries
+    body, _ = _results_document(id)
+    return HttpResponse(body, content_type='application/json')
+
+
+async def _results_poll_frame(request, id):
+    # Under WSGI an endless stream would hold a worker for as long as the page
+    # stays open, so send the current results once and let EventSource
+    # reconnect after the retry delay
+    version = await sync_to_async(results_cache.get_version)(id)
+    frame = f'retry: {int(getattr(settings, "POLLS_STREAM_RETRY", 5) * 1000)}\n'
+    if request.headers.get('Last-Event-ID') != str(version):
+        payload = await sync_to_async(_results_payload)(id)
+        frame += f'id: {version}\ndata: {json.dumps(payload)}\n'
+    response = HttpResponse(frame + '\n', content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+async def poll_results_stream(request, id):
+    # Server-Sent Events; under ASGI an idle subscriber holds no thread
+    if not await Poll.objects.filter(pk=id).aexists():
+        raise Http404("No Poll matches the given query.")
+    if not isinstance(request, ASGIRequest):
+        return await _results_poll_frame(request, id)
+    hub = streams.get_hub(id, _results_payload)
+    keepalive = getattr(settings, 'POLLS_STREAM_KEEPALIVE', 15)
+
+    async def events():
+        queue = hub.subscribe()
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if frame is None:
+                    return
+                version, payload = frame
+                yield f'id: {version}\ndata: {json.dumps(payload)}\n\n'
+        finally:
+            hub.unsubscribe(queue)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _timeline(request, id):
+    # Reads only VoteRollup rows, never Vote; bad parameters raise ValueError
+    poll = get_object_or_404(Poll, pk=id)
+    granularity = request.GET.get('granularity', 'hour')
+    if granularity not in rollups.GRANULARITIES:
+        raise ValueError(granularity)
+    bounds = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        if value:
+            moment = parse_datetime(value)
+            if moment is None:
+                raise ValueError(value)
+            bounds[name] = timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+    return poll, list(poll.options.all()), rollups.timeline(poll, granularity, **bounds)
+
+
+def poll_timeline(request, id):
+    try:
+        poll, options, timeline = _timeline(request, id)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid timeline parameters.')
+    peak = max((bucket['total'] for bucket in timeline['buckets']), default=0)
+    rows = [
+        {
+            'start': bucket['start'],
+            'counts': [bucket['counts'].get(option.pk, 0) for option in options],
+            'total': bucket['total'],
+            'width': round(bucket['total'] / peak * 100, 1) if peak else 0,
+        }
+        for bucket in timeline['buckets']
+    ]
+    return render(request, 'polls/poll_timeline.html', {
+        'poll': poll,
+        'options': options,
+        'rows': rows,
+        'granularity': timeline['granularity'],
+        'granularities': rollups.GRANULARITIES,
+    })
+
+
+def poll_timeline_json(request, id):
+    try:
+        poll, options, timeline = _timeline(request, id)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid timeline parameters.'}, status=400)
+    return JsonResponse({
+        'poll': poll.pk,
+        'granularity': timeline['granularity'],
+        'since': timeline['since'].isoformat(),
+        'until': timeline['until'].isoformat(),
+        'options': [{'id': option.pk, 'text': option.text} for option in options],
+        'buckets': [
+            {
+                'start': bucket['start'].isoformat(),
+                'counts': {str(option_id): n for option_id, n in bucket['counts'].items()},
+                'total': bucket['total'],
+            }
+            for bucket in timeline['buckets']
+        ],
+    })
+
+
+def metrics(request):
+    # Prometheus scrape endpoint for polls.metrics
+    allowed = getattr(settings, 'POLLS_METRICS_ALLOWED_IPS', [])
+    if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden("Metrics are not available from this address.")
+    return HttpResponse(
+        metrics_registry.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@throttle('register')
 def register(request):
     if request.user.is_authenticated:
         return redirect('poll_list')
@@ -120,7 +445,8 @@ def register(request):
         form = RegistrationForm(request.POST)
         if form.is_valid():
             user = form.save()
-            login(request, user)
+            # Two backends are configured; new sessions use the cached one
+            login(request, user, backend='polls.users.CachedModelBackend')
             messages.success(request, f'Welcome, {user.username}! Your account has been created.')
             return redirect('poll_list')
     else:
@@ -128,7 +454,9 @@ def register(request):
     return render(request, 'polls/register.html', {'form': form})
 
 
+@throttle('create_poll')
 @login_required
+@pins_primary
 def create_poll(request):
     if request.method == 'POST':
         form = PollCreationForm(request.POST)
@@ -141,8 +469,7 @@ def create_poll(request):
                     poll = form.save(commit=False)
                     poll.created_by = request.user
                     poll.save()
-                    for text in option_texts:
-                        Option.objects.create(poll=poll, text=text)
+                    Option.objects.bulk_create([Option(poll=poll, text=text) for text in option_texts])
                 messages.success(request, 'Poll created successfully!')
                 return redirect('poll_detail', id=poll.id)
     else:
@@ -152,15 +479,43 @@ def create_poll(request):
 
 
 @login_required
-def my_polls(request):
-    # Retrieve all polls created by the current user
-    polls = Poll.objects.filter(created_by=request.user).prefetch_related('options').order_by('-created_at')
-    # Calculate total votes across all user's polls
-    total_votes = sum(poll.total_votes() for poll in polls)
-    return render(request, 'polls/my_polls.html', {'polls': polls, 'total_votes': total_votes})
+def export_poll(request, id):
+    poll = get_object_or_404(Poll, pk=id)
+    if poll.created_by_id != request.user.pk and not request.user.is_superuser:
+        return HttpResponseForbidden("You don't have permission to export this poll.")
+    fmt = request.GET.get('format', 'csv')
+    dataset = request.GET.get('data', 'votes')
+    if fmt not in exports.CONTENT_TYPES or dataset not in exports.DATASETS:
+        return HttpResponseBadRequest('Unsupported export format.')
+    compress = request.GET.get('gzip') == '1'
+    # Rows are streamed from a database iterator, never loaded as a whole
+    response = StreamingHttpResponse(
+        exports.stream(poll, dataset, fmt, compress),
+        content_type='application/gzip' if compress else f'{exports.CONTENT_TYPES[fmt]}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(poll, dataset, fmt, compress)}"'
+    return response
 
 
 @login_required
+def my_polls(request, fragment=False):
+    # Retrieve one page of polls created by the current user
+    own_polls = Poll.objects.filter(created_by=request.user)
+    page = paginate(own_polls, request.GET.get('cursor'))
+    context = {'polls': page, **_next_page_urls(request, page, 'my_polls', 'my_polls_more')}
+    if fragment:
+        return render(request, 'polls/my_polls_items.html', context)
+    # Dashboard figures for all the user's polls, in two queries however many there are
+    stats = analytics.creator_summary(request.user)
+    return render(request, 'polls/my_polls.html', {
+        **context,
+        'stats': stats,
+        'total_votes': stats['total_votes'],
+    })
+
+
+@login_required
+@pins_primary
 def deactivate_poll(request, id):
     if request.method != 'POST':
         return redirect('poll_detail', id=id)
@@ -169,35 +524,41 @@ def deactivate_poll(request, id):
         return HttpResponseForbidden("You don't have permission to modify this poll.")
     poll.is_active = not poll.is_active
     poll.save()
+    results_cache.bump(poll.pk)
     status = 'activated' if poll.is_active else 'deactivated'
     messages.success(request, f'Poll "{poll.question}" has been {status}.')
     return redirect('my_polls')
 
 
 @login_required
+@pins_primary
 def delete_poll(request, id):
     poll = get_object_or_404(Poll, pk=id)
     if poll.created_by != request.user and not request.user.is_superuser:
         return HttpResponseForbidden("You don't have permission to delete this poll.")
     if request.method == 'POST':
         title = poll.question
+        poll_id = poll.pk
         poll.delete()
+        results_cache.bump(poll_id)
         messages.success(request, f'Poll "{title}" has been deleted.')
         return redirect('my_polls')
     return render(request, 'polls/confirm_delete.html', {'poll': poll})
 
 
 @login_required
-def vote_history(request):
-    user_votes = (
-        Vote.objects.filter(user=request.user)
-        .select_related('poll', 'option')
-        .order_by('-voted_at')
-    )
-    return render(request, 'polls/vote_history.html', {'user_votes': user_votes})
+@read_from_replica
+def vote_history(request, fragment=False):
+    user_votes = Vote.objects.filter(user=request.user).select_related('poll', 'option')
+    page = paginate(user_votes, request.GET.get('cursor'), field='voted_at')
+    context = {'user_votes': page, **_next_page_urls(request, page, 'vote_history', 'vote_history_more')}
+    if fragment:
+        return render(request, 'polls/vote_history_rows.html', context)
+    return render(request, 'polls/vote_history.html', context)
 
 
 @login_required
+@read_from_replica
 def user_profile(request):
     """Display user profile information"""
     total_polls = Poll.objects.filter(created_by=request.user).count()
@@ -0,0 +1,135 @@
+"""
+Per-user index of the polls a user has voted in.
+
+The index maps poll id to the chosen option id and lives in the cache, one
+entry per user. It is loaded at most once per request (lazily, through
+``request.voted_polls``), so listings can badge the polls a user voted in
+without a query per poll.
+
+Entries are keyed by a per-user version, as in results_cache. A vote calls
+forget(), which bumps the version with an atomic incr instead of rewriting
+the entry, so two votes at once can't drop each other, and a load that read
+the rows before the vote committed is stored under a retired version.
+
+The index is only a hint for listings. A forget() in another process's
+cache, or a vote deleted without one, goes unseen until the entry expires
+after POLLS_VOTED_INDEX_TTL seconds, so the poll and results pages check the
+Vote rows, and vote() relies on the unique constraint.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from . import ingest, replicas
+from .models import PendingVote, Vote
+
+
+def _version_key(user_id):
+    return f'polls:voted-version:{user_id}'
+
+
+def _version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seeded from the clock so an evicted version never revives an old index
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def _aversion(user_id):
+    key = _version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _ttl():
+    return getattr(settings, 'POLLS_VOTED_INDEX_TTL', 3600)
+
+
+def load(user):
+    """Return the ``{poll_id: option_id}`` index for ``user`` (empty for anonymous users)."""
+    if not user.is_authenticated:
+        return {}
+    key = f'polls:voted:{user.pk}:{_version(user.pk)}'
+    index = cache.get(key)
+    if index is None:
+        # Cached for an hour, so never filled from a lagging replica
+        with replicas.primary():
+            index = dict(Vote.objects.filter(user=user).values_list('poll_id', 'option_id'))
+            if ingest.enabled():
+                # Queued votes count as cast
+                for poll_id, option_id in PendingVote.objects.filter(user=user).values_list('poll_id', 'option_id'):
+                    index.setdefault(poll_id, option_id)
+        cache.set(key, index, _ttl())
+    return index
+
+
+async def aload(user):
+    """Async load(), for views served under ASGI."""
+    if not user.is_authenticated:
+        return {}
+    key = f'polls:voted:{user.pk}:{await _aversion(user.pk)}'
+    index = await cache.aget(key)
+    if index is None:
+        with replicas.primary():
+            index = {poll_id: option_id async for poll_id, option_id in
+                     Vote.objects.filter(user=user).values_list('poll_id', 'option_id')}
+            if ingest.enabled():
+                async for poll_id, option_id in PendingVote.objects.filter(user=user).values_list('poll_id', 'option_id'):
+                    index.setdefault(poll_id, option_id)
+        await cache.aset(key, index, _ttl())
+    return index
+
+
+def _bump(user_id):
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def forget(user_ids):
+    """Retire cached indexes, e.g. after the users voted or votes were written in bulk."""
+    for user_id in user_ids:
+        _bump(user_id)
+
+
+async def aforget(user_ids):
+    for user_id in user_ids:
+        try:
+            await cache.aincr(_version_key(user_id))
+        except ValueError:
+            await cache.aset(_version_key(user_id), time.time_ns(), None)
+
+
+class VotedPollsMiddleware:
+    """
+    Attach the lazily loaded index as ``request.voted_polls``. Async views
+    can't load it lazily (the load may query), so the async listing replaces
+    it with the result of aload() before rendering.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.voted_polls = SimpleLazyObject(lambda: load(request.user))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.voted_polls = SimpleLazyObject(lambda: load(request.user))
+        return await self.get_response(request)